@@ -1,13 +1,20 @@
-from flask import Flask, request, jsonify, g, send_from_directory
+from flask import Flask, request, jsonify, g, Response, stream_with_context
 from flask_migrate import Migrate
 from flask_cors import CORS
 from app.config import Config
-from app.models import db, Tenant, UserProfile, LabResult
-from app.auth import cognito_required, verify_jwt
-from app.s3client import upload_bytes
-from app.usage import incr_results_processed, incr_api_calls
-from app.provisioner import provision_tenant
+from app.models import db, Tenant, UserProfile, LabResult, Upload
+from app.auth import cognito_required, get_request_claims
+from app.s3client import upload_stream, new_upload_key
+from app.results import index_analytes
+from app.usage import incr_results_processed, incr_api_calls, incr_storage_bytes, usage_aggregator
+from app.provisioning_jobs import provisioning_queue, job_to_dict
+from app.tenant_cache import tenant_cache
+from app.metrics import init_metrics
+from app.query_inspector import query_inspector
+from app.response_cache import response_cache
+from app.static_assets import static_assets
 from datetime import datetime, date
+from urllib.parse import quote
 import time
 import logging
 import os
@@ -27,20 +34,39 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 migrate = Migrate(app, db)
 
+# Contadores de uso write-behind (flush periódico y al terminar el worker)
+usage_aggregator.init_app(app)
+
+# Aprovisionamiento de tenants en un pool de hilos (no bloquea los requests)
+provisioning_queue.init_app(app)
+
+# Caché de tenants (evita un SELECT por escritura de resultados)
+tenant_cache.init_app(app)
+
+# Latencias, consultas por request y llamadas AWS en /metrics (antes de los demás hooks)
+init_metrics(app)
+
+# N+1 y consultas lentas por request (opt-in con QUERY_INSPECTOR=true)
+query_inspector.init_app(app)
+
+# Respuestas de los GET del dashboard con ETag (se invalidan con tenants y uso)
+response_cache.init_app(app)
+
+# Frontend comprimido y con hash en los nombres, en memoria desde el arranque
+static_assets.init_app(app)
+
 @app.before_request
 def attach_tenant_from_header():
     """Extract tenant_id from header or JWT"""
     tenant_id = request.headers.get("X-Tenant-Id")
     if not tenant_id:
-        token = request.headers.get("Authorization")
-        if token:
-            try:
-                token_value = token.split(" ")[1] if " " in token else token
-                claims = verify_jwt(token_value)
+        try:
+            claims = get_request_claims()
+            if claims:
                 tenant_id = claims.get("custom:tenant_id") or claims.get("tenant_id")
-            except Exception as e:
-                logger.warning(f"Failed to extract tenant from JWT: {e}")
-                tenant_id = None
+        except Exception as e:
+            logger.warning(f"Failed to extract tenant from JWT: {e}")
+            tenant_id = None
     g.tenant_id = tenant_id
 
 # ========== HEALTH CHECK ==========
@@ -109,14 +135,21 @@ def register_tenant():
         result = create_new_tenant_with_user(data)
         
         if result.get('success'):
-            return jsonify({
+            response = {
                 "success": True,
-                "message": "Registration successful!",
+                "message": "Registration accepted!",
                 "tenant_id": result['tenant_id'],
                 "email": result['email'],
-                "temp_password": result.get('temp_password', 'Generated'),
+                "provisioning_status": result.get('provisioning_status'),
+                "status_url": f"/api/public/register/{result['tenant_id']}/status",
                 "note": "First login requires password change"
-            }), 201
+            }
+            # Sin temp_password la contraseña temporal la envía Cognito por correo
+            if result.get('temp_password'):
+                response["temp_password"] = result['temp_password']
+            else:
+                response["note"] = "Temporary password sent by email; first login requires password change"
+            return jsonify(response), 202
         else:
             return jsonify({
                 "success": False,
@@ -130,7 +163,21 @@ def register_tenant():
             "message": f"Server error: {str(e)}"
         }), 500
 
+@app.route("/api/public/register/<tenant_id>/status", methods=["GET"])
+def get_registration_status(tenant_id):
+    """Status of the account setup started by /api/public/register"""
+    from app.models import ProvisioningJob
+    try:
+        job = ProvisioningJob.query.filter_by(tenant_id=tenant_id, kind="registration").first()
+        if not job:
+            return jsonify({"message": "Registration not found"}), 404
+        return jsonify({"tenant_id": tenant_id, "status": job.status})
+    except Exception as e:
+        logger.error(f"Failed to get registration status: {e}")
+        return jsonify({"message": f"Failed to get registration status: {str(e)}"}), 500
+
 @app.route("/api/public/subscription-tiers", methods=["GET"])
+@response_cache.cached("tiers", ttl=3600, public=True)
 def get_subscription_tiers():
     """Get available subscription tiers"""
     try:
@@ -144,6 +191,7 @@ def get_subscription_tiers():
 # ========== DASHBOARD ADMIN ENDPOINTS ==========
 @app.route("/api/v1/admin/billing", methods=["GET"])
 @cognito_required
+@response_cache.cached("tenant:{tenant_id}")
 def get_my_billing():
     """Get billing information for current tenant (admin view)"""
     try:
@@ -151,13 +199,11 @@ def get_my_billing():
         if not tenant_id:
             return jsonify({"message": "No tenant_id provided"}), 400
         
-        from app.billing import calculate_tenant_bill, get_monthly_usage_summary
+        from app.billing import get_billing_overview
         
         today = date.today()
         current_month = date(today.year, today.month, 1)
-        current_invoice = calculate_tenant_bill(tenant_id, current_month)
-        
-        usage_summary = get_monthly_usage_summary(tenant_id, today.year)
+        current_invoice, usage_summary = get_billing_overview(tenant_id, today.year, current_month)
         
         return jsonify({
             "tenant_id": tenant_id,
@@ -175,7 +221,7 @@ def get_my_billing():
 def list_invoices():
     """List all invoices for all tenants (admin only)"""
     try:
-        from app.billing import generate_invoice_for_all_tenants
+        from app.billing import get_stored_invoices
         
         month_str = request.args.get("month")
         if month_str:
@@ -184,7 +230,7 @@ def list_invoices():
             today = date.today()
             month_date = date(today.year, today.month, 1)
         
-        invoices = generate_invoice_for_all_tenants(month_date)
+        invoices = get_stored_invoices(month_date)
         
         return jsonify({
             "month": month_date.isoformat(),
@@ -196,24 +242,39 @@ def list_invoices():
         logger.error(f"Failed to list invoices: {e}")
         return jsonify({"message": f"Failed to list invoices: {str(e)}"}), 500
 
+def _month_range_args():
+    """Month range from ?from=YYYY-MM&to=YYYY-MM, or the whole ?year= (default current year)"""
+    from app.billing import parse_month, year_range
+    
+    start, end = request.args.get("from"), request.args.get("to")
+    if start or end:
+        if not (start and end):
+            raise ValueError("from and to must be given together (YYYY-MM)")
+        start_month, end_month = parse_month(start), parse_month(end)
+        if start_month > end_month:
+            raise ValueError("from must not be after to")
+        return start_month, end_month, None
+    year = request.args.get("year", date.today().year, type=int)
+    return (*year_range(year), year)
+
 @app.route("/admin/billing/tenants/<tenant_id>/invoices", methods=["GET"])
 def get_tenant_invoices(tenant_id):
     """Get all invoices for a specific tenant"""
     try:
-        from app.billing import calculate_tenant_bill
+        from app.billing import get_tenant_invoices as tenant_invoices
         
-        year = request.args.get("year", date.today().year, type=int)
-        invoices = []
+        try:
+            start_month, end_month, year = _month_range_args()
+        except ValueError as e:
+            return jsonify({"message": f"Invalid range: {str(e)}"}), 400
         
-        for month in range(1, 13):
-            month_date = date(year, month, 1)
-            invoice = calculate_tenant_bill(tenant_id, month_date)
-            if invoice:
-                invoices.append(invoice)
+        invoices = tenant_invoices(tenant_id, start_month, end_month)
         
         return jsonify({
             "tenant_id": tenant_id,
             "year": year,
+            "from": start_month.strftime("%Y-%m"),
+            "to": end_month.strftime("%Y-%m"),
             "invoices": invoices,
             "total_amount": sum(inv["total"] for inv in invoices)
         })
@@ -222,17 +283,24 @@ def get_tenant_invoices(tenant_id):
         return jsonify({"message": f"Failed to get tenant invoices: {str(e)}"}), 500
 
 @app.route("/admin/billing/tenants/<tenant_id>/usage", methods=["GET"])
+@response_cache.cached("tenant:{tenant_id}")
 def get_tenant_usage(tenant_id):
     """Get usage summary for a tenant"""
     try:
         from app.billing import get_monthly_usage_summary
         
-        year = request.args.get("year", date.today().year, type=int)
-        summary = get_monthly_usage_summary(tenant_id, year)
+        try:
+            start_month, end_month, year = _month_range_args()
+        except ValueError as e:
+            return jsonify({"message": f"Invalid range: {str(e)}"}), 400
+        
+        summary = get_monthly_usage_summary(tenant_id, start_month=start_month, end_month=end_month)
         
         return jsonify({
             "tenant_id": tenant_id,
             "year": year,
+            "from": start_month.strftime("%Y-%m"),
+            "to": end_month.strftime("%Y-%m"),
             "usage_summary": summary,
             "total_results": sum(item["results_processed"] for item in summary),
             "total_api_calls": sum(item["api_calls"] for item in summary)
@@ -264,32 +332,75 @@ def create_tenant():
             subscription_tier=subscription_tier
         )
         db.session.add(tenant)
+        # Borra el "no existe" que otros workers pudieran tener en caché
+        tenant_cache.notify(tenant_id)
         db.session.commit()
         
         logger.info(f"Created tenant {tenant_id} in database")
         
-        try:
-            provisioning_result = provision_tenant(tenant_id)
-            logger.info(f"Provisioned resources for tenant {tenant_id}")
-            
-            return jsonify({
-                "message": "Tenant created and provisioned successfully",
-                "tenant_id": tenant_id,
-                "provisioning": provisioning_result
-            }), 201
-        except Exception as e:
-            logger.error(f"Provisioning failed for {tenant_id}: {e}")
-            return jsonify({
-                "message": "Tenant created but provisioning failed",
-                "tenant_id": tenant_id,
-                "error": str(e)
-            }), 207
+        # Cognito, schema y API Gateway se crean en segundo plano
+        job = provisioning_queue.enqueue(tenant_id, "tenant")
+        
+        return jsonify({
+            "message": "Tenant created, provisioning queued",
+            "tenant_id": tenant_id,
+            "provisioning": job_to_dict(job),
+            "status_url": f"/admin/tenants/{tenant_id}/provisioning"
+        }), 202
             
     except Exception as e:
         logger.error(f"Failed to create tenant: {e}")
+        db.session.rollback()
         return jsonify({"message": f"Failed to create tenant: {str(e)}"}), 500
 
+@app.route("/admin/tenants/<tenant_id>/provisioning", methods=["GET"])
+def get_tenant_provisioning(tenant_id):
+    """Provisioning job status for a tenant (admin only)"""
+    from app.models import ProvisioningJob
+    from app.provisioner import provisioning_summary
+    try:
+        jobs = ProvisioningJob.query.filter_by(tenant_id=tenant_id).order_by(ProvisioningJob.id).all()
+        if not jobs:
+            return jsonify({"message": "No provisioning jobs for tenant"}), 404
+        
+        tenant_job = next((job for job in jobs if job.kind == "tenant"), None)
+        statuses = {job.status for job in jobs}
+        status = next(s for s in ("failed", "running", "queued", "done") if s in statuses)
+        
+        return jsonify({
+            "tenant_id": tenant_id,
+            "status": status,
+            "jobs": [job_to_dict(job) for job in jobs],
+            "provisioning": provisioning_summary(tenant_id, tenant_job.result or {}) if tenant_job and tenant_job.status == "done" else None
+        })
+        
+    except Exception as e:
+        logger.error(f"Failed to get provisioning status for {tenant_id}: {e}")
+        return jsonify({"message": f"Failed to get provisioning status: {str(e)}"}), 500
+
+@app.route("/admin/tenants/<tenant_id>/provisioning/retry", methods=["POST"])
+def retry_tenant_provisioning(tenant_id):
+    """Re-queue failed provisioning jobs; completed steps are not repeated (admin only)"""
+    from app.models import ProvisioningJob
+    try:
+        failed = ProvisioningJob.query.filter_by(tenant_id=tenant_id, status="failed").all()
+        if not failed:
+            return jsonify({"message": "No failed provisioning jobs for tenant"}), 409
+        
+        jobs = [provisioning_queue.enqueue(tenant_id, job.kind) for job in failed]
+        return jsonify({
+            "tenant_id": tenant_id,
+            "jobs": [job_to_dict(job) for job in jobs],
+            "status_url": f"/admin/tenants/{tenant_id}/provisioning"
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Failed to retry provisioning for {tenant_id}: {e}")
+        db.session.rollback()
+        return jsonify({"message": f"Failed to retry provisioning: {str(e)}"}), 500
+
 @app.route("/admin/tenants", methods=["GET"])
+@response_cache.cached("tenants")
 def list_tenants():
     """List all tenants (admin only)"""
     try:
@@ -328,6 +439,53 @@ def get_tenant(tenant_id):
         logger.error(f"Failed to get tenant: {e}")
         return jsonify({"message": f"Failed to get tenant: {str(e)}"}), 500
 
+@app.route("/admin/tenants/<tenant_id>", methods=["PATCH"])
+def update_tenant(tenant_id):
+    """Update company_name / subscription_tier (admin only)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        tenant = Tenant.query.filter_by(tenant_id=tenant_id).first()
+        if not tenant:
+            return jsonify({"message": "Tenant not found"}), 404
+        
+        for field in ("company_name", "subscription_tier"):
+            if field in data:
+                setattr(tenant, field, data[field])
+        tenant_cache.notify(tenant_id)
+        db.session.commit()
+        
+        return jsonify({
+            "tenant_id": tenant.tenant_id,
+            "company_name": tenant.company_name,
+            "subscription_tier": tenant.subscription_tier,
+            "created_at": tenant.created_at.isoformat() if tenant.created_at else None
+        })
+    except Exception as e:
+        logger.error(f"Failed to update tenant: {e}")
+        db.session.rollback()
+        return jsonify({"message": f"Failed to update tenant: {str(e)}"}), 500
+
+@app.route("/admin/cache/tenants", methods=["GET"])
+def tenant_cache_stats():
+    """Hit/miss counters of this worker's tenant cache (admin only)"""
+    return jsonify(tenant_cache.stats())
+
+@app.route("/admin/cache/responses", methods=["GET", "DELETE"])
+def response_cache_stats():
+    """Hit/miss counters of the response cache; DELETE drops every cached response (admin only)"""
+    if request.method == "DELETE":
+        response_cache.clear()
+        return jsonify({"message": "Response cache cleared"})
+    return jsonify(response_cache.stats())
+
+@app.route("/admin/queries", methods=["GET", "DELETE"])
+def query_inspector_summary():
+    """Per-endpoint query counts, N+1 suspects and recent slow queries of this worker (admin only)"""
+    if request.method == "DELETE":
+        query_inspector.reset()
+        return jsonify({"message": "Query inspector summary reset"})
+    return jsonify(query_inspector.summary())
+
 # ========== API ENDPOINTS (TENANT-SCOPED) ==========
 @app.route("/api/v1/results", methods=["POST"])
 @cognito_required
@@ -338,7 +496,7 @@ def create_result():
         if not tenant_id:
             return jsonify({"message": "No tenant_id provided"}), 400
         
-        tenant = Tenant.query.filter_by(tenant_id=tenant_id).first()
+        tenant = tenant_cache.get(tenant_id)
         if not tenant:
             return jsonify({"message": "Tenant not found"}), 404
         
@@ -357,6 +515,10 @@ def create_result():
             test_data=test_data
         )
         db.session.add(r)
+        db.session.flush()
+        # Valores numéricos al índice de búsqueda, en la misma transacción
+        index_analytes(tenant_id, [{"id": r.id, "patient_id": patient_id, "test_code": test_code,
+                                    "test_data": test_data, "created_at": r.created_at}])
         db.session.commit()
         
         incr_results_processed(tenant_id, 1)
@@ -374,38 +536,182 @@ def create_result():
         db.session.rollback()
         return jsonify({"message": f"Failed to create result: {str(e)}"}), 500
 
+@app.route("/api/v1/results:batch", methods=["POST"])
+@cognito_required
+def create_results_batch():
+    """Create many lab results in one call (JSON array or NDJSON body)"""
+    from app.results import (parse_batch_body, validate_result, bulk_insert_results,
+                             BatchError, RESULTS_BATCH_MAX)
+    try:
+        try:
+            body_tenant_id, items = parse_batch_body(request.get_data(), request.content_type)
+        except BatchError as e:
+            return jsonify({"message": str(e)}), 400
+        
+        tenant_id = g.tenant_id or body_tenant_id
+        if not tenant_id:
+            return jsonify({"message": "No tenant_id provided"}), 400
+        if not items:
+            return jsonify({"message": "No results provided"}), 400
+        if len(items) > RESULTS_BATCH_MAX:
+            return jsonify({"message": f"Batch too large (max {RESULTS_BATCH_MAX} results)"}), 413
+        
+        tenant = tenant_cache.get(tenant_id)
+        if not tenant:
+            return jsonify({"message": "Tenant not found"}), 404
+        
+        # Validar todo en una pasada; solo los válidos se insertan
+        rows, positions, errors = [], [], []
+        for index, item in enumerate(items):
+            row, error = validate_result(item)
+            if error:
+                errors.append({"index": index, "error": error})
+            else:
+                rows.append(row)
+                positions.append(index)
+        
+        ids = [None] * len(items)
+        if rows:
+            for index, result_id in zip(positions, bulk_insert_results(tenant_id, rows)):
+                ids[index] = result_id
+            db.session.commit()
+            incr_results_processed(tenant_id, len(rows))
+        incr_api_calls(tenant_id, 1)
+        
+        logger.info(f"Created {len(rows)} results for tenant {tenant_id} ({len(errors)} rejected)")
+        
+        status = 201 if not errors else (207 if rows else 400)
+        return jsonify({
+            "ids": ids,
+            "created": len(rows),
+            "errors": errors
+        }), status
+        
+    except Exception as e:
+        logger.error(f"Failed to create results batch: {e}")
+        db.session.rollback()
+        return jsonify({"message": f"Failed to create results: {str(e)}"}), 500
+
+@app.route("/api/v1/results/export", methods=["GET"])
+@cognito_required
+def export_results():
+    """Stream all lab results of the tenant as NDJSON or CSV"""
+    from app.results import (iter_export_rows, export_chunks, parse_since,
+                             InvalidQuery, EXPORT_FORMATS)
+    try:
+        tenant_id = g.tenant_id
+        if not tenant_id:
+            return jsonify({"message": "No tenant_id provided"}), 400
+        
+        fmt = request.args.get("format", "ndjson")
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({"message": f"format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+        try:
+            since = parse_since(request.args.get("since"))
+        except InvalidQuery as e:
+            return jsonify({"message": str(e)}), 400
+        
+        compress = request.accept_encodings["gzip"] > 0
+        incr_api_calls(tenant_id, 1)
+        logger.info(f"Exporting results for tenant {tenant_id} as {fmt} (gzip={compress})")
+        
+        body = export_chunks(iter_export_rows(tenant_id, since), fmt, compress=compress)
+        response = Response(stream_with_context(body), mimetype=EXPORT_FORMATS[fmt])
+        response.headers["Content-Disposition"] = f"attachment; filename={tenant_id}-results.{fmt}"
+        response.headers["Vary"] = "Accept-Encoding"
+        if compress:
+            response.headers["Content-Encoding"] = "gzip"
+        return response
+        
+    except Exception as e:
+        logger.error(f"Failed to export results: {e}")
+        return jsonify({"message": f"Failed to export results: {str(e)}"}), 500
+
+@app.route("/api/v1/results/search", methods=["GET"])
+@cognito_required
+def search_lab_results():
+    """Search a tenant's results by analyte value, test code, date range or test_data content"""
+    from app.results import search_results, parse_search_args, parse_fields, parse_limit, InvalidQuery, SEARCH_FIELDS
+    try:
+        tenant_id = g.tenant_id
+        if not tenant_id:
+            return jsonify({"message": "No tenant_id provided"}), 400
+        
+        try:
+            criteria = parse_search_args(request.args)
+            fields = parse_fields(request.args.get("fields"), SEARCH_FIELDS)
+            limit = parse_limit(request.args.get("limit", type=int))
+            out, next_cursor = search_results(tenant_id, criteria, fields=fields, limit=limit,
+                                              after=request.args.get("after"))
+        except InvalidQuery as e:
+            return jsonify({"message": str(e)}), 400
+        
+        incr_api_calls(tenant_id, 1)
+        
+        return jsonify({
+            "tenant_id": tenant_id,
+            "results": out,
+            "count": len(out),
+            "next_cursor": next_cursor
+        })
+        
+    except Exception as e:
+        logger.error(f"Failed to search results: {e}")
+        return jsonify({"message": f"Failed to search results: {str(e)}"}), 500
+
 @app.route("/api/v1/results/<patient_id>", methods=["GET"])
 @cognito_required
 def get_results(patient_id):
-    """Get lab results for a patient (tenant-scoped)"""
+    """Get lab results for a patient (tenant-scoped, keyset paginated)"""
+    from app.results import fetch_results_page, parse_fields, parse_limit, InvalidQuery
     try:
         tenant_id = g.tenant_id
         if not tenant_id:
             return jsonify({"message": "No tenant_id provided"}), 400
         
-        results = LabResult.query.filter_by(
-            tenant_id=tenant_id,
-            patient_id=patient_id
-        ).all()
-        
-        out = [
-            {
-                "id": r.id,
-                "test_code": r.test_code,
-                "test_data": r.test_data,
-                "created_at": r.created_at.isoformat() if r.created_at else None
-            }
-            for r in results
-        ]
+        # Los meses archivados en S3 se leen siempre, salvo include_archived=false
+        include_archived = request.args.get("include_archived", "true").lower() not in ("0", "false", "no")
+        try:
+            limit = parse_limit(request.args.get("limit", type=int))
+            fields = parse_fields(request.args.get("fields"))
+            if include_archived:
+                # Resultados ya movidos a S3 por app.archive: primero el archivo, luego la base
+                from app.archive import fetch_results_page_with_archive
+                out, next_cursor, archived = fetch_results_page_with_archive(
+                    tenant_id,
+                    patient_id,
+                    limit,
+                    after=request.args.get("after"),
+                    fields=fields,
+                    test_code=request.args.get("test_code")
+                )
+            else:
+                out, next_cursor = fetch_results_page(
+                    tenant_id,
+                    patient_id,
+                    limit=limit,
+                    after=request.args.get("after"),
+                    fields=fields,
+                    test_code=request.args.get("test_code")
+                )
+        except InvalidQuery as e:
+            return jsonify({"message": str(e)}), 400
         
         incr_api_calls(tenant_id, 1)
         
-        return jsonify({
+        body = {
             "tenant_id": tenant_id,
             "patient_id": patient_id,
             "results": out,
-            "count": len(out)
-        })
+            "count": len(out),
+            "next_cursor": next_cursor
+        }
+        if include_archived:
+            body["archived"] = archived
+            if archived is None:
+                # S3 no respondió: la página sólo trae lo que sigue en la base
+                body["archive_unavailable"] = True
+        return jsonify(body)
         
     except Exception as e:
         logger.error(f"Failed to get results: {e}")
@@ -414,52 +720,184 @@ def get_results(patient_id):
 @app.route("/api/v1/upload", methods=["POST"])
 @cognito_required
 def upload_file():
-    """Upload a file to S3 (tenant-scoped)"""
+    """Upload a file to S3 (tenant-scoped), streamed in parts"""
     try:
         tenant_id = g.tenant_id
         if not tenant_id:
             return jsonify({"message": "No tenant_id provided"}), 400
         
-        file_content = request.data or b""
-        if not file_content:
-            return jsonify({"message": "No file content provided"}), 400
+        filename = request.headers.get("X-File-Name")
+        content_type = request.mimetype
+        if content_type == "multipart/form-data":
+            # Formularios: Werkzeug guarda el archivo en disco temporal, no en memoria
+            upload = request.files.get("file")
+            if upload is None:
+                return jsonify({"message": "No file content provided"}), 400
+            stream, filename, content_type = upload.stream, upload.filename or filename, upload.mimetype
+        else:
+            stream = request.stream
         
         bucket = app.config.get('S3_BUCKET', 'tenant-lab-bucket')
-        key = f"{tenant_id}/uploads/{int(time.time())}.bin"
+        key = new_upload_key(tenant_id)
+        # Metadata de S3 solo admite ASCII
+        metadata = {"original-filename": quote(filename, safe="%._-")} if filename else None
         
-        upload_bytes(bucket, key, file_content)
+        result = upload_stream(bucket, key, stream, metadata=metadata,
+                               content_type=content_type or "application/octet-stream")
+        if result is None:
+            return jsonify({"message": "No file content provided"}), 400
+        
+        db.session.add(Upload(tenant_id=tenant_id, s3_key=key, size=result["size"], sha256=result["sha256"]))
+        db.session.commit()
+        incr_storage_bytes(tenant_id, result["size"])
         incr_api_calls(tenant_id, 1)
         
-        logger.info(f"Uploaded file for tenant {tenant_id}: s3://{bucket}/{key}")
+        logger.info(f"Uploaded {result['size']} bytes for tenant {tenant_id}: {result['s3_uri']} ({result['parts']} parts)")
         
         return jsonify({
             "message": "File uploaded successfully",
-            "s3_uri": f"s3://{bucket}/{key}",
-            "size": len(file_content)
+            "s3_uri": result["s3_uri"],
+            "size": result["size"],
+            "sha256": result["sha256"]
         }), 201
         
     except Exception as e:
         logger.error(f"Upload failed: {e}")
+        db.session.rollback()
         return jsonify({"message": f"Upload failed: {str(e)}"}), 500
 
+@app.route("/api/v1/uploads/presign", methods=["POST"])
+@cognito_required
+def presign_upload():
+    """Presigned URL(s) to upload a file straight to S3 (tenant-scoped key)"""
+    from app.s3client import presign_put, presign_multipart, PRESIGN_EXPIRES, PRESIGN_MULTIPART_THRESHOLD
+    try:
+        tenant_id = g.tenant_id
+        if not tenant_id:
+            return jsonify({"message": "No tenant_id provided"}), 400
+        
+        data = request.get_json(silent=True) or {}
+        content_type = data.get("content_type") or "application/octet-stream"
+        size = data.get("size")
+        if size is not None and (not isinstance(size, int) or size < 0):
+            return jsonify({"message": "size must be a non-negative integer"}), 400
+        
+        bucket = app.config.get('S3_BUCKET', 'tenant-lab-bucket')
+        key = new_upload_key(tenant_id)
+        out = {
+            "key": key,
+            "s3_uri": f"s3://{bucket}/{key}",
+            "expires_in": PRESIGN_EXPIRES,
+            "complete_url": "/api/v1/uploads/complete"
+        }
+        if size and size > PRESIGN_MULTIPART_THRESHOLD:
+            out.update(method="multipart", **presign_multipart(bucket, key, size, content_type))
+        else:
+            out.update(method="PUT", upload_url=presign_put(bucket, key, content_type), content_type=content_type)
+        
+        incr_api_calls(tenant_id, 1)
+        return jsonify(out), 201
+        
+    except Exception as e:
+        logger.error(f"Presign upload failed: {e}")
+        return jsonify({"message": f"Presign upload failed: {str(e)}"}), 500
+
+@app.route("/api/v1/uploads/complete", methods=["POST"])
+@cognito_required
+def complete_upload():
+    """Finish a presigned upload and record its size in usage (idempotent)"""
+    from app.s3client import complete_multipart, object_size
+    from sqlalchemy.exc import IntegrityError
+    try:
+        tenant_id = g.tenant_id
+        if not tenant_id:
+            return jsonify({"message": "No tenant_id provided"}), 400
+        
+        data = request.get_json(silent=True) or {}
+        key = data.get("key") or ""
+        if not key.startswith(f"{tenant_id}/uploads/"):
+            return jsonify({"message": "Key does not belong to this tenant"}), 403
+        
+        existing = Upload.query.filter_by(s3_key=key).first()
+        if existing:
+            return jsonify({"key": key, "size": existing.size, "message": "Upload already recorded"})
+        
+        bucket = app.config.get('S3_BUCKET', 'tenant-lab-bucket')
+        if data.get("upload_id"):
+            parts = data.get("parts") or []
+            if not parts:
+                return jsonify({"message": "parts required to complete a multipart upload"}), 400
+            complete_multipart(bucket, key, data["upload_id"], parts)
+        
+        size = object_size(bucket, key)
+        if size is None:
+            return jsonify({"message": "Object not found in S3"}), 404
+        
+        try:
+            db.session.add(Upload(tenant_id=tenant_id, s3_key=key, size=size, sha256=data.get("sha256")))
+            db.session.commit()
+        except IntegrityError:
+            # Otra llamada concurrente ya registró este objeto
+            db.session.rollback()
+            return jsonify({"key": key, "size": size, "message": "Upload already recorded"})
+        
+        incr_storage_bytes(tenant_id, size)
+        incr_api_calls(tenant_id, 1)
+        logger.info(f"Recorded presigned upload for tenant {tenant_id}: s3://{bucket}/{key} ({size} bytes)")
+        
+        return jsonify({
+            "key": key,
+            "s3_uri": f"s3://{bucket}/{key}",
+            "size": size,
+            "message": "Upload recorded"
+        }), 201
+        
+    except Exception as e:
+        logger.error(f"Complete upload failed: {e}")
+        db.session.rollback()
+        return jsonify({"message": f"Complete upload failed: {str(e)}"}), 500
+
+@app.route("/api/v1/downloads/presign", methods=["GET"])
+@cognito_required
+def presign_download():
+    """Presigned GET URL for one of the tenant's objects"""
+    from app.s3client import presign_get, PRESIGN_EXPIRES
+    try:
+        tenant_id = g.tenant_id
+        if not tenant_id:
+            return jsonify({"message": "No tenant_id provided"}), 400
+        
+        key = request.args.get("key") or ""
+        if not key.startswith(f"{tenant_id}/") or ".." in key.split("/"):
+            return jsonify({"message": "Key does not belong to this tenant"}), 403
+        
+        bucket = app.config.get('S3_BUCKET', 'tenant-lab-bucket')
+        url = presign_get(bucket, key, filename=request.args.get("filename"))
+        incr_api_calls(tenant_id, 1)
+        
+        return jsonify({"key": key, "download_url": url, "expires_in": PRESIGN_EXPIRES})
+        
+    except Exception as e:
+        logger.error(f"Presign download failed: {e}")
+        return jsonify({"message": f"Presign download failed: {str(e)}"}), 500
+
 # ========== FRONTEND ROUTES ==========
 @app.route("/")
 def serve_frontend():
     """Sirve el frontend (index.html)"""
-    try:
-        frontend_path = os.path.join(os.path.dirname(__file__), '..', 'frontend')
-        return send_from_directory(frontend_path, 'index.html')
-    except Exception as e:
+    response = static_assets.response("index.html")
+    if response is None:
         return jsonify({
             "message": "LabCloud Flask API - Frontend not available",
-            "error": str(e),
+            "error": f"index.html not found in {static_assets.source}",
             "version": "1.0.0"
         }), 500
+    return response
 
 # RUTA PARA ARCHIVOS ESTÁTICOS - EXCLUYENDO /api/ y /admin/
 @app.route("/<path:path>")
 def serve_static_files(path):
-    """Sirve archivos estáticos (CSS, JS, imágenes)"""
+    """Sirve archivos estáticos (CSS, JS, imágenes) desde memoria"""
     # Excluir rutas de API y admin
     if path.startswith('api/') or path.startswith('admin/'):
         return jsonify({
@@ -468,11 +906,10 @@ def serve_static_files(path):
             "message": "Check your URL or API endpoint"
         }), 404
     
-    try:
-        frontend_path = os.path.join(os.path.dirname(__file__), '..', 'frontend')
-        return send_from_directory(frontend_path, path)
-    except Exception as e:
-        return jsonify({"error": "File not found", "details": str(e)}), 404
+    response = static_assets.response(path)
+    if response is None:
+        return jsonify({"error": "File not found", "details": f"/{path}"}), 404
+    return response
 
 # Error handlers
 @app.errorhandler(404)
@@ -495,12 +932,22 @@ if __name__ == "__main__":
     print("🚀 Starting LabCloud Flask API...")
     print("📋 Available endpoints:")
     print("   - GET  /health")
+    print("   - GET  /metrics")
     print("   - GET/POST /api/public/register")
     print("   - GET  /api/public/subscription-tiers")
     print("   - POST /api/v1/results")
+    print("   - POST /api/v1/results:batch")
+    print("   - GET  /api/v1/results/export")
+    print("   - GET  /api/v1/results/search")
     print("   - GET  /api/v1/results/<patient_id>")
     print("   - POST /api/v1/upload")
+    print("   - POST /api/v1/uploads/presign")
+    print("   - POST /api/v1/uploads/complete")
+    print("   - GET  /api/v1/downloads/presign")
     print("   - GET  /api/v1/admin/billing")
     print("   - GET  /admin/tenants")
+    print("   - GET  /admin/tenants/<tenant_id>/provisioning")
+    print("   - GET  /admin/cache/responses")
+    print("   - GET  /admin/queries (QUERY_INSPECTOR=true)")
     print("\n🔍 Running on http://0.0.0.0:5000")
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
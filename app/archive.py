@@ -0,0 +1,412 @@
+# archive.py - archivo frío de lab_results en S3 (NDJSON gzip por tenant y mes, con manifiesto)
+import argparse
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from datetime import date, datetime
+from itertools import groupby
+from types import SimpleNamespace
+from sqlalchemy import column, delete, func, select, table
+from app.config import S3_BUCKET
+from app.models import db, JsonDocument, LabResult, ResultAnalyte, Tenant
+from app.results import (decode_cursor, encode_cursor, export_chunks, fetch_results_page,
+                         EXPORT_YIELD_PER, RESULT_FIELDS)
+from app import s3client
+from app.s3client import ChunkStream
+
+logger = logging.getLogger(__name__)
+
+# Los resultados más antiguos que esto (en meses completos) salen de la base y quedan en S3
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "12"))
+# Índices de mes (paciente -> rango de bytes) que se mantienen en memoria; las filas nunca
+ARCHIVE_CACHE_MONTHS = int(os.getenv("ARCHIVE_CACHE_MONTHS", "24"))
+# Segundos que se reutiliza un manifiesto leído de S3
+ARCHIVE_MANIFEST_TTL = int(os.getenv("ARCHIVE_MANIFEST_TTL", "300"))
+# Tras un error de S3 las lecturas no lo reintentan durante estos segundos (sirven sólo la base)
+ARCHIVE_RETRY_AFTER = int(os.getenv("ARCHIVE_RETRY_AFTER", "30"))
+
+MANIFEST_VERSION = 2
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+def archive_key(tenant_id, month):
+    return f"{tenant_id}/archive/lab_results/{month:%Y-%m}.ndjson.gz"
+
+def index_key(tenant_id, month):
+    return f"{tenant_id}/archive/lab_results/{month:%Y-%m}.index.json.gz"
+
+def manifest_key(tenant_id):
+    return f"{tenant_id}/archive/manifest.json"
+
+def _archive_order(row):
+    return (row.patient_id, row.created_at, row.id)
+
+def result_rows(table_name, tenant_id, start=None, end=None, yield_per=EXPORT_YIELD_PER):
+    """A tenant's rows of lab_results (or of a detached partition) by patient, oldest first"""
+    source = table(table_name, column("id"), column("tenant_id"), column("patient_id"), column("test_code"),
+                   column("created_at", db.DateTime), column("test_data", JsonDocument))
+    query = select(source.c.id, source.c.patient_id, source.c.test_code, source.c.created_at, source.c.test_data)
+    query = query.where(source.c.tenant_id == tenant_id)
+    if start:
+        query = query.where(source.c.created_at >= start)
+    if end:
+        query = query.where(source.c.created_at < end)
+    query = query.order_by(source.c.patient_id, source.c.created_at, source.c.id).execution_options(yield_per=yield_per)
+    return db.session.execute(query)
+
+def upload_archive(bucket, key, rows):
+    """Stream rows (ordered by patient_id, created_at, id) to s3://bucket/key as gzip NDJSON
+
+    Each patient is its own gzip member, so the file is still one valid .gz and a patient
+    can be read with a ranged GET. Returns upload_stream's result plus the row count and
+    the index {patient_id: [offset, length, rows, last_created_at, last_id]}.
+    """
+    index = {}
+    state = {"offset": 0, "rows": 0}
+
+    def members():
+        for patient_id, group in groupby(rows, key=lambda row: row.patient_id):
+            if patient_id in index:
+                raise ValueError(f"Archive rows for {key} are not ordered by patient_id")
+            group = list(group)  # un paciente en un mes
+            data = b"".join(export_chunks(group, "ndjson", compress=True))
+            last = group[-1]
+            index[patient_id] = [state["offset"], len(data), len(group),
+                                 last.created_at.isoformat() if last.created_at else None, last.id]
+            state["offset"] += len(data)
+            state["rows"] += len(group)
+            yield data
+
+    result = s3client.upload_stream(bucket, key, ChunkStream(members()), content_type="application/gzip")
+    return dict(result or {"s3_uri": f"s3://{bucket}/{key}", "size": 0}, rows=state["rows"], index=index)
+
+def iter_archive(stream):
+    """Rows of an archive file (or of one patient's member) read from a stream, created_at as datetime"""
+    for line in gzip.GzipFile(fileobj=stream, mode="rb"):
+        if line.strip():
+            row = json.loads(line)
+            row["created_at"] = datetime.fromisoformat(row["created_at"]) if row.get("created_at") else None
+            yield row
+
+def parse_archive(body):
+    """Rows of a whole archive file already in memory"""
+    return list(iter_archive(io.BytesIO(body)))
+
+class _HashingReader:
+    """read() passthrough that hashes and counts what goes through it"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        return data
+
+
+class ArchiveStore:
+    """Manifests and per-month patient indexes of the tenants' archives, cached in memory for reads
+
+    Rows are never cached: a read downloads only the patient's byte range of each month.
+    """
+
+    def __init__(self, max_months=ARCHIVE_CACHE_MONTHS, manifest_ttl=ARCHIVE_MANIFEST_TTL,
+                 retry_after=ARCHIVE_RETRY_AFTER):
+        self.max_months = max_months
+        self.manifest_ttl = manifest_ttl
+        self.retry_after = retry_after
+        self._manifests = {}
+        self._failures = {}
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load_manifest(self, tenant_id, bucket=None, cached=True):
+        """The tenant's manifest; an empty one if nothing has been archived yet"""
+        bucket = bucket or S3_BUCKET
+        now = time.monotonic()
+        with self._lock:
+            entry = self._manifests.get((bucket, tenant_id))
+        if cached and entry and entry[0] > now:
+            return entry[1]
+        if cached and self._failures.get((bucket, tenant_id), 0) > now:
+            raise RuntimeError(f"archive of {tenant_id} unavailable, retrying in {self.retry_after}s")
+        key = manifest_key(tenant_id)
+        try:
+            # Sólo "no existe" cuenta como vacío: un error de lectura no debe reescribir el manifiesto
+            if not s3client.object_exists(bucket, key):
+                manifest = {"version": MANIFEST_VERSION, "tenant_id": tenant_id, "months": {}}
+            else:
+                manifest = json.loads(s3client.read_bytes(bucket, key))
+        except Exception:
+            with self._lock:
+                self._failures[(bucket, tenant_id)] = now + self.retry_after
+            raise
+        with self._lock:
+            self._manifests[(bucket, tenant_id)] = (now + self.manifest_ttl, manifest)
+            self._failures.pop((bucket, tenant_id), None)
+        return manifest
+
+    def save_manifest(self, tenant_id, manifest, bucket=None):
+        bucket = bucket or S3_BUCKET
+        manifest["version"] = MANIFEST_VERSION
+        manifest["updated_at"] = datetime.utcnow().isoformat()
+        s3client.upload_bytes(bucket, manifest_key(tenant_id), json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+        with self._lock:
+            self._manifests[(bucket, tenant_id)] = (time.monotonic() + self.manifest_ttl, manifest)
+
+    def patient_index(self, bucket, entry):
+        """{patient_id: [offset, length, rows, last_created_at, last_id]} of one archived month"""
+        cache_key = (bucket, entry["index_key"], entry["sha256"])
+        with self._lock:
+            if cache_key in self._indexes:
+                self._indexes.move_to_end(cache_key)
+                return self._indexes[cache_key]
+        index = json.loads(gzip.decompress(s3client.read_bytes(bucket, entry["index_key"])))
+        with self._lock:
+            self._indexes[cache_key] = index
+            while len(self._indexes) > self.max_months:
+                self._indexes.popitem(last=False)
+        return index
+
+    def patient_rows(self, bucket, entry, patient_id, after=None):
+        """Stream one patient's rows of an archived month, oldest first; only their member is downloaded
+
+        after is a (created_at, id) position: a patient whose last row is not past it is skipped
+        without touching the month file.
+        """
+        if "index_key" not in entry:
+            # Mes de un manifiesto v1 (sin índice): se recorre el archivo en streaming
+            with closing(s3client.open_stream(bucket, entry["key"])) as body:
+                yield from (row for row in iter_archive(body) if row["patient_id"] == patient_id)
+            return
+        span = self.patient_index(bucket, entry).get(patient_id)
+        if span is None:
+            return
+        offset, length, _, last_created_at, last_id = span
+        if after and last_created_at and (datetime.fromisoformat(last_created_at), last_id) <= after:
+            return
+        with closing(s3client.open_stream(bucket, entry["key"], offset, length)) as body:
+            yield from iter_archive(body)
+
+    def clear(self):
+        with self._lock:
+            self._manifests.clear()
+            self._failures.clear()
+            self._indexes.clear()
+
+
+archive_store = ArchiveStore()
+
+def store_month(bucket, tenant_id, month, rows, expected):
+    """Write (or extend) a tenant's month file with rows, verify it and record it in the manifest
+
+    rows are result rows ordered by patient_id, created_at, id; expected is how many of them
+    there are. Rows already in the file (a re-run after a failed delete) are kept once. The
+    existing file is merged as a stream. Returns the manifest entry.
+    """
+    manifest = archive_store.load_manifest(tenant_id, bucket, cached=False)
+    name = f"{month:%Y-%m}"
+    key = archive_key(tenant_id, month)
+    previous = manifest["months"].get(name)
+    counts = {"new": 0, "duplicates": 0}
+
+    def new_rows():
+        for row in rows:
+            counts["new"] += 1
+            yield row
+
+    def merged(sources):
+        last_id = None
+        for row in heapq.merge(*sources, key=_archive_order):
+            # Mismo (paciente, fecha, id): la fila ya estaba en el archivo
+            if row.id == last_id:
+                counts["duplicates"] += 1
+                continue
+            last_id = row.id
+            yield row
+
+    if previous and "index_key" not in previous:
+        # Archivo v1, ordenado sólo por fecha: se reordena por paciente (una vez, en el job)
+        existing = sorted((SimpleNamespace(**row) for row in parse_archive(s3client.read_bytes(bucket, key))),
+                          key=_archive_order)
+        result = upload_archive(bucket, key, merged([iter(existing), new_rows()]))
+    elif previous:
+        with closing(s3client.open_stream(bucket, key)) as body:
+            existing = (SimpleNamespace(**row) for row in iter_archive(body))
+            result = upload_archive(bucket, key, merged([existing, new_rows()]))
+    else:
+        result = upload_archive(bucket, key, merged([new_rows()]))
+    total = (previous["rows"] if previous else 0) + expected - counts["duplicates"]
+    if counts["new"] != expected or result["rows"] != total:
+        raise RuntimeError(f"Archive {key} wrote {result['rows']} rows ({counts['new']} new), "
+                           f"expected {total} ({expected} new)")
+
+    # Se relee el objeto (en streaming): lo que se borra de la base tiene que estar en S3
+    stored = {"rows": 0, "first": None, "last": None, "max_id": 0}
+    with closing(s3client.open_stream(bucket, key)) as body:
+        reader = _HashingReader(body)
+        for row in iter_archive(reader):
+            stored["rows"] += 1
+            stored["max_id"] = max(stored["max_id"], row["id"])
+            if row["created_at"]:
+                stored["first"] = min(stored["first"] or row["created_at"], row["created_at"])
+                stored["last"] = max(stored["last"] or row["created_at"], row["created_at"])
+    if reader.size != result["size"] or stored["rows"] != total:
+        raise RuntimeError(f"Archive {key} read back {stored['rows']} rows / {reader.size} bytes, "
+                           f"expected {total} / {result['size']}")
+
+    s3client.upload_bytes(bucket, index_key(tenant_id, month),
+                          gzip.compress(json.dumps(result["index"], separators=(",", ":")).encode("utf-8")))
+    entry = {
+        "key": key,
+        "index_key": index_key(tenant_id, month),
+        "rows": total,
+        "patients": len(result["index"]),
+        "size": reader.size,
+        "sha256": reader.sha256.hexdigest(),
+        "first_created_at": stored["first"].isoformat() if stored["first"] else None,
+        "last_created_at": stored["last"].isoformat() if stored["last"] else None,
+        "max_id": stored["max_id"],
+        "archived_at": datetime.utcnow().isoformat()
+    }
+    manifest["months"][name] = entry
+    archive_store.save_manifest(tenant_id, manifest, bucket)
+    return entry
+
+def archive_tenant(tenant_id, months=ARCHIVE_AFTER_MONTHS, bucket=None, today=None):
+    """Move a tenant's results older than the last `months` whole months to S3, month by month
+
+    Each month is uploaded, read back and recorded in the manifest before its rows (and
+    their result_analytes) are deleted, so an interrupted run loses nothing and can be re-run.
+    """
+    bucket = bucket or S3_BUCKET
+    if months < 1:
+        raise ValueError("months must be at least 1")
+    cutoff = add_months((today or date.today()).replace(day=1), -months)
+    oldest = db.session.execute(
+        select(func.min(LabResult.created_at)).where(LabResult.tenant_id == tenant_id, LabResult.created_at < cutoff)
+    ).scalar()
+    archived = []
+    month = date(oldest.year, oldest.month, 1) if oldest else cutoff
+    while month < cutoff:
+        end = add_months(month, 1)
+        expected = db.session.execute(
+            select(func.count()).select_from(LabResult)
+            .where(LabResult.tenant_id == tenant_id, LabResult.created_at >= month, LabResult.created_at < end)
+        ).scalar()
+        if expected:
+            entry = store_month(bucket, tenant_id, month, result_rows("lab_results", tenant_id, month, end), expected)
+            # Sólo las filas que estaban al subir (max_id); las posteriores quedan para la próxima corrida
+            db.session.execute(delete(ResultAnalyte).where(
+                ResultAnalyte.tenant_id == tenant_id, ResultAnalyte.observed_at >= month,
+                ResultAnalyte.observed_at < end, ResultAnalyte.result_id <= entry["max_id"]))
+            deleted = db.session.execute(delete(LabResult).where(
+                LabResult.tenant_id == tenant_id, LabResult.created_at >= month,
+                LabResult.created_at < end, LabResult.id <= entry["max_id"])).rowcount
+            db.session.commit()
+            archived.append({"month": f"{month:%Y-%m}", "s3_uri": f"s3://{bucket}/{entry['key']}",
+                             "rows": entry["rows"], "deleted": deleted, "size": entry["size"]})
+            logger.info(f"Archived {deleted} results of {tenant_id} for {month:%Y-%m} to {entry['key']}")
+        month = end
+    return {"tenant_id": tenant_id, "before": cutoff.isoformat(), "months": archived}
+
+def archive_all(months=ARCHIVE_AFTER_MONTHS, bucket=None, today=None):
+    """Run archive_tenant for every tenant; one failing tenant does not stop the others"""
+    summaries = []
+    for tenant_id in db.session.execute(select(Tenant.tenant_id).order_by(Tenant.tenant_id)).scalars().all():
+        try:
+            summaries.append(archive_tenant(tenant_id, months, bucket, today))
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to archive results of {tenant_id}: {e}")
+            summaries.append({"tenant_id": tenant_id, "error": str(e)})
+    return summaries
+
+def fetch_archived_rows(tenant_id, patient_id, limit, after=None, test_code=None, bucket=None):
+    """Up to limit + 1 archived results of a patient after the cursor, oldest first"""
+    bucket = bucket or S3_BUCKET
+    manifest = archive_store.load_manifest(tenant_id, bucket)
+    position = decode_cursor(after) if after else None
+    rows = []
+    for name in sorted(manifest["months"]):
+        month = date.fromisoformat(name + "-01")
+        # Sólo se descargan los meses que quedan a partir del cursor
+        if position and datetime.combine(add_months(month, 1), datetime.min.time()) <= position[0]:
+            continue
+        with closing(archive_store.patient_rows(bucket, manifest["months"][name], patient_id, position)) as month_rows:
+            for row in month_rows:
+                if test_code and row["test_code"] != test_code:
+                    continue
+                if position and (row["created_at"], row["id"]) <= position:
+                    continue
+                rows.append(row)
+                if len(rows) > limit:
+                    return rows
+    return rows
+
+def fetch_results_page_with_archive(tenant_id, patient_id, limit, after=None, fields=RESULT_FIELDS,
+                                    test_code=None, bucket=None):
+    """fetch_results_page that starts in the tenant's archive; returns (items, next_cursor, archived_count)
+
+    Archived months are all older than what is left in the database, so the archive rows
+    come first and the page is completed from lab_results with the same cursor. If the
+    archive cannot be read the page comes from the database only and archived_count is None.
+    """
+    try:
+        rows = fetch_archived_rows(tenant_id, patient_id, limit, after, test_code, bucket)
+    except Exception as e:
+        logger.warning(f"Archive of {tenant_id} unavailable, serving the database only: {e}")
+        items, next_cursor = fetch_results_page(tenant_id, patient_id, limit, after, fields, test_code)
+        return items, next_cursor, None
+    if not rows:
+        items, next_cursor = fetch_results_page(tenant_id, patient_id, limit, after, fields, test_code)
+        return items, next_cursor, 0
+
+    items = [
+        {field: row[field].isoformat() if field == "created_at" and row[field] else row[field] for field in fields}
+        for row in rows[:limit]
+    ]
+    last = rows[len(items) - 1]
+    cursor = encode_cursor(last["created_at"], last["id"])
+    if len(rows) > limit:
+        return items, cursor, len(items)
+    if len(items) == limit:
+        # El archivo se acabó justo: hay más sólo si la base tiene filas
+        more, _ = fetch_results_page(tenant_id, patient_id, 1, cursor, ("id",), test_code)
+        return items, cursor if more else None, len(items)
+    db_items, next_cursor = fetch_results_page(tenant_id, patient_id, limit - len(items), cursor, fields, test_code)
+    return items + db_items, next_cursor, len(items)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old lab_results to S3")
+    parser.add_argument("--months", type=int, default=ARCHIVE_AFTER_MONTHS,
+                        help="keep this many whole months in the database")
+    parser.add_argument("--tenant", help="archive only this tenant")
+    parser.add_argument("--bucket", default=S3_BUCKET)
+    args = parser.parse_args(argv)
+
+    from app import app
+    with app.app_context():
+        if args.tenant:
+            out = [archive_tenant(args.tenant, args.months, args.bucket)]
+        else:
+            out = archive_all(args.months, args.bucket)
+    print(json.dumps(out, indent=2, default=str))
+    return 1 if any("error" in summary for summary in out) else 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
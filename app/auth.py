@@ -1,39 +1,230 @@
-import json, requests, os
+import json, requests, os, time, hashlib, threading, logging
+from collections import OrderedDict
 from jose import jwk, jwt
 from jose.utils import base64url_decode
 from flask import request, g
 from functools import wraps
+from app.metrics import auth_verify_duration
 
 COGNITO_POOL_ID = os.getenv("COGNITO_POOL_ID")
 COGNITO_APP_CLIENT_ID = os.getenv("COGNITO_APP_CLIENT_ID")
 AWS_REGION = os.getenv("COGNITO_REGION") or os.getenv("AWS_REGION", "us-east-2")
 JWKS_URL = f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_POOL_ID}/.well-known/jwks.json"
 
-_jwks = None
+# Max number of verified tokens kept per worker
+CLAIMS_CACHE_SIZE = int(os.getenv("JWT_CLAIMS_CACHE_SIZE", "1024"))
+# JWKS fetch timeout and minimum seconds between refetches on unknown kid
+JWKS_TIMEOUT = float(os.getenv("JWKS_TIMEOUT", "5"))
+JWKS_MIN_REFRESH_INTERVAL = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "60"))
+# Periodic refresh so rotated keys are picked up before the first unknown kid
+JWKS_REFRESH_INTERVAL = float(os.getenv("JWKS_REFRESH_INTERVAL", "3600"))
+
+logger = logging.getLogger(__name__)
+
+class JWKSKeyStore:
+    """Constructed public keys indexed by kid, refreshed single-flight on unknown kids"""
+
+    def __init__(self, url, timeout=JWKS_TIMEOUT, min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL):
+        self.url = url
+        self.timeout = timeout
+        self.min_refresh_interval = min_refresh_interval
+        self._jwks = None
+        self._keys = {}
+        self._last_fetch = None
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._started = False
+        self.fetches = 0
+
+    def load_jwks(self, jwks):
+        """Replace the key index with the keys from a JWKS document"""
+        keys = {}
+        for key in jwks.get("keys", []):
+            try:
+                keys[key["kid"]] = jwk.construct(key)
+            except Exception as e:
+                logger.warning(f"Skipping unusable JWK {key.get('kid')}: {e}")
+        self._jwks = jwks
+        self._keys = keys
+
+    def _fetch(self):
+        r = requests.get(self.url, timeout=self.timeout)
+        r.raise_for_status()
+        self.fetches += 1
+        self.load_jwks(r.json())
+
+    def refresh(self, force=False):
+        """Refetch the JWKS unless another caller did so within min_refresh_interval"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._last_fetch is not None and now - self._last_fetch < self.min_refresh_interval:
+                return False
+            self._last_fetch = now
+            self._fetch()
+            return True
+
+    def prefetch(self):
+        """Load keys at worker start; failures are retried lazily on first use"""
+        try:
+            self.refresh(force=True)
+        except Exception as e:
+            logger.warning(f"JWKS prefetch failed: {e}")
+            self._last_fetch = None
+
+    def start_background_refresh(self, interval):
+        """Refresh the JWKS every interval seconds from a daemon thread"""
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh(force=True)
+                except Exception as e:
+                    logger.warning(f"JWKS background refresh failed: {e}")
+        self._refresh_thread = threading.Thread(target=loop, name="jwks-refresh", daemon=True)
+        self._refresh_thread.start()
+
+    def start(self, interval):
+        """Prefetch and start the background refresh once per process (safe to call on every request)"""
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if self._jwks is None:
+            self.prefetch()
+        self.start_background_refresh(interval)
+
+    def get_key(self, kid):
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f"JWKS refresh failed: {e}")
+        return self._keys.get(kid)
+
+    @property
+    def jwks(self):
+        if self._jwks is None:
+            self.refresh()
+        return self._jwks or {"keys": []}
+
+key_store = JWKSKeyStore(JWKS_URL)
+
+def init_key_store():
+    """Fetch the JWKS and keep it fresh in the background; gunicorn calls it after the fork,
+    anything else on its first verify_jwt (flask db, cron and tests never touch the network)"""
+    if not COGNITO_POOL_ID:
+        return
+    key_store.start(JWKS_REFRESH_INTERVAL)
 
 def get_jwks():
-    global _jwks
-    if _jwks is None:
-        r = requests.get(JWKS_URL)
-        _jwks = r.json()
-    return _jwks
+    return key_store.jwks
 
-def verify_jwt(token):
-    jwks = get_jwks()
+class ClaimsCache:
+    """Bounded LRU of verified claims keyed by token fingerprint, expiring at the token's exp"""
+
+    def __init__(self, maxsize=CLAIMS_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(token):
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token, now=None):
+        now = time.time() if now is None else now
+        key = self.fingerprint(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            claims, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(claims)
+
+    def put(self, token, claims):
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)):
+            # Sin exp no sabemos cuándo invalidar: no se cachea
+            return
+        key = self.fingerprint(token)
+        with self._lock:
+            self._entries[key] = (dict(claims), float(exp))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+claims_cache = ClaimsCache()
+
+def _verify_signature(token):
     headers = jwt.get_unverified_header(token)
     kid = headers.get('kid')
-    key = next((k for k in jwks['keys'] if k['kid'] == kid), None)
-    if not key:
+    init_key_store()
+    public_key = key_store.get_key(kid)
+    if public_key is None:
         raise Exception("Public key not found in jwks")
-    public_key = jwk.construct(key)
     message, encoded_sig = token.rsplit('.', 1)
     decoded_sig = base64url_decode(encoded_sig.encode('utf-8'))
     if not public_key.verify(message.encode("utf8"), decoded_sig):
         raise Exception("Signature verification failed")
-    claims = jwt.get_unverified_claims(token)
+    return jwt.get_unverified_claims(token)
+
+def verify_jwt(token):
+    cached = claims_cache.get(token)
+    if cached is not None:
+        return cached
+    claims = _verify_signature(token)
     # verify token use/issuer/audience/time in productionnn
+    exp = claims.get('exp')
+    if isinstance(exp, (int, float)) and exp <= time.time():
+        raise Exception("Token expired")
     if COGNITO_APP_CLIENT_ID and claims.get('aud') != COGNITO_APP_CLIENT_ID:
         raise Exception("Invalid audience")
+    claims_cache.put(token, claims)
+    return claims
+
+def get_request_claims():
+    """Verify the bearer token of the current request once and keep the claims on g"""
+    if "cognito_claims" in g:
+        return g.cognito_claims
+    if "cognito_error" in g:
+        raise g.cognito_error
+    auth = request.headers.get("Authorization", None)
+    if not auth:
+        return None
+    token = auth.split(" ")[1] if " " in auth else auth
+    started = time.perf_counter()
+    try:
+        claims = verify_jwt(token)
+    except Exception as e:
+        auth_verify_duration.observe(time.perf_counter() - started, outcome="error")
+        g.cognito_error = e
+        raise
+    auth_verify_duration.observe(time.perf_counter() - started, outcome="ok")
+    g.cognito_claims = claims
     return claims
 
 def cognito_required(f):
@@ -42,12 +233,10 @@ def cognito_required(f):
         auth = request.headers.get("Authorization", None)
         if not auth:
             return {"message": "Missing Authorization header"}, 401
-        token = auth.split(" ")[1] if " " in auth else auth
         try:
-            claims = verify_jwt(token)
-            g.cognito_claims = claims
-            # assume tenant_id is in custom:tenant_id claim or in subdomain
-            return f(*args, **kwargs)
+            get_request_claims()
         except Exception as e:
             return {"message": f"Token invalid: {str(e)}"}, 401
+        # assume tenant_id is in custom:tenant_id claim or in subdomain
+        return f(*args, **kwargs)
     return decorated
@@ -0,0 +1,77 @@
+# aws.py - clientes boto3 compartidos, creados bajo demanda una vez por proceso
+import logging
+import os
+import threading
+from app.metrics import instrument_aws_client
+
+logger = logging.getLogger(__name__)
+
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "32"))
+AWS_CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", "5"))
+AWS_READ_TIMEOUT = float(os.getenv("AWS_READ_TIMEOUT", "60"))
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "4"))
+
+_lock = threading.Lock()
+_clients = {}
+_session = None
+_pid = os.getpid()
+
+def client_config():
+    """botocore Config shared by every client: pooled keep-alive connections, bounded timeouts, retries"""
+    from botocore.config import Config
+    return Config(
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=AWS_READ_TIMEOUT,
+        retries={"max_attempts": AWS_MAX_ATTEMPTS, "mode": "standard"},
+        tcp_keepalive=True
+    )
+
+def reset_clients():
+    """Forget every client and the session (after fork the child must not reuse the parent's sockets)"""
+    global _lock, _clients, _session, _pid
+    # El lock puede haber quedado tomado por otro hilo del padre en el momento del fork
+    _lock = threading.Lock()
+    _clients = {}
+    _session = None
+    _pid = os.getpid()
+
+def get_client(service, region_name=None):
+    """Shared boto3 client for (service, region), created on first use in this process"""
+    if _pid != os.getpid():
+        reset_clients()
+    key = (service, region_name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    global _session
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # boto3 se importa aquí: importar la app no paga su costo ni requiere credenciales
+            import boto3
+            if _session is None:
+                _session = boto3.session.Session()
+            client = instrument_aws_client(
+                _session.client(service, region_name=region_name, config=client_config())
+            )
+            _clients[key] = client
+            logger.debug(f"Created {service} client (pid {_pid})")
+    return client
+
+class LazyClient:
+    """Module-level stand-in for a boto3 client that resolves it on first attribute access"""
+
+    def __init__(self, service, region_name=None):
+        self.service = service
+        self.region_name = region_name
+
+    def __getattr__(self, name):
+        return getattr(get_client(self.service, self.region_name), name)
+
+    def __repr__(self):
+        return f"<LazyClient {self.service}>"
+
+if hasattr(os, "register_at_fork"):
+    # gunicorn --preload: los workers heredan el módulo ya importado
+    os.register_at_fork(after_in_child=reset_clients)
@@ -1,8 +1,11 @@
 # billing.pyyyy
-from app.models import Tenant, TenantUsage, db, LabResult
+from app.models import Tenant, TenantUsage, Invoice, InvoiceLineItem, db, LabResult
+from app.tenant_cache import tenant_cache
+from sqlalchemy import and_
 from datetime import date, datetime, timedelta
 import calendar
 import json
+import os
 from decimal import Decimal
 
 RATE = {
@@ -16,66 +19,86 @@ RATE = {
     "monthly_fee_basic": 99.0
 }
 
-def calculate_tenant_bill(tenant_id, month_date):
-    """Calculate detailed bill for a tenant in a specific month"""
-    usage = TenantUsage.query.filter_by(tenant_id=tenant_id, month=month_date).first()
-    if not usage:
-        return None
-    
-    tenant = Tenant.query.filter_by(tenant_id=tenant_id).first()
-    if not tenant:
-        return None
-    
-    # Get tier-based base fee
-    tier_fee = {
+TAX_RATE = Decimal("0.16")  # 16% IVA (ajusta según tu país)
+
+# Un mes se cierra cuando pasó este margen desde su fin: los workers ya vaciaron sus
+# contadores write-behind (debe superar USAGE_FLUSH_INTERVAL)
+INVOICE_CLOSE_GRACE = float(os.getenv("INVOICE_CLOSE_GRACE", "3600"))
+
+def _money(value):
+    return Decimal(str(value))
+
+def _tier_fee(subscription_tier):
+    return _money({
         "basic": RATE["monthly_fee_basic"],
         "professional": RATE["monthly_fee_professional"],
         "enterprise": RATE["monthly_fee_enterprise"]
-    }.get(tenant.subscription_tier, RATE["base_fee"])
+    }.get(subscription_tier, RATE["base_fee"]))
+
+def _as_float(value):
+    """Decimal -> float recursively (JSON representation of an exact invoice)"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, dict):
+        return {k: _as_float(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_as_float(v) for v in value]
+    return value
+
+def build_invoice(tenant, usage, month_date, exact=False):
+    """Build the invoice for an already loaded Tenant/TenantUsage pair (no queries)
+
+    Amounts are computed as Decimal; they are returned as floats unless exact=True.
+    """
+    results_processed = usage.results_processed or 0
+    api_calls = usage.api_calls or 0
+    
+    # Get tier-based base fee
+    tier_fee = _tier_fee(tenant.subscription_tier)
     
     # Calculate usage-based charges
-    overage = max(0, usage.results_processed - RATE["included_results"])
-    overage_charge = Decimal(str(overage)) * Decimal(str(RATE["overage_per_result"]))
+    overage = max(0, results_processed - RATE["included_results"])
+    overage_charge = Decimal(overage) * _money(RATE["overage_per_result"])
     
-    storage_gb = Decimal(str(usage.storage_bytes or 0)) / Decimal('1e9')
-    storage_charge = storage_gb * Decimal(str(RATE["storage_per_gb"]))
+    storage_gb = Decimal(usage.storage_bytes or 0) / Decimal('1e9')
+    storage_charge = storage_gb * _money(RATE["storage_per_gb"])
     
-    api_charge = (Decimal(str(usage.api_calls or 0)) / Decimal('1000.0')) * Decimal(str(RATE["api_per_1000_calls"]))
+    api_charge = (Decimal(api_calls) / Decimal('1000')) * _money(RATE["api_per_1000_calls"])
     
-    subtotal = tier_fee + float(overage_charge) + float(storage_charge) + float(api_charge)
-    tax = subtotal * 0.16  # 16% IVA (ajusta según tu país)
+    subtotal = tier_fee + overage_charge + storage_charge + api_charge
+    tax = subtotal * TAX_RATE
     total = subtotal + tax
     
     invoice = {
-        "tenant_id": tenant_id,
+        "tenant_id": tenant.tenant_id,
         "company_name": tenant.company_name,
         "month": month_date.isoformat(),
         "subscription_tier": tenant.subscription_tier,
         "items": [
             {
-                "description": f"Suscripción {tenant.subscription_tier.capitalize()}",
+                "description": f"Suscripción {(tenant.subscription_tier or '').capitalize()}",
                 "quantity": 1,
-                "unit_price": float(tier_fee),
-                "total": float(tier_fee)
+                "unit_price": tier_fee,
+                "total": tier_fee
             },
             {
-                "description": f"Resultados procesados ({usage.results_processed} total, {RATE['included_results']} incluidos)",
+                "description": f"Resultados procesados ({results_processed} total, {RATE['included_results']} incluidos)",
                 "quantity": overage,
-                "unit_price": float(RATE["overage_per_result"]),
-                "total": float(overage_charge)
+                "unit_price": _money(RATE["overage_per_result"]),
+                "total": overage_charge
             } if overage > 0 else None,
             {
                 "description": f"Almacenamiento ({storage_gb:.2f} GB)",
-                "quantity": float(storage_gb),
-                "unit_price": float(RATE["storage_per_gb"]),
-                "total": float(storage_charge)
-            } if float(storage_charge) > 0 else None,
+                "quantity": storage_gb,
+                "unit_price": _money(RATE["storage_per_gb"]),
+                "total": storage_charge
+            } if storage_charge > 0 else None,
             {
-                "description": f"Llamadas API ({usage.api_calls:,} llamadas)",
-                "quantity": float(usage.api_calls),
-                "unit_price": float(RATE["api_per_1000_calls"] / 1000),
-                "total": float(api_charge)
-            } if float(api_charge) > 0 else None
+                "description": f"Llamadas API ({api_calls:,} llamadas)",
+                "quantity": Decimal(api_calls),
+                "unit_price": _money(RATE["api_per_1000_calls"]) / 1000,
+                "total": api_charge
+            } if api_charge > 0 else None
         ],
         "subtotal": subtotal,
         "tax": tax,
@@ -88,30 +111,42 @@ def calculate_tenant_bill(tenant_id, month_date):
     # Remove None items
     invoice["items"] = [item for item in invoice["items"] if item is not None]
     
-    return invoice
+    return invoice if exact else _as_float(invoice)
+
+def calculate_tenant_bill(tenant_id, month_date):
+    """Calculate detailed bill for a tenant in a specific month"""
+    usage = TenantUsage.query.filter_by(tenant_id=tenant_id, month=month_date).first()
+    if not usage:
+        return None
+    
+    tenant = tenant_cache.get(tenant_id)
+    if not tenant:
+        return None
+    
+    return build_invoice(tenant, usage, month_date)
 
 def generate_invoice_for_all_tenants(month_date=None):
-    """Generate invoices for all tenants for a specific month"""
+    """Generate invoices for all tenants for a specific month (single JOIN query)"""
     if month_date is None:
         month_date = date.today().replace(day=1)
     
-    invoices = []
-    tenants = Tenant.query.all()
-    
-    for tenant in tenants:
-        invoice = calculate_tenant_bill(tenant.tenant_id, month_date)
-        if invoice:
-            invoices.append(invoice)
+    rows = (
+        db.session.query(Tenant, TenantUsage)
+        .join(TenantUsage, TenantUsage.tenant_id == Tenant.tenant_id)
+        .filter(TenantUsage.month == month_date)
+        .order_by(Tenant.id)
+        .all()
+    )
     
-    return invoices
+    return [build_invoice(tenant, usage, month_date) for tenant, usage in rows]
 
-def save_invoice_to_json(invoice):
+def save_invoice_to_json(invoice, invoices_dir="invoices"):
     """Save invoice as JSON file"""
     import os
     from pathlib import Path
     
-    invoices_dir = Path("invoices")
-    invoices_dir.mkdir(exist_ok=True)
+    invoices_dir = Path(invoices_dir)
+    invoices_dir.mkdir(parents=True, exist_ok=True)
     
     filename = f"invoice_{invoice['tenant_id']}_{invoice['month']}.json"
     filepath = invoices_dir / filename
@@ -121,25 +156,234 @@ def save_invoice_to_json(invoice):
     
     return str(filepath)
 
-def get_monthly_usage_summary(tenant_id, year=None):
-    """Get usage summary for a tenant for all months in a year"""
-    if year is None:
-        year = date.today().year
-    
-    summary = []
-    for month in range(1, 13):
-        month_date = date(year, month, 1)
-        usage = TenantUsage.query.filter_by(
-            tenant_id=tenant_id, 
-            month=month_date
-        ).first()
-        
-        if usage:
-            summary.append({
-                "month": month_date.strftime("%Y-%m"),
-                "results_processed": usage.results_processed,
-                "api_calls": usage.api_calls,
-                "storage_gb": (usage.storage_bytes or 0) / 1e9
-            })
-    
-    return summary
\ No newline at end of file
+def parse_month(value):
+    """Parse a YYYY-MM string into the first day of that month"""
+    return datetime.strptime(value, "%Y-%m").date()
+
+def year_range(year):
+    return date(year, 1, 1), date(year, 12, 1)
+
+def _summary_item(usage):
+    return {
+        "month": usage.month.strftime("%Y-%m"),
+        "results_processed": usage.results_processed,
+        "api_calls": usage.api_calls,
+        "storage_gb": (usage.storage_bytes or 0) / 1e9
+    }
+
+def get_monthly_usage_summary(tenant_id, year=None, start_month=None, end_month=None):
+    """Get usage summary for a tenant for all months in a year (or a from/to month range)"""
+    if start_month is None or end_month is None:
+        start_month, end_month = year_range(year or date.today().year)
+    
+    usages = (
+        TenantUsage.query
+        .filter(
+            TenantUsage.tenant_id == tenant_id,
+            TenantUsage.month.between(start_month, end_month)
+        )
+        .order_by(TenantUsage.month)
+        .all()
+    )
+    return [_summary_item(usage) for usage in usages]
+
+def get_tenant_invoices(tenant_id, start_month, end_month):
+    """Invoices of one tenant for every month with usage in the range, served from storage"""
+    rows = (
+        _usage_tenant_invoice_query()
+        .filter(
+            TenantUsage.tenant_id == tenant_id,
+            TenantUsage.month.between(start_month, end_month)
+        )
+        .order_by(TenantUsage.month)
+        .all()
+    )
+    return _read_invoices(rows)
+
+def get_billing_overview(tenant_id, year, current_month):
+    """Current invoice plus the year's usage summary from one range query"""
+    start_month, end_month = year_range(year)
+    rows = (
+        _usage_tenant_invoice_query()
+        .filter(
+            TenantUsage.tenant_id == tenant_id,
+            TenantUsage.month.between(start_month, end_month)
+        )
+        .order_by(TenantUsage.month)
+        .all()
+    )
+    summary = [_summary_item(usage) for usage, _, _ in rows]
+    invoices = _read_invoices(rows)
+    current_invoice = next((inv for inv in invoices if inv["month"] == current_month.isoformat()), None)
+    return current_invoice, summary
+
+# ----------------------
+# Facturas materializadas (tabla invoices)
+# ----------------------
+def current_month_start():
+    return date.today().replace(day=1)
+
+def _quantity(value):
+    if value is None:
+        return None
+    return int(value) if value == value.to_integral_value() else float(value)
+
+def invoice_to_dict(invoice):
+    """Serialize a stored Invoice with the same shape as build_invoice()"""
+    return {
+        "tenant_id": invoice.tenant_id,
+        "company_name": invoice.company_name,
+        "month": invoice.month.isoformat(),
+        "subscription_tier": invoice.subscription_tier,
+        "items": [
+            {
+                "description": item.description,
+                "quantity": _quantity(item.quantity),
+                "unit_price": float(item.unit_price),
+                "total": float(item.total)
+            }
+            for item in invoice.items
+        ],
+        "subtotal": float(invoice.subtotal),
+        "tax": float(invoice.tax),
+        "total": float(invoice.total),
+        "currency": invoice.currency,
+        "invoice_date": invoice.invoice_date.isoformat() if invoice.invoice_date else None,
+        "due_date": invoice.due_date.isoformat() if invoice.due_date else None,
+        "status": invoice.status
+    }
+
+def _read_invoices(rows):
+    """Closed invoices from storage, the rest computed in memory; reads never write invoices"""
+    invoices = []
+    for usage, tenant, stored in rows:
+        if tenant is None:
+            continue
+        if stored is not None and stored.status == "closed":
+            invoices.append(invoice_to_dict(stored))
+        else:
+            invoices.append(dict(build_invoice(tenant, usage, usage.month), status="open"))
+    return invoices
+
+def _insert(dialect_name):
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Invoice upsert not supported on {dialect_name}")
+    return insert
+
+def _upsert_invoice(tenant, usage, status):
+    """INSERT ... ON CONFLICT (tenant_id, month) DO UPDATE unless closed; returns the invoice id or None
+
+    The conflicting row stays locked until commit, so concurrent runs replace the line
+    items one after the other instead of racing on them.
+    """
+    data = build_invoice(tenant, usage, usage.month, exact=True)
+    table = Invoice.__table__
+    values = {
+        "tenant_id": tenant.tenant_id,
+        "month": usage.month,
+        "status": status,
+        "usage_version": usage.version or 0,
+        "company_name": data["company_name"],
+        "subscription_tier": data["subscription_tier"],
+        "subtotal": data["subtotal"],
+        "tax": data["tax"],
+        "total": data["total"],
+        "currency": data["currency"],
+        "invoice_date": date.fromisoformat(data["invoice_date"]),
+        "due_date": date.fromisoformat(data["due_date"]),
+        "updated_at": datetime.utcnow()
+    }
+    stmt = _insert(db.engine.dialect.name)(table).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.tenant_id, table.c.month],
+        set_={col: stmt.excluded[col] for col in values if col not in ("tenant_id", "month")},
+        where=table.c.status != "closed"
+    ).returning(table.c.id)
+    invoice_id = db.session.execute(stmt).scalar()
+    if invoice_id is None:
+        return None
+    items = InvoiceLineItem.__table__
+    db.session.execute(items.delete().where(items.c.invoice_id == invoice_id))
+    db.session.execute(items.insert(), [
+        {
+            "invoice_id": invoice_id,
+            "position": position,
+            "description": item["description"],
+            "quantity": Decimal(item["quantity"]),
+            "unit_price": item["unit_price"],
+            "total": item["total"]
+        }
+        for position, item in enumerate(data["items"])
+    ])
+    return invoice_id
+
+def closing_month(now=None):
+    """First month that cannot be closed yet: months before it ended INVOICE_CLOSE_GRACE ago"""
+    now = now or datetime.now()
+    return (now - timedelta(seconds=INVOICE_CLOSE_GRACE)).date().replace(day=1)
+
+def _usage_tenant_invoice_query():
+    return (
+        db.session.query(TenantUsage, Tenant, Invoice)
+        .outerjoin(Tenant, Tenant.tenant_id == TenantUsage.tenant_id)
+        .outerjoin(Invoice, and_(
+            Invoice.tenant_id == TenantUsage.tenant_id,
+            Invoice.month == TenantUsage.month
+        ))
+    )
+
+def materialize_month(month_date=None, current_month=None, tenant_ids=None):
+    """Write the invoices of every tenant (or only tenant_ids) for a month; only the invoice job calls this
+
+    Closed invoices are never touched. Open invoices are rewritten when the usage row's
+    version moved, and months before current_month (default closing_month()) are closed.
+    Returns (invoices, changed).
+    """
+    if month_date is None:
+        month_date = current_month_start()
+    if current_month is None:
+        current_month = closing_month()
+    query = _usage_tenant_invoice_query().filter(TenantUsage.month == month_date)
+    if tenant_ids is not None:
+        query = query.filter(TenantUsage.tenant_id.in_(tenant_ids))
+    rows = query.order_by(Tenant.id).all()
+
+    status = "closed" if month_date < current_month else "open"
+    written, changed = [], 0
+    for usage, tenant, stored in rows:
+        if tenant is None:
+            continue
+        written.append(tenant.tenant_id)
+        if stored is not None and (stored.status == "closed" or (
+            stored.usage_version == (usage.version or 0) and status == "open"
+        )):
+            continue
+        if _upsert_invoice(tenant, usage, status) is not None:
+            changed += 1
+    db.session.commit()
+
+    stored = {
+        invoice.tenant_id: invoice for invoice in
+        Invoice.query.filter(Invoice.month == month_date, Invoice.tenant_id.in_(written))
+        .execution_options(populate_existing=True)
+    }
+    return [invoice_to_dict(stored[tenant_id]) for tenant_id in written], changed
+
+def billable_tenant_ids(month_date):
+    """tenant_ids with a tenant row and usage in the month, in a single query"""
+    return [
+        tenant_id for (tenant_id,) in
+        db.session.query(Tenant.tenant_id)
+        .join(TenantUsage, TenantUsage.tenant_id == Tenant.tenant_id)
+        .filter(TenantUsage.month == month_date)
+        .order_by(Tenant.tenant_id)
+    ]
+
+def get_stored_invoices(month_date):
+    """Invoices of all tenants for a month: closed ones from the invoices table, open ones computed"""
+    rows = _usage_tenant_invoice_query().filter(TenantUsage.month == month_date).order_by(Tenant.id).all()
+    return _read_invoices(rows)
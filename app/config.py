@@ -1,32 +1,101 @@
-from dotenv import load_dotenv
-import os
-
-# Carga variables del .envvvvv
-load_dotenv()
-
-# ----------------------
-# Variables globales ss
-# ----------------------
-S3_BUCKET = os.getenv("S3_BUCKET", "tenant-lab-bucket")
-
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-
-COGNITO_USER_POOL_ID = os.getenv("COGNITO_USER_POOL_ID")
-COGNITO_CLIENT_ID = os.getenv("COGNITO_CLIENT_ID")
-AWS_REGION = "us-east-2"
-
-# ----------------------
-# Clase Config (para Flask)
-# ----------------------
-class Config:
-    S3_BUCKET = S3_BUCKET
-    DATABASE_URL = DATABASE_URL
-    COGNITO_USER_POOL_ID = COGNITO_USER_POOL_ID
-    COGNITO_CLIENT_ID = COGNITO_CLIENT_ID
-    AWS_REGION = AWS_REGION
+from dotenv import load_dotenv
+import os
+
+# Carga variables del .envvvvv
+load_dotenv()
+
+# ----------------------
+# Variables globales ss
+# ----------------------
+S3_BUCKET = os.getenv("S3_BUCKET", "tenant-lab-bucket")
+
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+
+# DATABASE_URL explícito (tests, desarrollo local) tiene prioridad sobre DB_*
+DATABASE_URL = os.getenv("DATABASE_URL") or f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# Pool de conexiones del engine de SQLAlchemy (ver engine_options)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+def engine_options(database_url):
+    """SQLALCHEMY_ENGINE_OPTIONS for database_url; SQLite keeps its default pool"""
+    if database_url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING
+    }
+
+COGNITO_USER_POOL_ID = os.getenv("COGNITO_USER_POOL_ID")
+COGNITO_CLIENT_ID = os.getenv("COGNITO_CLIENT_ID")
+AWS_REGION = "us-east-2"
+
+# Contadores de uso: segundos entre flushes y eventos pendientes que fuerzan uno
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "5"))
+USAGE_FLUSH_MAX_PENDING = int(os.getenv("USAGE_FLUSH_MAX_PENDING", "500"))
+
+# Aprovisionamiento en segundo plano: hilos por worker (0 = solo run_pending) y reintentos
+PROVISIONING_WORKERS = int(os.getenv("PROVISIONING_WORKERS", "2"))
+PROVISIONING_MAX_ATTEMPTS = int(os.getenv("PROVISIONING_MAX_ATTEMPTS", "3"))
+PROVISIONING_RETRY_DELAY = float(os.getenv("PROVISIONING_RETRY_DELAY", "2"))
+# Segundos entre barridos de jobs en cola o huérfanos de un worker reciclado
+PROVISIONING_SWEEP_INTERVAL = float(os.getenv("PROVISIONING_SWEEP_INTERVAL", "60"))
+# Segundos que un job con secretos en memoria espera al worker que lo encoló antes de que otro lo tome
+PROVISIONING_SECRET_GRACE = float(os.getenv("PROVISIONING_SECRET_GRACE", "300"))
+
+# Caché de tenants por worker; LISTEN/NOTIFY propaga invalidaciones entre workers (PostgreSQL)
+TENANT_CACHE_TTL = float(os.getenv("TENANT_CACHE_TTL", "300"))
+TENANT_CACHE_LISTEN = os.getenv("TENANT_CACHE_LISTEN", "false").lower() in ("1", "true", "yes")
+
+# Métricas Prometheus en /metrics (por worker)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Detector de N+1 / consultas lentas: solo desarrollo y staging
+QUERY_INSPECTOR = os.getenv("QUERY_INSPECTOR", "false").lower() in ("1", "true", "yes")
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+# Caché de respuestas GET con ETag: memory (por worker), redis (compartida) o none
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "redis://127.0.0.1:6379/0")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+
+# ----------------------
+# Clase Config (para Flask)
+# ----------------------
+class Config:
+    S3_BUCKET = S3_BUCKET
+    DATABASE_URL = DATABASE_URL
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(DATABASE_URL)
+    COGNITO_USER_POOL_ID = COGNITO_USER_POOL_ID
+    COGNITO_CLIENT_ID = COGNITO_CLIENT_ID
+    AWS_REGION = AWS_REGION
+    USAGE_FLUSH_INTERVAL = USAGE_FLUSH_INTERVAL
+    USAGE_FLUSH_MAX_PENDING = USAGE_FLUSH_MAX_PENDING
+    PROVISIONING_WORKERS = PROVISIONING_WORKERS
+    PROVISIONING_MAX_ATTEMPTS = PROVISIONING_MAX_ATTEMPTS
+    PROVISIONING_RETRY_DELAY = PROVISIONING_RETRY_DELAY
+    PROVISIONING_SWEEP_INTERVAL = PROVISIONING_SWEEP_INTERVAL
+    PROVISIONING_SECRET_GRACE = PROVISIONING_SECRET_GRACE
+    TENANT_CACHE_TTL = TENANT_CACHE_TTL
+    TENANT_CACHE_LISTEN = TENANT_CACHE_LISTEN
+    METRICS_ENABLED = METRICS_ENABLED
+    QUERY_INSPECTOR = QUERY_INSPECTOR
+    QUERY_REPEAT_THRESHOLD = QUERY_REPEAT_THRESHOLD
+    SLOW_QUERY_MS = SLOW_QUERY_MS
+    RESPONSE_CACHE_BACKEND = RESPONSE_CACHE_BACKEND
+    RESPONSE_CACHE_URL = RESPONSE_CACHE_URL
+    RESPONSE_CACHE_SIZE = RESPONSE_CACHE_SIZE
+    RESPONSE_CACHE_TTL = RESPONSE_CACHE_TTL
@@ -1,51 +1,200 @@
 # invoice_cron.py
-import schedule
 import time
-from datetime import date, timedelta
-from app.billing import generate_invoice_for_all_tenants, save_invoice_to_json
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from app.billing import materialize_month, billable_tenant_ids, save_invoice_to_json, parse_month
+from app.usage import usage_aggregator
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+INVOICES_DIR = os.getenv("INVOICES_DIR", "invoices")
+INVOICE_WORKERS = int(os.getenv("INVOICE_WORKERS", "4"))
+INVOICE_CHUNK_SIZE = int(os.getenv("INVOICE_CHUNK_SIZE", "50"))
+
+def previous_month(today=None):
+    """First day of the month before today"""
+    today = today or date.today()
+    first_day_current = date(today.year, today.month, 1)
+    previous = first_day_current - timedelta(days=1)
+    return date(previous.year, previous.month, 1)
+
+def _init_process_worker():
+    # Los procesos hijos no deben reutilizar conexiones heredadas del padre
+    from app import app, db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+def process_chunk(invoice_month, tenant_ids, month_dir):
+    """Materialize and write the invoices of a chunk of tenants in its own DB session
+
+    Returns (done, failed). If the chunk as a whole fails, tenants are retried one by
+    one so a single bad tenant does not fail its neighbours.
+    """
+    from app import app, db
+    done, failed = [], []
+    with app.app_context():
+        try:
+            invoices, _ = materialize_month(invoice_month, tenant_ids=tenant_ids)
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Chunk of {len(tenant_ids)} tenants failed ({e}), retrying one by one")
+            invoices = []
+            for tenant_id in tenant_ids:
+                try:
+                    invoices.extend(materialize_month(invoice_month, tenant_ids=[tenant_id])[0])
+                except Exception as tenant_error:
+                    db.session.rollback()
+                    failed.append({"tenant_id": tenant_id, "error": str(tenant_error)})
+        for invoice in invoices:
+            filepath = save_invoice_to_json(invoice, month_dir)
+            done.append({"tenant_id": invoice["tenant_id"], "file": filepath, "total": invoice["total"]})
+    return done, failed
+
+def _read_checkpoint(path):
+    done = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    done[entry["tenant_id"]] = entry
+    return done
+
+def _write_combined(month_dir, invoice_month, entries):
+    """Concatenate the per-tenant files into one NDJSON; returns (path, sha256)"""
+    path = os.path.join(month_dir, f"invoices_{invoice_month.strftime('%Y-%m')}.ndjson")
+    digest = hashlib.sha256()
+    with open(path, "w") as out:
+        for entry in sorted(entries, key=lambda e: e["tenant_id"]):
+            with open(entry["file"]) as f:
+                line = json.dumps(json.load(f), default=str) + "\n"
+            out.write(line)
+            digest.update(line.encode("utf-8"))
+    return path, digest.hexdigest()
+
+def run_invoice_batch(invoice_month, workers=INVOICE_WORKERS, chunk_size=INVOICE_CHUNK_SIZE,
+                      output_dir=INVOICES_DIR, use_processes=False, chunk_fn=process_chunk):
+    """Generate a month's invoices in parallel chunks, resumable through a checkpoint file
+
+    Writes per-tenant JSON files, invoices_YYYY-MM.ndjson and manifest.json under
+    output_dir/YYYY-MM and returns the run statistics.
+    """
+    from app import app
+    started = time.perf_counter()
+    month_dir = os.path.join(output_dir, invoice_month.strftime("%Y-%m"))
+    os.makedirs(month_dir, exist_ok=True)
+    checkpoint_path = os.path.join(month_dir, "checkpoint.ndjson")
+
+    done = _read_checkpoint(checkpoint_path)
+    with app.app_context():
+        # Los workers web vacían los suyos cada USAGE_FLUSH_INTERVAL (INVOICE_CLOSE_GRACE los espera)
+        usage_aggregator.flush()
+        tenant_ids = billable_tenant_ids(invoice_month)
+    pending = [tenant_id for tenant_id in tenant_ids if tenant_id not in done]
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    logger.info(f"Invoicing {invoice_month.strftime('%Y-%m')}: {len(tenant_ids)} tenants, "
+                f"{len(done)} already done, {len(chunks)} chunks on {workers} workers")
+
+    failed = []
+    generated = 0
+    if chunks:
+        if use_processes:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_process_worker)
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="invoice")
+        with executor, open(checkpoint_path, "a") as checkpoint:
+            futures = {executor.submit(chunk_fn, invoice_month, chunk, month_dir): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                try:
+                    chunk_done, chunk_failed = future.result()
+                except Exception as e:
+                    chunk_done = []
+                    chunk_failed = [{"tenant_id": tenant_id, "error": str(e)} for tenant_id in futures[future]]
+                # Solo el hilo principal escribe el checkpoint
+                for entry in chunk_done:
+                    checkpoint.write(json.dumps(entry) + "\n")
+                    done[entry["tenant_id"]] = entry
+                checkpoint.flush()
+                generated += len(chunk_done)
+                failed.extend(chunk_failed)
+
+    combined_path, combined_sha256 = _write_combined(month_dir, invoice_month, done.values())
+    elapsed = time.perf_counter() - started
+    stats = {
+        "month": invoice_month.strftime("%Y-%m"),
+        "tenants": len(tenant_ids),
+        "generated": generated,
+        "skipped": len(tenant_ids) - len(pending),
+        "failed": len(failed),
+        "failures": failed,
+        "invoices": len(done),
+        "total_amount": sum(entry["total"] for entry in done.values()),
+        "workers": workers,
+        "chunk_size": chunk_size,
+        "executor": "process" if use_processes else "thread",
+        "duration_seconds": round(elapsed, 3),
+        "throughput_per_second": round(generated / elapsed, 2) if elapsed > 0 else None,
+        "combined_file": combined_path,
+        "combined_sha256": combined_sha256,
+        "files": sorted(entry["file"] for entry in done.values()),
+        "generated_at": datetime.utcnow().isoformat()
+    }
+    with open(os.path.join(month_dir, "manifest.json"), "w") as f:
+        json.dump(stats, f, indent=2)
+
+    logger.info(f"✅ {generated} invoices generated ({stats['skipped']} from checkpoint), "
+                f"{len(failed)} failed in {elapsed:.2f}s ({stats['throughput_per_second']}/s)")
+    for failure in failed:
+        logger.error(f"❌ {failure['tenant_id']}: {failure['error']}")
+    return stats
+
 def generate_monthly_invoices():
     """Generate invoices for all tenants for previous month"""
     try:
-        # Get first day of previous month
-        today = date.today()
-        first_day_current = date(today.year, today.month, 1)
-        previous_month = first_day_current - timedelta(days=1)
-        invoice_month = date(previous_month.year, previous_month.month, 1)
-        
+        invoice_month = previous_month()
+
         logger.info(f"Generating invoices for {invoice_month.strftime('%Y-%m')}")
-        
-        invoices = generate_invoice_for_all_tenants(invoice_month)
-        
-        # Save each invoice
-        saved_files = []
-        for invoice in invoices:
-            if invoice:
-                filepath = save_invoice_to_json(invoice)
-                saved_files.append(filepath)
-        
-        logger.info(f"✅ Generated {len(saved_files)} invoices")
-        
+
+        stats = run_invoice_batch(invoice_month)
+
         # TODO: Send invoices via email
         # send_invoices_by_email(invoices)
-        
-        return saved_files
-        
+
+        return stats["files"]
+
     except Exception as e:
         logger.error(f"❌ Failed to generate invoices: {e}")
         return []
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate monthly invoices")
+    parser.add_argument("--month", help="YYYY-MM (default: previous month)")
+    parser.add_argument("--workers", type=int, default=INVOICE_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=INVOICE_CHUNK_SIZE)
+    parser.add_argument("--output-dir", default=INVOICES_DIR)
+    parser.add_argument("--processes", action="store_true", help="use a process pool instead of threads")
+    args = parser.parse_args(argv)
+
+    invoice_month = parse_month(args.month) if args.month else previous_month()
+    stats = run_invoice_batch(invoice_month, workers=args.workers, chunk_size=args.chunk_size,
+                              output_dir=args.output_dir, use_processes=args.processes)
+    print(json.dumps({k: v for k, v in stats.items() if k != "files"}, indent=2))
+    return 1 if stats["failed"] else 0
+
 if __name__ == "__main__":
     # Ejecutar inmediatamente para pruebas
-    generate_monthly_invoices()
-    
-    # Para producción: Programar ejecución el día 1 de cada mes
+    raise SystemExit(main())
+
+    # Para producción: Programar ejecución el día 1 de cada mes (pip install schedule)
+    # import schedule
     # schedule.every().month.at("00:01").do(generate_monthly_invoices)
-    
+
     # while True:
     #     schedule.run_pending()
-    #     time.sleep(60)
\ No newline at end of file
+    #     time.sleep(60)
@@ -0,0 +1,278 @@
+# metrics.py - histogramas/contadores en memoria y exposición en formato Prometheus
+from bisect import bisect_left
+from contextvars import ContextVar
+from flask import g, request, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Tope de series por métrica: lo que pase de aquí se agrupa en la etiqueta "other"
+METRICS_MAX_SERIES = int(os.getenv("METRICS_MAX_SERIES", "500"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+KNOWN_TIERS = ("basic", "professional", "enterprise")
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), max_series=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series or METRICS_MAX_SERIES
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        key = tuple([str(labels.get(name, "")) for name in self.labelnames])
+        if key not in self._series and len(self._series) >= self.max_series:
+            return ("other",) * len(self.labelnames)
+        return key
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+            lines.extend(self._render_series(key, value) for key, value in series)
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._series.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0)
+
+    def _render_series(self, key, value):
+        return f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, max_series=None):
+        super().__init__(name, documentation, labelnames, max_series)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # [conteos por bucket (no acumulados), suma, total]
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(str(labels.get(name, "")) for name in self.labelnames))
+        return series[2] if series else 0
+
+    def _render_series(self, key, series):
+        counts, total, count = series
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return "\n".join(lines)
+
+class Registry:
+    """Metrics of this worker process (each gunicorn worker exposes its own)"""
+
+    def __init__(self):
+        self.enabled = METRICS_ENABLED
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, fn):
+        """fn() -> iterable of (name, type, help, {labels tuple: value}) rendered at scrape time"""
+        self._collectors.append(fn)
+        return fn
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+    def render(self):
+        parts = [metric.render() for metric in self._metrics]
+        for collector in self._collectors:
+            try:
+                for name, kind, documentation, samples in collector():
+                    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+                    lines.extend(f"{name}{labels} {_format_value(value)}" for labels, value in samples)
+                    parts.append("\n".join(lines))
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        return "\n".join(parts) + "\n"
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route template, method, status and tenant tier",
+    ("endpoint", "method", "status", "tier")))
+db_queries_per_request = registry.register(Histogram(
+    "db_queries_per_request", "SQL statements executed per request",
+    ("endpoint", "tier"), buckets=QUERY_COUNT_BUCKETS))
+db_time_per_request = registry.register(Histogram(
+    "db_time_per_request_seconds", "Time spent in SQL statements per request",
+    ("endpoint", "tier")))
+aws_call_duration = registry.register(Histogram(
+    "aws_call_duration_seconds", "Duration of AWS API calls (S3, Cognito, ...)",
+    ("service", "operation", "outcome")))
+auth_verify_duration = registry.register(Histogram(
+    "auth_verify_duration_seconds", "JWT verification time (cache lookup + signature check)",
+    ("outcome",)))
+
+def tier_label(tier):
+    return tier if tier in KNOWN_TIERS else ("none" if not tier else "other")
+
+# ---------- SQLAlchemy: consultas y tiempo por request ----------
+# [consultas, segundos] del request en curso; None fuera de un request medido
+_request_db = ContextVar("metrics_request_db", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats = _request_db.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+def install_db_hooks():
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+# ---------- botocore: duración de cada llamada ----------
+def _aws_before_call(model=None, context=None, **kwargs):
+    if context is not None:
+        context["metrics_start"] = time.perf_counter()
+
+def _aws_after_call(model=None, context=None, exception=None, **kwargs):
+    start = (context or {}).get("metrics_start")
+    if start is None or not registry.enabled:
+        return
+    aws_call_duration.observe(
+        time.perf_counter() - start,
+        service=model.service_model.endpoint_prefix if model else "unknown",
+        operation=model.name if model else "unknown",
+        outcome="error" if exception is not None else "ok"
+    )
+
+def instrument_aws_client(client):
+    events = client.meta.events
+    events.register("before-call.*.*", _aws_before_call)
+    events.register("after-call.*.*", _aws_after_call)
+    events.register("after-call-error.*.*", _aws_after_call)
+    return client
+
+# ---------- Flask ----------
+def _tenant_tier():
+    tenant_id = g.get("tenant_id")
+    if not tenant_id:
+        return "none"
+    try:
+        from app.tenant_cache import tenant_cache
+        # Normalmente la ruta ya lo cargó: no contar esa segunda consulta como hit
+        found, tenant = tenant_cache.peek(tenant_id)
+        if not found:
+            tenant = tenant_cache.get(tenant_id)
+        return tier_label(tenant.subscription_tier if tenant else None)
+    except Exception:
+        return "unknown"
+
+def _start_request():
+    if not registry.enabled:
+        return
+    g.metrics_start = time.perf_counter()
+    _request_db.set([0, 0.0])
+
+def _record_request(response):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    queries, db_time = _request_db.get() or (0, 0.0)
+    _request_db.set(None)
+    # La plantilla de la ruta (no la URL) mantiene acotadas las etiquetas
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    tier = _tenant_tier()
+    http_request_duration.observe(elapsed, endpoint=endpoint, method=request.method,
+                                  status=response.status_code, tier=tier)
+    db_queries_per_request.observe(queries, endpoint=endpoint, tier=tier)
+    db_time_per_request.observe(db_time, endpoint=endpoint, tier=tier)
+    return response
+
+def metrics_view():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+def _cache_collector():
+    from app.auth import claims_cache
+    from app.tenant_cache import tenant_cache
+    stats = tenant_cache.stats()
+    yield ("tenant_cache_lookups_total", "counter", "Tenant cache lookups by result", [
+        ('{result="hit"}', stats["hits"]),
+        ('{result="negative_hit"}', stats["negative_hits"]),
+        ('{result="miss"}', stats["misses"]),
+    ])
+    yield ("tenant_cache_entries", "gauge", "Tenants currently cached in this worker", [("", stats["size"])])
+    yield ("jwt_claims_cache_lookups_total", "counter", "Verified-claims cache lookups by result", [
+        ('{result="hit"}', claims_cache.hits),
+        ('{result="miss"}', claims_cache.misses),
+    ])
+
+def init_metrics(app):
+    """Register request timing hooks, the SQLAlchemy listeners and GET /metrics
+
+    Call before any other before_request hook so the latency includes auth.
+    """
+    registry.enabled = app.config.get("METRICS_ENABLED", registry.enabled)
+    install_db_hooks()
+    if _cache_collector not in registry._collectors:
+        registry.register_collector(_cache_collector)
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
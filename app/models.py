@@ -1,8 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 
 db = SQLAlchemy()
 
+# JSON genérico; en PostgreSQL JSONB (binario, indexable con GIN)
+JsonDocument = db.JSON().with_variant(JSONB(), "postgresql")
+
 class Tenant(db.Model):
     __tablename__ = "tenants"
     id = db.Column(db.Integer, primary_key=True)
@@ -20,14 +24,58 @@ class UserProfile(db.Model):
     name = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class Upload(db.Model):
+    __tablename__ = "uploads"
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(64), index=True, nullable=False)
+    s3_key = db.Column(db.String(512), unique=True, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    sha256 = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class LabResult(db.Model):
+    # En PostgreSQL particionada por mes sobre created_at (migración 981228c0cf3a, app/partitions.py);
+    # los índices de abajo son locales a cada partición
     __tablename__ = "lab_results"
     id = db.Column(db.Integer, primary_key=True)
-    tenant_id = db.Column(db.String(64), index=True, nullable=False)
+    tenant_id = db.Column(db.String(64), nullable=False)
     patient_id = db.Column(db.String(128), nullable=False)
     test_code = db.Column(db.String(50))
-    test_data = db.Column(db.JSON)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    test_data = db.Column(JsonDocument)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        # Paginación keyset de resultados por paciente: WHERE tenant, patient ORDER BY created_at, id
+        db.Index("ix_lab_results_tenant_patient_created", "tenant_id", "patient_id", "created_at", "id"),
+        # Exportación por tenant: WHERE tenant, created_at >= since ORDER BY created_at, id
+        db.Index("ix_lab_results_tenant_created", "tenant_id", "created_at", "id"),
+        # Búsqueda por test_code y rango de fechas
+        db.Index("ix_lab_results_tenant_test_created", "tenant_id", "test_code", "created_at", "id"),
+        # Búsqueda por contenido (test_data @> '{...}'); solo PostgreSQL
+        db.Index("ix_lab_results_test_data", "test_data", postgresql_using="gin",
+                 postgresql_ops={"test_data": "jsonb_path_ops"}).ddl_if(dialect="postgresql"),
+    )
+
+class ResultAnalyte(db.Model):
+    """Numeric values of LabResult.test_data, extracted at ingest for range searches"""
+    __tablename__ = "result_analytes"
+    id = db.Column(db.Integer, primary_key=True)
+    # Sin FK: lab_results particionada no admite una FK solo sobre id; se borra al archivar
+    result_id = db.Column(db.Integer, nullable=False)
+    tenant_id = db.Column(db.String(64), nullable=False)
+    patient_id = db.Column(db.String(128), nullable=False)
+    test_code = db.Column(db.String(50))
+    analyte = db.Column(db.String(64), nullable=False)  # clave de test_data ("value" -> test_code), en minúsculas
+    value = db.Column(db.Float, nullable=False)
+    observed_at = db.Column(db.DateTime, nullable=False)  # created_at del resultado
+
+    __table_args__ = (
+        # WHERE tenant, analyte, observed_at BETWEEN, value > x ORDER BY observed_at, result_id:
+        # el resto de columnas va en el índice para que la búsqueda no toque la tabla
+        db.Index("ix_result_analytes_search", "tenant_id", "analyte", "observed_at", "result_id",
+                 "value", "patient_id", "test_code"),
+        db.Index("ix_result_analytes_result", "result_id"),
+    )
 
 class TenantUsage(db.Model):
     __tablename__ = "tenant_usage"
@@ -36,3 +84,64 @@ class TenantUsage(db.Model):
     results_processed = db.Column(db.Integer, default=0)
     api_calls = db.Column(db.Integer, default=0)
     storage_bytes = db.Column(db.BigInteger, default=0)
+    # Se incrementa en cada flush de contadores; las facturas abiertas lo comparan
+    version = db.Column(db.Integer, default=0, nullable=False, server_default="0")
+
+# Montos con 12 decimales: bytes/1e9 * tarifa * IVA se guarda sin redondeo
+Money = db.Numeric(24, 12)
+
+class Invoice(db.Model):
+    __tablename__ = "invoices"
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(64), nullable=False)
+    month = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default="open")  # open | closed
+    usage_version = db.Column(db.Integer, nullable=False, default=0)
+    company_name = db.Column(db.String(200))
+    subscription_tier = db.Column(db.String(50))
+    subtotal = db.Column(Money, nullable=False)
+    tax = db.Column(Money, nullable=False)
+    total = db.Column(Money, nullable=False)
+    currency = db.Column(db.String(3), default="USD")
+    invoice_date = db.Column(db.Date)
+    due_date = db.Column(db.Date)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    items = db.relationship("InvoiceLineItem", order_by="InvoiceLineItem.position",
+                            cascade="all, delete-orphan", lazy="selectin")
+
+    __table_args__ = (
+        db.UniqueConstraint("tenant_id", "month", name="uq_invoices_tenant_month"),
+        db.Index("ix_invoices_month", "month"),
+    )
+
+class InvoiceLineItem(db.Model):
+    __tablename__ = "invoice_line_items"
+    id = db.Column(db.Integer, primary_key=True)
+    invoice_id = db.Column(db.Integer, db.ForeignKey("invoices.id", ondelete="CASCADE"), index=True, nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    description = db.Column(db.String(300))
+    quantity = db.Column(Money)
+    unit_price = db.Column(Money)
+    total = db.Column(Money)
+
+class ProvisioningJob(db.Model):
+    __tablename__ = "provisioning_jobs"
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(64), nullable=False)
+    kind = db.Column(db.String(32), nullable=False)  # tenant | registration
+    status = db.Column(db.String(16), nullable=False, default="queued")  # queued | running | done | failed
+    payload = db.Column(db.JSON)
+    result = db.Column(db.JSON)  # salida de cada paso ya completado
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint("tenant_id", "kind", name="uq_provisioning_jobs_tenant_kind"),
+        db.Index("ix_provisioning_jobs_status", "status"),
+    )
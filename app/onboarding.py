@@ -0,0 +1,221 @@
+# onboarding.py - alta masiva de tenants y usuarios (CSV/NDJSON)
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from sqlalchemy import func
+from app.models import db, Tenant
+from app.tenant_cache import tenant_cache
+from app.aws import get_client
+from app.tenant_registration import generate_temp_password
+
+logger = logging.getLogger(__name__)
+
+ONBOARDING_CONCURRENCY = int(os.getenv("ONBOARDING_CONCURRENCY", "8"))
+ONBOARDING_MAX_RETRIES = int(os.getenv("ONBOARDING_MAX_RETRIES", "6"))
+ONBOARDING_BACKOFF = float(os.getenv("ONBOARDING_BACKOFF", "0.5"))
+TENANT_UPSERT_CHUNK = 1000
+# Solo para tenants nuevos: un tenant existente sin tier en el archivo conserva el suyo
+DEFAULT_SUBSCRIPTION_TIER = "professional"
+
+THROTTLING_CODES = ("TooManyRequestsException", "ThrottlingException", "LimitExceededException",
+                    "RequestLimitExceeded")
+
+def read_records(path):
+    """Rows of a .csv (header row) or .ndjson/.jsonl file as dicts"""
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            return [{k: v for k, v in row.items() if v not in (None, "")} for row in csv.DictReader(f)]
+        return [json.loads(line) for line in f if line.strip()]
+
+def collect_tenants(tenant_rows, user_rows):
+    """One entry per tenant_id; tenant rows win over tenant fields repeated on user rows
+
+    Fields missing from every row stay None, so the upsert keeps the stored value.
+    """
+    tenants = {}
+    for row in list(user_rows) + list(tenant_rows):
+        tenant_id = row.get("tenant_id")
+        if not tenant_id:
+            continue
+        current = tenants.setdefault(tenant_id, {"tenant_id": tenant_id, "company_name": None,
+                                                 "subscription_tier": None})
+        for field in ("company_name", "subscription_tier"):
+            if row.get(field):
+                current[field] = row[field]
+    return list(tenants.values())
+
+def _upsert_tenants_statement(dialect_name, rows, keep_tier=False):
+    """INSERT ... ON CONFLICT (tenant_id) DO UPDATE company_name/subscription_tier
+
+    A None company_name or subscription_tier keeps the stored value; with keep_tier the
+    tier in rows is only the one new tenants are inserted with.
+    """
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Tenant upsert not supported on {dialect_name}")
+    table = Tenant.__table__
+    stmt = insert(table).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.tenant_id],
+        set_={
+            # Un alta sin company_name o sin tier no borra el valor existente
+            "company_name": func.coalesce(stmt.excluded.company_name, table.c.company_name),
+            "subscription_tier": table.c.subscription_tier if keep_tier else
+                                 func.coalesce(stmt.excluded.subscription_tier, table.c.subscription_tier)
+        }
+    )
+
+def upsert_tenants(tenants):
+    """Upsert all tenants with multi-row statements per chunk; returns the number of rows sent"""
+    now = datetime.utcnow()
+    rows = [dict(tenant, created_at=now) for tenant in tenants]
+    dialect_name = db.engine.dialect.name
+    for i in range(0, len(rows), TENANT_UPSERT_CHUNK):
+        chunk = rows[i:i + TENANT_UPSERT_CHUNK]
+        with_tier = [row for row in chunk if row["subscription_tier"]]
+        # Sin tier: el valor por defecto va solo en el INSERT, nunca en el UPDATE de un tenant existente
+        without_tier = [dict(row, subscription_tier=DEFAULT_SUBSCRIPTION_TIER)
+                        for row in chunk if not row["subscription_tier"]]
+        if with_tier:
+            db.session.execute(_upsert_tenants_statement(dialect_name, with_tier))
+        if without_tier:
+            db.session.execute(_upsert_tenants_statement(dialect_name, without_tier, keep_tier=True))
+    tenant_cache.notify(*(row["tenant_id"] for row in rows))
+    db.session.commit()
+    return len(rows)
+
+def _error_code(error):
+    return getattr(error, "response", {}).get("Error", {}).get("Code")
+
+def create_cognito_user(cognito, user_pool_id, user, max_retries=ONBOARDING_MAX_RETRIES,
+                        backoff=ONBOARDING_BACKOFF, sleep=time.sleep):
+    """admin_create_user with exponential backoff on throttling; returns a results entry"""
+    email = user["email"]
+    temp_password = user.get("temp_password") or generate_temp_password()
+    attributes = [
+        {"Name": "email", "Value": email},
+        {"Name": "email_verified", "Value": "True"},
+        {"Name": "custom:tenant_id", "Value": user["tenant_id"]}
+    ]
+    if user.get("name"):
+        attributes.append({"Name": "name", "Value": user["name"]})
+    entry = {"email": email, "tenant_id": user["tenant_id"]}
+    attempt = 0
+    while True:
+        try:
+            cognito.admin_create_user(
+                UserPoolId=user_pool_id,
+                Username=email,
+                TemporaryPassword=temp_password,
+                MessageAction="SUPPRESS",
+                UserAttributes=attributes
+            )
+            return dict(entry, status="created", temp_password=temp_password, attempts=attempt + 1)
+        except Exception as e:
+            code = _error_code(e)
+            if code == "UsernameExistsException":
+                return dict(entry, status="exists", attempts=attempt + 1)
+            if code in THROTTLING_CODES and attempt < max_retries:
+                # Full jitter: los hilos no reintentan todos al mismo tiempo
+                sleep(random.uniform(0, backoff * 2 ** attempt))
+                attempt += 1
+                continue
+            return dict(entry, status="failed", error=f"{code or type(e).__name__}: {e}", attempts=attempt + 1)
+
+def _read_results(path):
+    done = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    if entry.get("status") in ("created", "exists"):
+                        done[entry["email"].lower()] = entry
+    return done
+
+def onboard(tenant_rows, user_rows, cognito, user_pool_id, results_path,
+            concurrency=ONBOARDING_CONCURRENCY, create_user=create_cognito_user):
+    """Upsert tenants, then create Cognito users on a bounded pool, appending to results_path
+
+    Users already created in a previous run (per results_path) are skipped, so an
+    interrupted run can be resumed with the same command.
+    """
+    started = time.perf_counter()
+    tenants = collect_tenants(tenant_rows, user_rows)
+    if tenants:
+        upsert_tenants(tenants)
+
+    done = _read_results(results_path)
+    pending, seen = [], set()
+    for user in user_rows:
+        email = (user.get("email") or "").lower()
+        if not email or not user.get("tenant_id") or email in done or email in seen:
+            continue
+        seen.add(email)
+        pending.append(user)
+    logger.info(f"Onboarding {len(tenants)} tenants, {len(pending)} users "
+                f"({len(done)} already done) with concurrency {concurrency}")
+
+    counts = {"created": 0, "exists": 0, "failed": 0}
+    failures = []
+    if pending:
+        fd = os.open(results_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="onboarding") as pool, \
+                os.fdopen(fd, "a") as results:
+            futures = [pool.submit(create_user, cognito, user_pool_id, user) for user in pending]
+            for future in as_completed(futures):
+                entry = future.result()
+                # Solo el hilo principal escribe el archivo de resultados
+                results.write(json.dumps(entry) + "\n")
+                results.flush()
+                counts[entry["status"]] += 1
+                if entry["status"] == "failed":
+                    failures.append(entry)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "tenants": len(tenants),
+        "users": len(pending),
+        "skipped": len(done),
+        **counts,
+        "failures": failures,
+        "concurrency": concurrency,
+        "duration_seconds": round(elapsed, 3),
+        "results_file": results_path
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk onboard tenants and Cognito users from CSV/NDJSON")
+    parser.add_argument("--tenants", help="tenants file: tenant_id, company_name, subscription_tier")
+    parser.add_argument("--users", help="users file: tenant_id, email, name, temp_password (optional)")
+    parser.add_argument("--results", default="onboarding_results.ndjson", help="resumable results file")
+    parser.add_argument("--concurrency", type=int, default=ONBOARDING_CONCURRENCY)
+    parser.add_argument("--user-pool-id", default=os.getenv("COGNITO_POOL_ID") or os.getenv("COGNITO_USER_POOL_ID"))
+    args = parser.parse_args(argv)
+    if not args.tenants and not args.users:
+        parser.error("--tenants and/or --users is required")
+    if args.users and not args.user_pool_id:
+        parser.error("--user-pool-id (or COGNITO_POOL_ID) is required to create users")
+
+    from app import app
+    tenant_rows = read_records(args.tenants) if args.tenants else []
+    user_rows = read_records(args.users) if args.users else []
+    cognito = get_client("cognito-idp", region_name=os.getenv("AWS_REGION", "us-east-2"))
+    with app.app_context():
+        stats = onboard(tenant_rows, user_rows, cognito, args.user_pool_id, args.results,
+                        concurrency=args.concurrency)
+    print(json.dumps(stats, indent=2))
+    return 1 if stats["failed"] else 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
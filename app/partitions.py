@@ -0,0 +1,159 @@
+# partitions.py - particiones mensuales de lab_results (PostgreSQL) y archivo a S3
+import argparse
+import json
+import logging
+import os
+import re
+from datetime import date
+from sqlalchemy import delete, text
+from app.config import S3_BUCKET
+from app.archive import add_months, result_rows, store_month
+from app.models import db, ResultAnalyte
+
+logger = logging.getLogger(__name__)
+
+# Meses futuros que deben existir siempre (los inserts nunca caen en la partición DEFAULT)
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# Meses que se quedan en la base; los anteriores se archivan en S3 y se eliminan
+PARTITION_KEEP_MONTHS = int(os.getenv("PARTITION_KEEP_MONTHS", "24"))
+
+_PARTITION_NAME = re.compile(r"^lab_results_y(\d{4})m(\d{2})$")
+
+def partition_name(month):
+    return f"lab_results_y{month:%Y}m{month:%m}"
+
+def partition_month(name):
+    """First day of the month of a partition name, None for other tables"""
+    match = _PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+def is_partitioned():
+    if db.engine.dialect.name != "postgresql":
+        return False
+    return db.session.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'lab_results' AND pg_table_is_visible(c.oid)"
+    )).first() is not None
+
+def list_partitions():
+    """Monthly partitions of lab_results, attached or detached but not yet archived, oldest first"""
+    if not is_partitioned():
+        return []
+    rows = db.session.execute(text(r"""
+        SELECT c.relname, i.inhrelid IS NOT NULL AS attached, greatest(c.reltuples, 0)::bigint AS estimated_rows
+        FROM pg_class c
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+        WHERE c.relkind = 'r' AND c.relname LIKE 'lab\_results\_y%' AND pg_table_is_visible(c.oid)
+    """)).all()
+    partitions = [
+        {"name": name, "month": partition_month(name), "attached": attached, "estimated_rows": estimated}
+        for name, attached, estimated in rows if partition_month(name)
+    ]
+    return sorted(partitions, key=lambda p: p["month"])
+
+def ensure_partitions(months_ahead=PARTITION_MONTHS_AHEAD, today=None):
+    """Create the partitions of the current month and the next months_ahead; returns the names created"""
+    if not is_partitioned():
+        logger.info("lab_results is not partitioned (run flask db upgrade on PostgreSQL); nothing to do")
+        return []
+    existing = {p["name"] for p in list_partitions()}
+    current = (today or date.today()).replace(day=1)
+    created = []
+    for n in range(months_ahead + 1):
+        month = add_months(current, n)
+        name = partition_name(month)
+        if name in existing:
+            continue
+        # Falla si la partición DEFAULT ya tiene filas de ese mes: hay que moverlas a mano
+        db.session.execute(text(
+            f"CREATE TABLE {name} PARTITION OF lab_results "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+        created.append(name)
+    db.session.commit()
+    if created:
+        logger.info(f"Created partitions: {', '.join(created)}")
+    return created
+
+def archive_partition(month, bucket=None, today=None):
+    """Detach one monthly partition, copy it to S3 per tenant, verify row counts and drop it
+
+    Safe to re-run: a partition left detached by a failed run is picked up again, and
+    the table is only dropped once every tenant's file has been verified and recorded in
+    its manifest. Months already archived per tenant by app.archive are extended, not replaced.
+    """
+    bucket = bucket or S3_BUCKET
+    if month >= (today or date.today()).replace(day=1):
+        raise ValueError("Only past months can be archived")
+    name = partition_name(month)
+    partition = next((p for p in list_partitions() if p["name"] == name), None)
+    if partition is None:
+        return None
+    if partition["attached"]:
+        db.session.execute(text(f"ALTER TABLE lab_results DETACH PARTITION {name}"))
+        db.session.commit()
+        logger.info(f"Detached {name}")
+
+    counts = dict(db.session.execute(text(f"SELECT tenant_id, count(*) FROM {name} GROUP BY tenant_id")).all())
+    objects = []
+    for tenant_id in sorted(counts):
+        entry = store_month(bucket, tenant_id, month, result_rows(name, tenant_id), counts[tenant_id])
+        objects.append({"tenant_id": tenant_id, "s3_uri": f"s3://{bucket}/{entry['key']}", "rows": entry["rows"],
+                        "size": entry["size"]})
+
+    db.session.execute(delete(ResultAnalyte).where(ResultAnalyte.observed_at >= month,
+                                                   ResultAnalyte.observed_at < add_months(month, 1)))
+    db.session.execute(text(f"DROP TABLE {name}"))
+    db.session.commit()
+    summary = {
+        "partition": name,
+        "month": month.isoformat(),
+        "tenants": len(objects),
+        "rows": sum(o["rows"] for o in objects),
+        "bytes": sum(o["size"] for o in objects),
+        "objects": objects
+    }
+    logger.info(f"Archived {name}: {summary['rows']} rows of {summary['tenants']} tenants, {summary['bytes']} bytes")
+    return summary
+
+def archive_old_partitions(keep_months=PARTITION_KEEP_MONTHS, bucket=None, today=None):
+    """Archive every partition older than the last keep_months months"""
+    cutoff = add_months((today or date.today()).replace(day=1), -keep_months)
+    return [archive_partition(p["month"], bucket, today) for p in list_partitions() if p["month"] < cutoff]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monthly partitions of lab_results (PostgreSQL)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="partitions and their estimated rows")
+    ensure = sub.add_parser("ensure", help="create the current and next months' partitions")
+    ensure.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    for name in ("archive", "maintain"):
+        cmd = sub.add_parser(name, help="archive old partitions to S3" if name == "archive" else "ensure + archive")
+        cmd.add_argument("--keep-months", type=int, default=PARTITION_KEEP_MONTHS)
+        cmd.add_argument("--bucket", default=S3_BUCKET)
+        if name == "archive":
+            cmd.add_argument("--month", help="YYYY-MM: archive only this month")
+        else:
+            cmd.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    args = parser.parse_args(argv)
+
+    from app import app
+    with app.app_context():
+        if args.command == "list":
+            out = [dict(p, month=p["month"].isoformat()) for p in list_partitions()]
+        elif args.command == "ensure":
+            out = {"created": ensure_partitions(args.months_ahead)}
+        elif args.command == "archive" and args.month:
+            from app.billing import parse_month
+            out = {"archived": [archive_partition(parse_month(args.month), args.bucket)]}
+        else:
+            out = {}
+            if args.command == "maintain":
+                out["created"] = ensure_partitions(args.months_ahead)
+            out["archived"] = archive_old_partitions(args.keep_months, args.bucket)
+    print(json.dumps(out, indent=2, default=str))
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
@@ -1,42 +1,86 @@
-import boto3
+import logging
+import re
+from sqlalchemy import text
+from app.aws import LazyClient
 from app.config import S3_BUCKET
+from app.models import db
 
-cognito = boto3.client("cognito-idp")
-rds = boto3.client("rds")
-apigw = boto3.client("apigatewayv2")
+logger = logging.getLogger(__name__)
 
-def provision_tenant(tenant_id):
-    # Step 1 — NO CREAR BUCKETS (todos usan el global)
+cognito = LazyClient("cognito-idp")
+rds = LazyClient("rds")
+apigw = LazyClient("apigatewayv2")
+
+def _find_user_pool(name):
+    kwargs = {"MaxResults": 60}
+    while True:
+        page = cognito.list_user_pools(**kwargs)
+        for pool in page.get("UserPools", []):
+            if pool.get("Name") == name:
+                return pool["Id"]
+        if not page.get("NextToken"):
+            return None
+        kwargs["NextToken"] = page["NextToken"]
+
+def _find_api(name):
+    kwargs = {}
+    while True:
+        page = apigw.get_apis(**kwargs)
+        for api in page.get("Items", []):
+            if api.get("Name") == name:
+                return api["ApiEndpoint"]
+        if not page.get("NextToken"):
+            return None
+        kwargs["NextToken"] = page["NextToken"]
 
-    # Step 2 — Crear un user pool POR TENANT (si lo necesitas)
-    user_pool = cognito.create_user_pool(
-        PoolName=f"tenant-{tenant_id}-pool"
-    )
+# Pasos idempotentes: siempre buscan primero lo que un intento anterior pudo crear (también
+# el primer intento de un job re-encolado, o uno que murió antes de guardar el resultado)
+def step_user_pool(tenant_id, payload=None):
+    name = f"tenant-{tenant_id}-pool"
+    existing = _find_user_pool(name)
+    if existing:
+        return existing
+    return cognito.create_user_pool(PoolName=name)["UserPool"]["Id"]
 
-    # Step 3 — Crear schema en PostgreSQL (no nuevo database)))))
+def step_schema(tenant_id, payload=None):
     create_schema_for_tenant(tenant_id)
+    return tenant_id
 
-    # Step 4 — Crear endpoint del tenant (subdominio o route)
-    resp = apigw.create_api(
-        Name=f"tenant-{tenant_id}-api",
-        ProtocolType="HTTP"
-    )
+def step_api(tenant_id, payload=None):
+    name = f"tenant-{tenant_id}-api"
+    existing = _find_api(name)
+    if existing:
+        return existing
+    return apigw.create_api(Name=name, ProtocolType="HTTP")["ApiEndpoint"]
 
-    api_endpoint = resp["ApiEndpoint"]
+# Step 1 — NO CREAR BUCKETS (todos usan el global)
+TENANT_STEPS = (
+    ("user_pool_id", step_user_pool),   # Step 2 — un user pool POR TENANT
+    ("schema", step_schema),            # Step 3 — schema en PostgreSQL (no nuevo database)
+    ("api_endpoint", step_api),         # Step 4 — endpoint del tenant
+)
 
+def provisioning_summary(tenant_id, result):
     return {
         "tenant_id": tenant_id,
-        "user_pool_id": user_pool["UserPool"]["Id"],
+        "user_pool_id": result.get("user_pool_id"),
         "s3_bucket": S3_BUCKET,     # SIEMPRE el mismo
-        "api_endpoint": api_endpoint
+        "api_endpoint": result.get("api_endpoint")
     }
 
+def provision_tenant(tenant_id):
+    """Run every provisioning step inline (the API enqueues a job instead, see provisioning_jobs)"""
+    result = {name: step(tenant_id) for name, step in TENANT_STEPS}
+    return provisioning_summary(tenant_id, result)
+
 
 def create_schema_for_tenant(tenant_id):
-    import psycopg2
-    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-    cur = conn.cursor()
-    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {tenant_id};")
-    conn.commit()
-    cur.close()
-    conn.close()
+    """CREATE SCHEMA for the tenant through the app's pooled engine (PostgreSQL only)"""
+    if not re.fullmatch(r"[A-Za-z0-9_]+", tenant_id or ""):
+        raise ValueError(f"Invalid tenant_id for a schema name: {tenant_id!r}")
+    if db.engine.dialect.name != "postgresql":
+        logger.info(f"Skipping schema for {tenant_id}: {db.engine.dialect.name} has no schemas")
+        return
+    schema = db.engine.dialect.identifier_preparer.quote_identifier(tenant_id)
+    with db.engine.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema}"))
@@ -0,0 +1,263 @@
+# provisioning_jobs.py - cola persistente de aprovisionamiento de tenants
+from app.models import db, ProvisioningJob
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import update
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+# payload: hasta cuándo el job es solo del worker que tiene sus secretos en memoria
+SECRETS_UNTIL = "secrets_until"
+
+def job_steps(kind):
+    """(name, step) pairs of a job kind; each step is step(tenant_id, payload) -> value"""
+    if kind == "tenant":
+        from app.provisioner import TENANT_STEPS
+        return TENANT_STEPS
+    if kind == "registration":
+        from app.tenant_registration import step_admin_user
+        return (("admin_user", step_admin_user),)
+    raise ValueError(f"Unknown provisioning job kind: {kind}")
+
+def _secrets_pending(payload, now):
+    until = (payload or {}).get(SECRETS_UNTIL)
+    return until is not None and datetime.fromisoformat(until) > now
+
+def job_to_dict(job):
+    return {
+        "id": job.id,
+        "tenant_id": job.tenant_id,
+        "kind": job.kind,
+        "status": job.status,
+        "steps": [name for name, _ in job_steps(job.kind)],
+        "completed_steps": sorted((job.result or {}).keys()),
+        "result": job.result or {},
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+class ProvisioningQueue:
+    """Provisioning jobs persisted in provisioning_jobs and run on a background thread pool
+
+    Requests only insert a queued row. A worker claims it with a conditional UPDATE (so
+    a job runs once even with several gunicorn workers), runs the steps not yet in
+    job.result and retries with exponential backoff. start() (gunicorn post_worker_init)
+    sweeps every sweep_interval seconds, so jobs left queued or running by a recycled
+    worker are picked up again. With workers=0 nothing runs in the background and
+    run_pending() has to be called (tests, or `python -m app.provisioning_jobs` from cron).
+
+    Secrets (the registration's temporary password) stay in this process's memory and
+    never reach provisioning_jobs.payload. Other workers and run_pending() leave such a
+    job to the worker holding them for secret_grace seconds; after that (the worker died)
+    it runs without them and the step's fallback applies.
+    """
+
+    def __init__(self, workers=2, max_attempts=3, retry_delay=2.0, lease=600, sweep_interval=60.0,
+                 secret_grace=300.0):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self.sweep_interval = sweep_interval
+        self.secret_grace = secret_grace
+        self._app = None
+        self._executor = None
+        self._pid = None
+        self._sweeper = None
+        self._sweeper_pid = None
+        self._secrets = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self._app = app
+        self.workers = app.config.get("PROVISIONING_WORKERS", self.workers)
+        self.max_attempts = app.config.get("PROVISIONING_MAX_ATTEMPTS", self.max_attempts)
+        self.retry_delay = app.config.get("PROVISIONING_RETRY_DELAY", self.retry_delay)
+        self.sweep_interval = app.config.get("PROVISIONING_SWEEP_INTERVAL", self.sweep_interval)
+        self.secret_grace = app.config.get("PROVISIONING_SECRET_GRACE", self.secret_grace)
+
+    def _get_executor(self):
+        # Después de un fork (gunicorn --preload) los hilos del pool no existen en el hijo
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="provisioning")
+            return self._executor
+
+    def enqueue(self, tenant_id, kind="tenant", payload=None, secrets=None):
+        """Create (or re-queue a failed) job and hand it to the pool; returns the job
+
+        secrets are merged into the payload the steps see but are kept in memory only,
+        and only when this process has a pool to run the job (see holds_secrets).
+        """
+        job = ProvisioningJob.query.filter_by(tenant_id=tenant_id, kind=kind).first()
+        if job is None:
+            job = ProvisioningJob(tenant_id=tenant_id, kind=kind, status="queued", payload=payload or {}, result={})
+            db.session.add(job)
+        elif job.status == "failed":
+            job.status = "queued"
+            job.error = None
+            job.attempts = 0
+        keep_secrets = bool(secrets) and job.status == "queued" and self._app is not None and self.workers > 0
+        if keep_secrets:
+            until = datetime.utcnow() + timedelta(seconds=self.secret_grace)
+            job.payload = dict(job.payload or {}, **{SECRETS_UNTIL: until.isoformat()})
+        db.session.commit()
+        if keep_secrets:
+            with self._lock:
+                self._secrets[job.id] = dict(secrets)
+        if job.status == "queued":
+            self.submit(job.id)
+        return job
+
+    def holds_secrets(self, job_id):
+        """True if this process keeps the job's secrets and will be the one to run it"""
+        with self._lock:
+            return job_id in self._secrets
+
+    def submit(self, job_id):
+        if self._app is None or self.workers <= 0:
+            return None
+        return self._get_executor().submit(self._run_in_context, job_id)
+
+    def _run_in_context(self, job_id):
+        with self._app.app_context():
+            try:
+                return self.run_job(job_id)
+            finally:
+                db.session.remove()
+
+    def _claim(self, job_id):
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(ProvisioningJob)
+            .where(ProvisioningJob.id == job_id, ProvisioningJob.status == "queued")
+            .values(status="running", started_at=now, updated_at=now)
+        ).rowcount
+        db.session.commit()
+        return claimed == 1
+
+    def run_job(self, job_id):
+        """Run a queued job to completion; returns its final status (None if another worker has it)"""
+        if not self._claim(job_id):
+            return None
+        job = db.session.get(ProvisioningJob, job_id)
+        steps = job_steps(job.kind)
+        with self._lock:
+            secrets = self._secrets.get(job_id, {})
+        while True:
+            job.attempts += 1
+            db.session.commit()
+            try:
+                for name, step in steps:
+                    if name in (job.result or {}):
+                        continue
+                    value = step(job.tenant_id, dict(job.payload or {}, **secrets))
+                    # Guardar cada paso al terminarlo: un reintento no lo repite
+                    job.result = dict(job.result or {}, **{name: value})
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                job.error = f"{type(e).__name__}: {e}"
+                if job.attempts < self.max_attempts:
+                    delay = self.retry_delay * 2 ** (job.attempts - 1)
+                    logger.warning(f"Provisioning {job.kind} for {job.tenant_id} failed "
+                                   f"(attempt {job.attempts}), retrying in {delay:.1f}s: {e}")
+                    db.session.commit()
+                    time.sleep(delay)
+                    continue
+                job.status = "failed"
+                job.finished_at = datetime.utcnow()
+                self._forget_secrets(job)
+                db.session.commit()
+                logger.error(f"❌ Provisioning {job.kind} for {job.tenant_id} failed: {e}")
+                return job.status
+            job.status = "done"
+            job.error = None
+            job.finished_at = datetime.utcnow()
+            self._forget_secrets(job)
+            db.session.commit()
+            logger.info(f"✅ Provisioning {job.kind} for {job.tenant_id} done in {job.attempts} attempt(s)")
+            return job.status
+
+    def _forget_secrets(self, job):
+        with self._lock:
+            self._secrets.pop(job.id, None)
+        # temp_password: jobs encolados por versiones que guardaban la contraseña en el payload
+        if {"temp_password", SECRETS_UNTIL} & set(job.payload or {}):
+            job.payload = {k: v for k, v in job.payload.items() if k not in ("temp_password", SECRETS_UNTIL)}
+
+    def _queued_ids(self):
+        """Re-queue jobs whose worker died (lease expired); returns the ids of the queued jobs this
+        process may run (not those another worker holds secrets for, until secret_grace passes)"""
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.lease)
+        db.session.execute(
+            update(ProvisioningJob)
+            .where(ProvisioningJob.status == "running", ProvisioningJob.updated_at < stale)
+            .values(status="queued")
+        )
+        db.session.commit()
+        with self._lock:
+            held = set(self._secrets)
+        queued = db.session.query(ProvisioningJob.id, ProvisioningJob.payload) \
+            .filter_by(status="queued").order_by(ProvisioningJob.id)
+        return [job_id for job_id, payload in queued if job_id in held or not _secrets_pending(payload, now)]
+
+    def run_pending(self):
+        """Run every queued job (and the ones whose worker died) inline; returns how many ran"""
+        return sum(1 for job_id in self._queued_ids() if self.run_job(job_id))
+
+    def sweep(self):
+        """Hand every queued job (and the ones whose worker died) to the pool; returns how many"""
+        job_ids = self._queued_ids()
+        for job_id in job_ids:
+            # Si ya estaba en el pool, el segundo _claim no lo encuentra en queued
+            self.submit(job_id)
+        return len(job_ids)
+
+    def start(self):
+        """Start the periodic sweep in this worker (gunicorn post_worker_init, see gunicorn.conf.py)"""
+        if self._app is None or self.workers <= 0:
+            return
+        with self._lock:
+            if self._sweeper is not None and self._sweeper_pid == os.getpid() and self._sweeper.is_alive():
+                return
+            self._sweeper_pid = os.getpid()
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="provisioning-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            with self._app.app_context():
+                try:
+                    count = self.sweep()
+                    if count:
+                        logger.info(f"Provisioning sweep: {count} queued job(s) submitted")
+                except Exception as e:
+                    logger.error(f"Provisioning sweep failed: {e}")
+                finally:
+                    db.session.remove()
+            time.sleep(self.sweep_interval)
+
+provisioning_queue = ProvisioningQueue()
+
+def main():
+    """Run the queued provisioning jobs once (cron, or deploys with PROVISIONING_WORKERS=0)"""
+    from app import app
+    with app.app_context():
+        count = provisioning_queue.run_pending()
+    print(f"{count} provisioning job(s) run")
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
@@ -0,0 +1,229 @@
+# query_inspector.py - detector de N+1 y consultas lentas (desarrollo / staging)
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+QUERY_INSPECTOR = os.getenv("QUERY_INSPECTOR", "false").lower() in ("1", "true", "yes")
+# Una misma sentencia más de N veces en un request se marca como posible N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+REPORT_HEADER = "X-Query-Report"
+
+_SQL_LENGTH = 300
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)"
+_IN_LIST = re.compile(r"\bIN\s*\(\s*" + _PLACEHOLDER + r"(?:\s*,\s*" + _PLACEHOLDER + r")+\s*\)", re.IGNORECASE)
+# Una fila de VALUES; admite los placeholders %(nombre)s de psycopg2
+_ROW = r"\((?:[^()]|\(\w+\))*\)"
+_VALUES_ROWS = re.compile(r"(VALUES\s*" + _ROW + r")(?:\s*,\s*" + _ROW + r")+", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+_SELECT_LIST = re.compile(r"^SELECT (?:DISTINCT )?.*? FROM ", re.IGNORECASE)
+_SAVEPOINT = "query_inspector_explain"
+
+def normalize_sql(statement):
+    """Collapse literals, IN lists and multi-row VALUES so equivalent statements group together"""
+    sql = _STRING.sub("?", statement)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (?, ...)", sql)
+    sql = _VALUES_ROWS.sub(r"\1, ...", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+def _endpoint():
+    # Plantilla de la ruta, no la URL: agrupa /api/v1/results/<id> en una sola entrada
+    return f"{request.method} {request.url_rule.rule if request.url_rule is not None else 'unmatched'}"
+
+def _short(sql, length=_SQL_LENGTH):
+    # La lista de columnas no ayuda a encontrar un N+1: basta con la tabla y el WHERE
+    sql = _SELECT_LIST.sub("SELECT ... FROM ", sql, count=1)
+    return sql if len(sql) <= length else sql[:length] + "..."
+
+def explain(conn, statement, parameters):
+    """Plan of a SELECT through a separate DBAPI cursor (does not pass through SQLAlchemy events)
+
+    Runs inside a SAVEPOINT: on PostgreSQL a failed EXPLAIN would otherwise abort the
+    request's transaction and the view's next statement would fail.
+    """
+    if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    sqlite = conn.dialect.name == "sqlite"
+    prefix = "EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN "
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        # En SQLite un error no aborta la transacción (y SAVEPOINT abriría una)
+        if not sqlite:
+            cursor.execute(f"SAVEPOINT {_SAVEPOINT}")
+        cursor.execute(prefix + statement, parameters)
+        plan = [" ".join(str(col) for col in row) for row in cursor.fetchall()]
+        if not sqlite:
+            cursor.execute(f"RELEASE SAVEPOINT {_SAVEPOINT}")
+        return plan
+    except Exception as e:
+        if not sqlite:
+            try:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {_SAVEPOINT}")
+                cursor.execute(f"RELEASE SAVEPOINT {_SAVEPOINT}")
+            except Exception as rollback_error:
+                logger.warning(f"Could not roll back the EXPLAIN savepoint: {rollback_error}")
+        return [f"EXPLAIN failed: {e}"]
+    finally:
+        cursor.close()
+
+class QueryInspector:
+    """Groups each request's SQL by normalized statement and flags repeats and slow queries
+
+    Opt-in (QUERY_INSPECTOR=true): adds the X-Query-Report header to every response and
+    keeps a bounded summary per endpoint for GET /admin/queries.
+    """
+
+    def __init__(self, repeat_threshold=QUERY_REPEAT_THRESHOLD, slow_ms=SLOW_QUERY_MS, max_endpoints=200):
+        self.repeat_threshold = repeat_threshold
+        self.slow_ms = slow_ms
+        self.max_endpoints = max_endpoints
+        self.enabled = False
+        self._current = ContextVar("query_inspector_request", default=None)
+        self._lock = threading.Lock()
+        self._endpoints = OrderedDict()
+        self._slow = deque(maxlen=50)
+
+    def init_app(self, app):
+        self.repeat_threshold = app.config.get("QUERY_REPEAT_THRESHOLD", self.repeat_threshold)
+        self.slow_ms = app.config.get("SLOW_QUERY_MS", self.slow_ms)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        if app.config.get("QUERY_INSPECTOR", QUERY_INSPECTOR):
+            self.enable()
+
+    def enable(self):
+        if not event.contains(Engine, "before_cursor_execute", self._before):
+            event.listen(Engine, "before_cursor_execute", self._before)
+            event.listen(Engine, "after_cursor_execute", self._after)
+        self.enabled = True
+
+    def disable(self):
+        if event.contains(Engine, "before_cursor_execute", self._before):
+            event.remove(Engine, "before_cursor_execute", self._before)
+            event.remove(Engine, "after_cursor_execute", self._after)
+        self.enabled = False
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_inspector_start", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_inspector_start")
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+        current = self._current.get()
+        if current is None:
+            return
+        sql = normalize_sql(statement)
+        entry = current["statements"].get(sql)
+        if entry is None:
+            entry = current["statements"][sql] = {"count": 0, "time_ms": 0.0}
+        entry["count"] += 1
+        entry["time_ms"] += elapsed_ms
+        if elapsed_ms >= self.slow_ms:
+            plan = None if executemany else explain(conn, statement, parameters)
+            slow = {"sql": _short(sql), "time_ms": round(elapsed_ms, 2), "plan": plan}
+            current["slow"].append(slow)
+            logger.warning(f"Slow query ({elapsed_ms:.1f} ms) in {current['endpoint']}: {_short(sql)}"
+                           + (f"\n  plan: {' | '.join(plan)}" if plan else ""))
+
+    def _start_request(self):
+        if self.enabled:
+            self._current.set({"statements": {}, "slow": [], "endpoint": _endpoint()})
+
+    def report(self, current):
+        statements = current["statements"]
+        repeated = sorted(
+            ({"sql": _short(sql), "count": e["count"], "time_ms": round(e["time_ms"], 2)}
+             for sql, e in statements.items() if e["count"] > self.repeat_threshold),
+            key=lambda e: -e["count"]
+        )
+        return {
+            "queries": sum(e["count"] for e in statements.values()),
+            "distinct": len(statements),
+            "time_ms": round(sum(e["time_ms"] for e in statements.values()), 2),
+            "repeated": repeated,
+            "slow": current["slow"]
+        }
+
+    def _finish_request(self, response):
+        current = self._current.get()
+        if current is None:
+            return response
+        self._current.set(None)
+        endpoint = current["endpoint"]
+        report = self.report(current)
+        if report["repeated"]:
+            logger.warning(f"Possible N+1 in {endpoint}: " + "; ".join(
+                f"{e['count']}x {e['sql']}" for e in report["repeated"]))
+        self._record(endpoint, report)
+        # Cabecera compacta: sin planes ni SQL completo
+        header = {
+            "queries": report["queries"],
+            "distinct": report["distinct"],
+            "time_ms": report["time_ms"],
+            "repeated": [{"sql": _short(e["sql"], 160), "count": e["count"]} for e in report["repeated"][:3]],
+            "slow": len(report["slow"])
+        }
+        response.headers[REPORT_HEADER] = json.dumps(header, separators=(",", ":"))
+        return response
+
+    def _record(self, endpoint, report):
+        with self._lock:
+            summary = self._endpoints.get(endpoint)
+            if summary is None:
+                if len(self._endpoints) >= self.max_endpoints:
+                    self._endpoints.popitem(last=False)
+                summary = self._endpoints[endpoint] = {"requests": 0, "queries": 0, "max_queries": 0,
+                                                       "flagged_requests": 0, "repeated": {}}
+            summary["requests"] += 1
+            summary["queries"] += report["queries"]
+            summary["max_queries"] = max(summary["max_queries"], report["queries"])
+            if report["repeated"]:
+                summary["flagged_requests"] += 1
+                for entry in report["repeated"]:
+                    summary["repeated"][entry["sql"]] = max(summary["repeated"].get(entry["sql"], 0), entry["count"])
+            for slow in report["slow"]:
+                self._slow.append(dict(slow, endpoint=endpoint, at=time.time()))
+
+    def summary(self):
+        with self._lock:
+            endpoints = {
+                endpoint: {
+                    "requests": s["requests"],
+                    "avg_queries": round(s["queries"] / s["requests"], 2),
+                    "max_queries": s["max_queries"],
+                    "flagged_requests": s["flagged_requests"],
+                    "repeated": [{"sql": sql, "max_count": n} for sql, n in
+                                 sorted(s["repeated"].items(), key=lambda item: -item[1])]
+                }
+                for endpoint, s in self._endpoints.items()
+            }
+            slow = list(self._slow)
+        return {
+            "enabled": self.enabled,
+            "repeat_threshold": self.repeat_threshold,
+            "slow_ms": self.slow_ms,
+            "endpoints": endpoints,
+            "slow_queries": slow
+        }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._slow.clear()
+
+query_inspector = QueryInspector()
@@ -0,0 +1,249 @@
+# response_cache.py - caché de respuestas GET con ETag (memoria por worker o Redis compartido)
+from collections import OrderedDict, namedtuple
+from datetime import date
+from functools import wraps
+from flask import Response, g, make_response, request
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")  # memory | redis | none
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "redis://127.0.0.1:6379/0")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+
+# Tag implícito de todas las entradas: invalidarlo vacía la caché
+ALL = "all"
+
+CachedResponse = namedtuple("CachedResponse", "body etag mimetype")
+
+class MemoryBackend:
+    """TTL/LRU of responses in this worker; tag generations are per worker too"""
+
+    name = "memory"
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._entries[key] = (value, now + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def generations(self, tags):
+        with self._lock:
+            return [self._generations.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            if ALL in tags:
+                self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class RedisBackend:
+    """Responses and tag generations in a Redis-compatible server shared by every worker"""
+
+    name = "redis"
+
+    def __init__(self, url=RESPONSE_CACHE_URL, prefix="rc:", client=None):
+        if client is None:
+            import redis  # opcional: pip install redis
+            client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        header, body = raw.split(b"\n", 1)
+        meta = json.loads(header)
+        return CachedResponse(body, meta["etag"], meta["mimetype"])
+
+    def set(self, key, value, ttl):
+        header = json.dumps({"etag": value.etag, "mimetype": value.mimetype}).encode("utf-8")
+        self.client.set(self.prefix + key, header + b"\n" + value.body, px=int(ttl * 1000))
+
+    def generations(self, tags):
+        return [int(n or 0) for n in self.client.mget([f"{self.prefix}gen:{tag}" for tag in tags])]
+
+    def bump(self, tags):
+        # Las entradas viejas quedan inalcanzables y expiran solas por TTL
+        pipe = self.client.pipeline()
+        for tag in tags:
+            pipe.incr(f"{self.prefix}gen:{tag}")
+        pipe.execute()
+
+    def __len__(self):
+        return int(self.client.dbsize())
+
+def make_backend(name, url=RESPONSE_CACHE_URL, maxsize=RESPONSE_CACHE_SIZE):
+    """Backend for RESPONSE_CACHE_BACKEND; None disables the cache"""
+    if name in (None, "", "none", "off"):
+        return None
+    if name == "redis":
+        try:
+            return RedisBackend(url)
+        except ImportError:
+            logger.warning("RESPONSE_CACHE_BACKEND=redis but the redis package is not installed; using memory")
+    elif name != "memory":
+        logger.warning(f"Unknown RESPONSE_CACHE_BACKEND {name!r}; using memory")
+    return MemoryBackend(maxsize)
+
+class ResponseCache:
+    """Caches 200 responses of GET views by tags, with strong ETags and If-None-Match -> 304"""
+
+    def __init__(self, backend=None, ttl=RESPONSE_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get("RESPONSE_CACHE_TTL", self.ttl)
+        self.backend = make_backend(
+            app.config.get("RESPONSE_CACHE_BACKEND", RESPONSE_CACHE_BACKEND),
+            app.config.get("RESPONSE_CACHE_URL", RESPONSE_CACHE_URL),
+            app.config.get("RESPONSE_CACHE_SIZE", RESPONSE_CACHE_SIZE)
+        )
+        if self.backend is not None:
+            logger.info(f"Response cache: {self.backend.name}, ttl {self.ttl}s")
+
+    def _key(self, tags):
+        generations = self.backend.generations(tags + [ALL])
+        # Las vistas usan date.today() (mes/año en curso): la fecha forma parte de la clave
+        raw = "|".join(f"{tag}={n}" for tag, n in zip(tags + [ALL], generations))
+        raw += f"|{date.today().isoformat()}|{request.full_path}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _respond(self, entry, cache_control, status):
+        if request.if_none_match.contains(entry.etag):
+            self.not_modified += 1
+            response = Response(status=304)
+        else:
+            response = Response(entry.body, mimetype=entry.mimetype)
+        response.set_etag(entry.etag)
+        response.headers["Cache-Control"] = cache_control
+        response.headers["X-Cache"] = status
+        return response
+
+    def cached(self, *tags, ttl=None, public=False):
+        """Decorator: tags are formatted with the view args plus tenant_id (from g when not in the URL)
+
+        "tenant:{tenant_id}" entries are dropped by invalidate_tenant()/invalidate_usage(); a
+        request without a tenant_id, a non-200 response or a backend failure just runs the view.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return view(*args, **kwargs)
+                values = dict(kwargs)
+                values.setdefault("tenant_id", g.get("tenant_id"))
+                if any("{tenant_id}" in tag for tag in tags) and not values["tenant_id"]:
+                    return view(*args, **kwargs)
+                resolved = [tag.format(**values) for tag in tags]
+                # Los navegadores revalidan siempre (no-cache): el 304 no lleva cuerpo
+                cache_control = f"public, max-age={int(ttl or self.ttl)}" if public else "private, no-cache"
+                try:
+                    key = self._key(resolved)
+                    entry = self.backend.get(key)
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning(f"Response cache unavailable, serving uncached: {e}")
+                    return view(*args, **kwargs)
+                if entry is not None:
+                    self.hits += 1
+                    return self._respond(entry, cache_control, "HIT")
+
+                self.misses += 1
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = CachedResponse(body, hashlib.sha256(body).hexdigest()[:32], response.mimetype)
+                try:
+                    self.backend.set(key, entry, ttl or self.ttl)
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning(f"Response cache write failed: {e}")
+                return self._respond(entry, cache_control, "MISS")
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        if self.backend is None or not tags:
+            return
+        try:
+            self.backend.bump(list(tags))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache invalidation of {', '.join(tags)} failed: {e}")
+
+    def invalidate_tenant(self, *tenant_ids):
+        """Tenant rows changed: their views and the tenant list; no ids means everything"""
+        if not tenant_ids or None in tenant_ids:
+            self.invalidate(ALL)
+        else:
+            self.invalidate("tenants", *(f"tenant:{tenant_id}" for tenant_id in tenant_ids))
+
+    def invalidate_usage(self, *tenant_ids):
+        """Usage rows of these tenants were written"""
+        self.invalidate(*(f"tenant:{tenant_id}" for tenant_id in tenant_ids))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        size = None
+        if self.backend is not None:
+            try:
+                size = len(self.backend)
+            except Exception:
+                pass
+        return {
+            "backend": self.backend.name if self.backend is not None else None,
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None
+        }
+
+    def clear(self):
+        self.invalidate(ALL)
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.errors = 0
+
+response_cache = ResponseCache()
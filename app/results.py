@@ -0,0 +1,432 @@
+# results.py - ingesta y consultas de lab_results
+from app.models import db, LabResult, ResultAnalyte
+from sqlalchemy import func, insert, select, tuple_, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+from datetime import datetime, timedelta
+import base64
+import csv
+import io
+import json
+import math
+import os
+import re
+import zlib
+
+# Máximo de resultados aceptados en un solo POST /api/v1/results:batch
+RESULTS_BATCH_MAX = int(os.getenv("RESULTS_BATCH_MAX", "5000"))
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+class BatchError(Exception):
+    """The batch body as a whole could not be accepted"""
+
+def parse_batch_body(raw, content_type):
+    """Split a JSON array or NDJSON body into items; unparseable NDJSON lines become errors"""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    text = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+    if content_type in NDJSON_TYPES:
+        items = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(BatchError(f"Invalid JSON line: {e}"))
+        return None, items
+    try:
+        body = json.loads(text)
+    except ValueError as e:
+        raise BatchError(f"Invalid JSON: {e}")
+    if isinstance(body, dict):
+        items = body.get("results")
+        if not isinstance(items, list):
+            raise BatchError("Body must be a JSON array or an object with a 'results' array")
+        return body.get("tenant_id"), items
+    if isinstance(body, list):
+        return None, body
+    raise BatchError("Body must be a JSON array or an object with a 'results' array")
+
+def validate_result(item):
+    """Return (row, error) for a single result payload"""
+    if isinstance(item, BatchError):
+        return None, str(item)
+    if not isinstance(item, dict):
+        return None, "Result must be a JSON object"
+    patient_id = item.get("patient_id")
+    test_code = item.get("test_code")
+    if not patient_id or not test_code:
+        return None, "patient_id and test_code are required"
+    return {
+        "patient_id": patient_id,
+        "test_code": test_code,
+        "test_data": item.get("test_data")
+    }, None
+
+def bulk_insert_results(tenant_id, rows):
+    """Insert rows in one multi-row statement and return their ids in input order"""
+    if not rows:
+        return []
+    now = datetime.utcnow()
+    stmt = insert(LabResult).returning(LabResult.id, sort_by_parameter_order=True)
+    params = [dict(row, tenant_id=tenant_id, created_at=now) for row in rows]
+    ids = list(db.session.execute(stmt, params).scalars())
+    index_analytes(tenant_id, [dict(row, id=result_id, created_at=now) for row, result_id in zip(rows, ids)])
+    return ids
+
+# Índice de búsqueda: valores numéricos de test_data en result_analytes
+ANALYTE_MAX_LENGTH = 64
+
+def extract_analytes(test_code, test_data):
+    """(analyte, value) pairs of the numeric top-level values of test_data
+
+    The generic "value" key (and a bare number) is named after the test code, so
+    {"test_code": "HBA1C", "test_data": {"value": 6.8}} is searchable as analyte hba1c.
+    At most one pair per analyte: a key named after it wins over "value", otherwise the first.
+    """
+    if isinstance(test_data, (int, float)) and not isinstance(test_data, bool):
+        items = [("value", test_data)]
+    elif isinstance(test_data, dict):
+        items = test_data.items()
+    else:
+        return []
+    analytes, from_value = {}, set()
+    for key, value in items:
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            continue
+        name = test_code if key == "value" else key
+        if not name:
+            continue
+        name = str(name).lower()[:ANALYTE_MAX_LENGTH]
+        # Dos filas del mismo analito duplicarían los hits y romperían el cursor (observed_at, result_id)
+        if name in analytes and (key == "value" or name not in from_value):
+            continue
+        analytes[name] = float(value)
+        if key == "value":
+            from_value.add(name)
+        else:
+            from_value.discard(name)
+    return list(analytes.items())
+
+def index_analytes(tenant_id, results):
+    """Insert the analyte rows of freshly inserted results (dicts with id, patient_id, test_code, test_data, created_at)"""
+    rows = [
+        {"result_id": result["id"], "tenant_id": tenant_id, "patient_id": result["patient_id"],
+         "test_code": result["test_code"], "analyte": analyte, "value": value,
+         "observed_at": result["created_at"]}
+        for result in results
+        for analyte, value in extract_analytes(result["test_code"], result["test_data"])
+    ]
+    if rows:
+        db.session.execute(insert(ResultAnalyte), rows)
+    return len(rows)
+
+def backfill_analytes(batch_size=1000, tenant_id=None):
+    """Index results stored before result_analytes existed; returns the number of results indexed"""
+    indexed, last_id = 0, 0
+    while True:
+        query = (
+            select(LabResult.id, LabResult.tenant_id, LabResult.patient_id, LabResult.test_code,
+                   LabResult.test_data, LabResult.created_at)
+            .where(LabResult.id > last_id,
+                   ~select(ResultAnalyte.id).where(ResultAnalyte.result_id == LabResult.id).exists())
+            .order_by(LabResult.id)
+            .limit(batch_size)
+        )
+        if tenant_id:
+            query = query.where(LabResult.tenant_id == tenant_id)
+        batch = db.session.execute(query).all()
+        if not batch:
+            return indexed
+        for row in batch:
+            index_analytes(row.tenant_id, [dict(row._mapping, created_at=row.created_at or datetime.utcnow())])
+        db.session.commit()
+        indexed += len(batch)
+        last_id = batch[-1].id
+
+# Paginación de GET /api/v1/results/<patient_id>
+RESULTS_PAGE_DEFAULT = int(os.getenv("RESULTS_PAGE_DEFAULT", "100"))
+RESULTS_PAGE_MAX = int(os.getenv("RESULTS_PAGE_MAX", "1000"))
+
+RESULT_FIELDS = ("id", "test_code", "test_data", "created_at")
+
+class InvalidQuery(Exception):
+    """A query parameter could not be parsed"""
+
+def encode_cursor(created_at, result_id):
+    raw = f"{created_at.isoformat() if created_at else ''}|{result_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, result_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at), int(result_id)
+    except Exception:
+        raise InvalidQuery("Invalid cursor")
+
+def parse_fields(fields, allowed=RESULT_FIELDS):
+    """Validate a comma separated fields= projection; None means all fields"""
+    if not fields:
+        return allowed
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise InvalidQuery(f"Unknown fields: {', '.join(unknown)}")
+    return tuple(f for f in allowed if f in requested)
+
+def parse_limit(limit):
+    if limit is None:
+        return RESULTS_PAGE_DEFAULT
+    if limit < 1:
+        raise InvalidQuery("limit must be positive")
+    return min(limit, RESULTS_PAGE_MAX)
+
+def fetch_results_page(tenant_id, patient_id, limit=RESULTS_PAGE_DEFAULT, after=None,
+                       fields=RESULT_FIELDS, test_code=None):
+    """One keyset page ordered by (created_at, id); returns (items, next_cursor)"""
+    # id y created_at siempre se leen: forman el cursor
+    columns = [LabResult.id, LabResult.created_at]
+    if "test_code" in fields:
+        columns.append(LabResult.test_code)
+    if "test_data" in fields:
+        columns.append(LabResult.test_data)
+    query = select(*columns).where(
+        LabResult.tenant_id == tenant_id,
+        LabResult.patient_id == patient_id
+    )
+    if test_code:
+        query = query.where(LabResult.test_code == test_code)
+    if after:
+        created_at, result_id = decode_cursor(after)
+        query = query.where(tuple_(LabResult.created_at, LabResult.id) > tuple_(created_at, result_id))
+    query = query.order_by(LabResult.created_at, LabResult.id).limit(limit + 1)
+
+    rows = db.session.execute(query).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            value = getattr(row, field)
+            if field == "created_at":
+                value = value.isoformat() if value else None
+            item[field] = value
+        items.append(item)
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+    return items, next_cursor
+
+# Exportación en streaming de GET /api/v1/results/export
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "1000"))
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_CSV_COLUMNS = ("id", "patient_id", "test_code", "created_at", "test_data")
+
+def parse_since(since):
+    if not since:
+        return None
+    try:
+        return datetime.fromisoformat(since)
+    except ValueError:
+        raise InvalidQuery("since must be an ISO date or datetime")
+
+def iter_export_rows(tenant_id, since=None, yield_per=EXPORT_YIELD_PER):
+    """Stream a tenant's results from a server-side cursor, oldest first"""
+    query = select(
+        LabResult.id, LabResult.patient_id, LabResult.test_code,
+        LabResult.created_at, LabResult.test_data
+    ).where(LabResult.tenant_id == tenant_id)
+    if since:
+        query = query.where(LabResult.created_at >= since)
+    query = query.order_by(LabResult.created_at, LabResult.id).execution_options(yield_per=yield_per)
+    for row in db.session.execute(query):
+        yield row
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps({
+            "id": row.id,
+            "patient_id": row.patient_id,
+            "test_code": row.test_code,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+            "test_data": row.test_data
+        }, default=str) + "\n"
+
+def _csv_lines(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_CSV_COLUMNS)
+    for row in rows:
+        writer.writerow([
+            row.id,
+            row.patient_id,
+            row.test_code,
+            row.created_at.isoformat() if row.created_at else "",
+            json.dumps(row.test_data, default=str) if row.test_data is not None else ""
+        ])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+def export_chunks(rows, fmt, compress=False, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """Encode rows as NDJSON/CSV in ~chunk_bytes pieces, optionally gzip-compressed"""
+    lines = _ndjson_lines(rows) if fmt == "ndjson" else _csv_lines(rows)
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending, size = [], 0
+    for line in lines:
+        data = line.encode("utf-8")
+        pending.append(data)
+        size += len(data)
+        if size >= chunk_bytes:
+            chunk = b"".join(pending)
+            pending, size = [], 0
+            if gz:
+                chunk = gz.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = b"".join(pending)
+    if gz:
+        chunk = gz.compress(chunk) + gz.flush()
+    if chunk:
+        yield chunk
+
+# Búsqueda de GET /api/v1/results/search
+SEARCH_FIELDS = ("id", "patient_id", "test_code", "value", "created_at", "test_data")
+VALUE_FILTERS = {"gt": "__gt__", "gte": "__ge__", "lt": "__lt__", "lte": "__le__"}
+_MATCH_KEY = re.compile(r"^[A-Za-z0-9_]+$")
+
+def _parse_datetime(value, name, end=False):
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidQuery(f"{name} must be an ISO date or datetime")
+    # to=YYYY-MM-DD incluye todo ese día
+    return parsed + timedelta(days=1) if end and len(value) == 10 else parsed
+
+def parse_search_args(args, now=None):
+    """Validated search criteria from the query string of GET /api/v1/results/search"""
+    criteria = {
+        "analyte": (args.get("analyte") or "").strip().lower() or None,
+        "test_code": args.get("test_code") or None,
+        "patient_id": args.get("patient_id") or None,
+        "until": _parse_datetime(args.get("to"), "to", end=True),
+        "bounds": {},
+        "match": None
+    }
+    days = args.get("days")
+    if days:
+        if args.get("from"):
+            raise InvalidQuery("Use either days or from, not both")
+        try:
+            days = int(days)
+            if days < 1:
+                raise ValueError
+        except ValueError:
+            raise InvalidQuery("days must be a positive integer")
+        criteria["since"] = (now or datetime.utcnow()) - timedelta(days=days)
+    else:
+        criteria["since"] = _parse_datetime(args.get("from"), "from")
+    for name in VALUE_FILTERS:
+        raw = args.get(name)
+        if raw in (None, ""):
+            continue
+        try:
+            value = float(raw)
+        except ValueError:
+            value = float("nan")
+        if not math.isfinite(value):
+            raise InvalidQuery(f"{name} must be a number")
+        criteria["bounds"][name] = value
+    if criteria["bounds"] and not criteria["analyte"]:
+        raise InvalidQuery("Value filters (gt, gte, lt, lte) require analyte")
+    match = args.get("match")
+    if match:
+        try:
+            match = json.loads(match)
+        except ValueError:
+            raise InvalidQuery("match must be a JSON object")
+        if not isinstance(match, dict) or not match:
+            raise InvalidQuery("match must be a non-empty JSON object")
+        if not all(_MATCH_KEY.match(key) for key in match):
+            raise InvalidQuery("match keys may only contain letters, digits and _")
+        criteria["match"] = match
+    if not any(criteria[key] for key in ("analyte", "test_code", "patient_id", "match")):
+        raise InvalidQuery("Provide at least one of analyte, test_code, patient_id or match")
+    return criteria
+
+def _match_clause(match):
+    """WHERE clauses for "test_data contains match": JSONB @> (GIN index) on PostgreSQL, json_extract per key elsewhere"""
+    if db.engine.dialect.name == "postgresql":
+        return [type_coerce(LabResult.test_data, JSONB).contains(match)]
+    clauses = []
+    for key, expected in match.items():
+        if expected is None or isinstance(expected, (dict, list)):
+            raise InvalidQuery("Nested or null match values require PostgreSQL")
+        if isinstance(expected, bool):
+            # json_extract devuelve 1/0 para true/false
+            expected = int(expected)
+        clauses.append(func.json_extract(LabResult.test_data, f"$.{key}") == expected)
+    return clauses
+
+def search_results(tenant_id, criteria, fields=SEARCH_FIELDS, limit=RESULTS_PAGE_DEFAULT, after=None):
+    """One keyset page of matching results ordered by (created_at, id); returns (items, next_cursor)
+
+    With an analyte the query runs on ix_result_analytes_search and, unless test_data
+    or match is requested, never reads lab_results. Otherwise it uses the tenant-leading
+    indexes of lab_results (test_code/patient + created_at) and, on PostgreSQL, the GIN
+    index of test_data for match.
+    """
+    match = _match_clause(criteria["match"]) if criteria["match"] else []
+    if criteria["analyte"]:
+        source = ResultAnalyte
+        created_at, result_id = source.observed_at, source.result_id
+        query = select(result_id.label("id"), created_at.label("created_at"), source.patient_id,
+                       source.test_code, source.value).where(
+            source.tenant_id == tenant_id,
+            source.analyte == criteria["analyte"]
+        )
+        for name, value in criteria["bounds"].items():
+            query = query.where(getattr(source.value, VALUE_FILTERS[name])(value))
+        if "test_data" in fields or match:
+            query = query.join(LabResult, LabResult.id == result_id).add_columns(LabResult.test_data)
+    else:
+        source = LabResult
+        created_at, result_id = LabResult.created_at, LabResult.id
+        query = select(LabResult.id, LabResult.created_at, LabResult.patient_id, LabResult.test_code)
+        if "test_data" in fields:
+            query = query.add_columns(LabResult.test_data)
+        query = query.where(LabResult.tenant_id == tenant_id)
+        fields = tuple(f for f in fields if f != "value")
+    if criteria["test_code"]:
+        query = query.where(source.test_code == criteria["test_code"])
+    if criteria["patient_id"]:
+        query = query.where(source.patient_id == criteria["patient_id"])
+    if criteria["since"]:
+        query = query.where(created_at >= criteria["since"])
+    if criteria["until"]:
+        query = query.where(created_at < criteria["until"])
+    if match:
+        query = query.where(*match)
+    if after:
+        cursor_created_at, cursor_id = decode_cursor(after)
+        query = query.where(tuple_(created_at, result_id) > tuple_(cursor_created_at, cursor_id))
+    query = query.order_by(created_at, result_id).limit(limit + 1)
+
+    rows = db.session.execute(query).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            value = getattr(row, field)
+            if field == "created_at":
+                value = value.isoformat() if value else None
+            item[field] = value
+        items.append(item)
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+    return items, next_cursor
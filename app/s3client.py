@@ -1,7 +1,19 @@
-import boto3
+import hashlib
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote
+from app.aws import LazyClient
 from app.config import S3_BUCKET
 
-s3 = boto3.client("s3")
+s3 = LazyClient("s3")
+
+# Tamaño de parte para multipart (S3 exige >= 5 MB salvo la última parte)
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", str(8 * 1024 * 1024)))
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "4"))
 
 def upload_file(file, key):
     s3.upload_fileobj(file, S3_BUCKET, key)
@@ -10,4 +22,192 @@ def upload_file(file, key):
 def upload_bytes(bucket, key, data):
     """Sube bytes directamente a S3"""
     s3.put_object(Bucket=bucket, Key=key, Body=data)
-    return f"s3://{bucket}/{key}"
\ No newline at end of file
+    return f"s3://{bucket}/{key}"
+
+def read_bytes(bucket, key):
+    """Download a whole (small) object"""
+    return s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+
+def open_stream(bucket, key, start=None, length=None):
+    """Readable body of an object, or of length bytes from start (ranged GET); close it when done"""
+    extra = {"Range": f"bytes={start}-{start + length - 1}"} if start is not None else {}
+    return s3.get_object(Bucket=bucket, Key=key, **extra)["Body"]
+
+class ChunkStream:
+    """File-like read() over an iterator of bytes chunks, so generated data can go through upload_stream"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0 or size >= len(self._buffer):
+            data, self._buffer = bytes(self._buffer), bytearray()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+def _read_full(stream, size):
+    """Read up to size bytes, looping over short reads; b'' only at EOF"""
+    chunks, remaining = [], size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+def upload_stream(bucket, key, stream, part_size=None, concurrency=None,
+                  metadata=None, content_type=None):
+    """Stream a file-like object to S3 in fixed-size parts with bounded memory
+
+    At most concurrency + 1 parts are held in memory. Bodies smaller than one part
+    go up as a single put_object. Returns {"s3_uri", "size", "sha256", "parts"};
+    returns None if the stream is empty.
+    """
+    part_size = part_size or S3_PART_SIZE
+    concurrency = concurrency or S3_UPLOAD_CONCURRENCY
+    sha256 = hashlib.sha256()
+    extra = {}
+    if metadata:
+        extra["Metadata"] = metadata
+    if content_type:
+        extra["ContentType"] = content_type
+
+    first = _read_full(stream, part_size)
+    if not first:
+        return None
+    second = _read_full(stream, part_size)
+    if not second:
+        sha256.update(first)
+        s3.put_object(Bucket=bucket, Key=key, Body=first, **extra)
+        return {"s3_uri": f"s3://{bucket}/{key}", "size": len(first), "sha256": sha256.hexdigest(), "parts": 1}
+
+    pending = [first, second]
+    first = second = None
+
+    def next_part():
+        return pending.pop(0) if pending else _read_full(stream, part_size)
+
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, **extra)["UploadId"]
+    # Limita las partes en vuelo: la lectura se bloquea hasta que termine una subida
+    slots = threading.BoundedSemaphore(concurrency)
+    failed = threading.Event()
+
+    def upload_part(number, body):
+        try:
+            resp = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body)
+            return {"PartNumber": number, "ETag": resp["ETag"]}
+        except Exception:
+            failed.set()
+            raise
+        finally:
+            slots.release()
+
+    size, number, futures = 0, 1, []
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="s3-part") as pool:
+            body = next_part()
+            while body and not failed.is_set():
+                sha256.update(body)
+                size += len(body)
+                slots.acquire()
+                futures.append(pool.submit(upload_part, number, body))
+                number += 1
+                body = next_part()
+            parts = [future.result() for future in futures]
+        s3.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={"Parts": parts}
+        )
+    except Exception:
+        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+    return {"s3_uri": f"s3://{bucket}/{key}", "size": size, "sha256": sha256.hexdigest(), "parts": len(parts)}
+
+# ----------------------
+# URLs prefirmadas (subida/descarga directa a S3)
+# ----------------------
+PRESIGN_EXPIRES = int(os.getenv("S3_PRESIGN_EXPIRES", "900"))
+# Por encima de este tamaño se usa multipart prefirmado en lugar de un único PUT
+PRESIGN_MULTIPART_THRESHOLD = int(os.getenv("S3_PRESIGN_MULTIPART_THRESHOLD", str(100 * 1024 * 1024)))
+S3_MAX_PARTS = 10000
+
+def new_upload_key(tenant_id, now=None):
+    """Collision-free object key under the tenant's uploads/ prefix"""
+    now = now or datetime.utcnow()
+    return f"{tenant_id}/uploads/{now:%Y/%m/%d}/{uuid.uuid4().hex}.bin"
+
+def presign_put(bucket, key, content_type=None, expires=None):
+    params = {"Bucket": bucket, "Key": key}
+    if content_type:
+        params["ContentType"] = content_type
+    return s3.generate_presigned_url("put_object", Params=params, ExpiresIn=expires or PRESIGN_EXPIRES)
+
+# Caracteres de control, comillas, \ y ; romperían la cabecera o le añadirían parámetros
+_UNSAFE_FILENAME = re.compile(r'[\x00-\x1f\x7f"\\;]')
+
+def content_disposition(filename):
+    """attachment with an ASCII filename= fallback and the full name as RFC 5987 filename*="""
+    name = _UNSAFE_FILENAME.sub("", filename).strip()
+    if not name:
+        return 'attachment; filename="download"'
+    fallback = "".join(c if c.isascii() else "_" for c in name)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(name, safe='')}"
+
+def presign_get(bucket, key, expires=None, filename=None):
+    params = {"Bucket": bucket, "Key": key}
+    if filename:
+        params["ResponseContentDisposition"] = content_disposition(filename)
+    return s3.generate_presigned_url("get_object", Params=params, ExpiresIn=expires or PRESIGN_EXPIRES)
+
+def multipart_part_size(size):
+    """Part size for a presigned multipart upload (grows past S3's 10,000 part limit)"""
+    return max(S3_PART_SIZE, -(-size // S3_MAX_PARTS))
+
+def presign_multipart(bucket, key, size, content_type=None, expires=None):
+    """Start a multipart upload and presign one PUT URL per part"""
+    part_size = multipart_part_size(size)
+    part_count = max(1, -(-size // part_size))
+    extra = {"ContentType": content_type} if content_type else {}
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, **extra)["UploadId"]
+    urls = [
+        s3.generate_presigned_url(
+            "upload_part",
+            Params={"Bucket": bucket, "Key": key, "UploadId": upload_id, "PartNumber": number},
+            ExpiresIn=expires or PRESIGN_EXPIRES
+        )
+        for number in range(1, part_count + 1)
+    ]
+    return {"upload_id": upload_id, "part_size": part_size, "part_urls": urls}
+
+def complete_multipart(bucket, key, upload_id, parts):
+    parts = sorted(({"PartNumber": int(p["PartNumber"]), "ETag": p["ETag"]} for p in parts),
+                   key=lambda p: p["PartNumber"])
+    s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id,
+                                 MultipartUpload={"Parts": parts})
+
+def object_exists(bucket, key):
+    """False only when S3 answers that the object does not exist; any other error is raised"""
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except Exception as e:
+        if getattr(e, "response", {}).get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+def object_size(bucket, key):
+    """Size in bytes of an uploaded object (None if it does not exist)"""
+    try:
+        return s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    except Exception:
+        return None
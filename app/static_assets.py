@@ -0,0 +1,246 @@
+# static_assets.py - frontend precomprimido y con hash en el nombre, servido desde memoria
+import argparse
+import copy
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import threading
+from flask import Response, request
+
+try:
+    import brotli  # opcional: pip install brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+FRONTEND_DIR = os.getenv("FRONTEND_DIR") or os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "frontend"))
+
+# Los nombres con hash no cambian nunca de contenido: un año e immutable
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# index.html y los nombres originales se revalidan con el ETag en cada carga
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# Ganancias menores no compensan el Content-Encoding
+MIN_COMPRESS_BYTES = 256
+HASH_LENGTH = 12
+# Orden de preferencia cuando el cliente acepta varias
+ENCODINGS = ("br", "gzip")
+
+_REFERENCE = re.compile(r"""(\b(?:src|href)=)(["'])(?:\./)?([^"':?#]+)\2""")
+
+class StaticAsset:
+    """One file of the frontend with its precompressed variants"""
+
+    def __init__(self, name, body, mimetype, immutable=False):
+        self.name = name
+        self.mimetype = mimetype
+        self.immutable = immutable
+        self.digest = hashlib.sha256(body).hexdigest()[:HASH_LENGTH]
+        # Un ETag fuerte por representación: los bytes de cada codificación son distintos
+        self.variants = {None: body}
+        if body and len(body) >= MIN_COMPRESS_BYTES and mimetype.startswith(COMPRESSIBLE_TYPES):
+            compressed = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed["br"] = brotli.compress(body, quality=11)
+            for encoding, data in compressed.items():
+                if len(data) < len(body):
+                    self.variants[encoding] = data
+
+    def etag(self, encoding):
+        return f"{self.digest}-{encoding}" if encoding else self.digest
+
+def hashed_name(name, digest):
+    base, ext = os.path.splitext(name)
+    return f"{base}.{digest}{ext}"
+
+def _guess_type(name):
+    mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    # Algunos sistemas registran .js como text/javascript o application/x-javascript
+    return "application/javascript" if name.endswith(".js") else mimetype
+
+def build_assets(source):
+    """Read source into {request path: StaticAsset}: hashed names, original names and index.html"""
+    files = {}
+    for root, _, names in os.walk(source):
+        for name in sorted(names):
+            full = os.path.join(root, name)
+            files[os.path.relpath(full, source).replace(os.sep, "/")] = open(full, "rb").read()
+
+    assets, hashed = {}, {}
+    for name, body in files.items():
+        if name.endswith(".html"):
+            continue
+        asset = StaticAsset(name, body, _guess_type(name))
+        hashed[name] = hashed_name(name, asset.digest)
+        assets[name] = asset
+        # Mismos bytes y variantes ya comprimidas, otro nombre y otro Cache-Control
+        fingerprinted = copy.copy(asset)
+        fingerprinted.name, fingerprinted.immutable = hashed[name], True
+        assets[hashed[name]] = fingerprinted
+
+    def rewrite(match):
+        target = hashed.get(match.group(3))
+        return f"{match.group(1)}{match.group(2)}{target}{match.group(2)}" if target else match.group(0)
+
+    # El HTML apunta a los nombres con hash: un deploy nuevo cambia las URLs, no el caché
+    for name, body in files.items():
+        if name.endswith(".html"):
+            html = _REFERENCE.sub(rewrite, body.decode("utf-8")).encode("utf-8")
+            assets[name] = StaticAsset(name, html, "text/html")
+    return assets, hashed
+
+def _source_state(source):
+    state = []
+    for root, _, names in os.walk(source):
+        for name in names:
+            stat = os.stat(os.path.join(root, name))
+            state.append((os.path.join(root, name), stat.st_mtime_ns, stat.st_size))
+    return sorted(state)
+
+class AssetPipeline:
+    """Frontend built once per worker and served from memory with ETag and Accept-Encoding negotiation"""
+
+    def __init__(self, source=FRONTEND_DIR):
+        self.source = source
+        self.assets = {}
+        self.hashed = {}
+        self._state = None
+        self._app = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self._app = app
+        self.source = app.config.get("FRONTEND_DIR") or self.source
+        self.build()
+
+    def build(self):
+        if not os.path.isdir(self.source):
+            logger.warning(f"Frontend directory {self.source} not found; static files disabled")
+            self.assets, self.hashed, self._state = {}, {}, None
+            return
+        state = _source_state(self.source)
+        assets, hashed = build_assets(self.source)
+        with self._lock:
+            self.assets, self.hashed, self._state = assets, hashed, state
+        logger.info(f"Built {len(assets)} static assets from {self.source}"
+                    f"{'' if brotli else ' (gzip only: pip install brotli for br)'}")
+
+    def _refresh(self):
+        # Sólo en debug: se editan los archivos sin reiniciar el servidor
+        if os.path.isdir(self.source) and _source_state(self.source) != self._state:
+            self.build()
+
+    def _negotiate(self, asset):
+        for encoding in ENCODINGS:
+            if encoding in asset.variants and request.accept_encodings[encoding]:
+                return encoding
+        return None
+
+    def response(self, path):
+        """Response for a frontend path, or None if there is no such asset"""
+        if self._app is not None and self._app.debug:
+            self._refresh()
+        asset = self.assets.get(path)
+        if asset is None:
+            return None
+        encoding = self._negotiate(asset)
+        etag = asset.etag(encoding)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if asset.immutable else REVALIDATE_CACHE_CONTROL
+        if len(asset.variants) > 1:
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+static_assets = AssetPipeline()
+
+def write_build(assets, output):
+    """Write every asset and its .gz/.br variants under output (for nginx gzip_static/brotli_static)"""
+    written = []
+    for name, asset in sorted(assets.items()):
+        path = os.path.join(output, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for encoding, data in asset.variants.items():
+            suffix = {None: "", "gzip": ".gz", "br": ".br"}[encoding]
+            with open(path + suffix, "wb") as f:
+                f.write(data)
+            written.append(name + suffix)
+    return written
+
+NGINX_TEMPLATE = """\
+# Generado por: python3 -m app.static_assets build --output {root} --nginx <archivo>
+server {{
+    listen 80;
+    server_name _;
+    root {root};
+
+    # Sirve los .gz/.br generados junto a cada archivo
+    gzip_static on;
+    # brotli_static on;  # con el módulo ngx_brotli instalado
+
+    location ~ ^/(api|admin)/ {{
+        proxy_pass http://{upstream};
+        proxy_set_header Host $host;
+        proxy_set_header X-Real-IP $remote_addr;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto $scheme;
+    }}
+
+    location = /health {{
+        proxy_pass http://{upstream}/health;
+        access_log off;
+    }}
+
+    # Nombres con hash: el contenido no cambia nunca
+    location ~ "\\.[0-9a-f]{{{hash_length}}}\\.[A-Za-z0-9]+$" {{
+        add_header Cache-Control "{immutable}";
+        try_files $uri =404;
+    }}
+
+    # index.html y nombres originales: revalidar con ETag
+    location / {{
+        add_header Cache-Control "{revalidate}";
+        try_files $uri /index.html;
+    }}
+}}
+"""
+
+def nginx_config(root, upstream="127.0.0.1:5000"):
+    return NGINX_TEMPLATE.format(root=os.path.abspath(root), upstream=upstream, hash_length=HASH_LENGTH,
+                                 immutable=IMMUTABLE_CACHE_CONTROL, revalidate=REVALIDATE_CACHE_CONTROL)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the frontend for nginx (hashed names, .gz and .br)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="write the built frontend and optionally an nginx server block")
+    build.add_argument("--source", default=FRONTEND_DIR)
+    build.add_argument("--output", required=True, help="directory nginx serves as root")
+    build.add_argument("--nginx", help="write the nginx server block to this file ('-' for stdout)")
+    build.add_argument("--upstream", default="127.0.0.1:5000", help="gunicorn address")
+    args = parser.parse_args(argv)
+
+    assets, hashed = build_assets(args.source)
+    written = write_build(assets, args.output)
+    print(f"{len(written)} files written to {args.output} ({len(hashed)} hashed assets"
+          f"{'' if brotli else ', no brotli: pip install brotli'})")
+    if args.nginx == "-":
+        print(nginx_config(args.output, args.upstream))
+    elif args.nginx:
+        with open(args.nginx, "w") as f:
+            f.write(nginx_config(args.output, args.upstream))
+        print(f"nginx config written to {args.nginx}")
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
@@ -0,0 +1,226 @@
+# tenant_cache.py - caché por worker de los registros de tenants
+from app.models import db, Tenant
+from app.response_cache import response_cache
+from collections import OrderedDict, namedtuple
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+import logging
+import os
+import select
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "10000"))
+TENANT_CACHE_TTL = float(os.getenv("TENANT_CACHE_TTL", "300"))
+# Los tenants desconocidos se recuerdan menos tiempo: un alta reciente debe verse pronto
+TENANT_CACHE_NEGATIVE_TTL = float(os.getenv("TENANT_CACHE_NEGATIVE_TTL", "30"))
+TENANT_CACHE_CHANNEL = "tenant_cache"
+# session.info: {TenantCache: ids} a invalidar cuando la transacción haga commit
+_PENDING = "tenant_cache_pending"
+
+# Copia inmutable de la fila: se puede compartir entre sesiones e hilos
+CachedTenant = namedtuple("CachedTenant", "id tenant_id company_name subscription_tier created_at")
+
+def _snapshot(tenant):
+    return CachedTenant(tenant.id, tenant.tenant_id, tenant.company_name,
+                        tenant.subscription_tier, tenant.created_at)
+
+class TenantCache:
+    """TTL/LRU of Tenant rows keyed by tenant_id, with a negative cache for unknown ids"""
+
+    _MISSING = object()
+
+    def __init__(self, maxsize=TENANT_CACHE_SIZE, ttl=TENANT_CACHE_TTL, negative_ttl=TENANT_CACHE_NEGATIVE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._app = None
+        self._listen = False
+        self._listener = None
+        self._pid = None
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self._app = app
+        self.ttl = app.config.get("TENANT_CACHE_TTL", self.ttl)
+        self._listen = app.config.get("TENANT_CACHE_LISTEN", False)
+
+    def _lookup(self, tenant_id, now):
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if entry is None:
+                self.misses += 1
+                return self._MISSING
+            tenant, expires_at = entry
+            if expires_at <= now:
+                del self._entries[tenant_id]
+                self.misses += 1
+                return self._MISSING
+            self._entries.move_to_end(tenant_id)
+            if tenant is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return tenant
+
+    def peek(self, tenant_id, now=None):
+        """(found, tenant) from the cache only: no query and no hit/miss accounting"""
+        now = time.monotonic() if now is None else now
+        entry = self._entries.get(tenant_id)
+        if entry is None or entry[1] <= now:
+            return False, None
+        return True, entry[0]
+
+    def put(self, tenant_id, tenant, now=None, generation=None):
+        now = time.monotonic() if now is None else now
+        ttl = self.ttl if tenant is not None else self.negative_ttl
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                # Hubo una invalidación mientras se leía la fila: no guardar un dato viejo
+                return
+            self._entries[tenant_id] = (tenant, now + ttl)
+            self._entries.move_to_end(tenant_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, tenant_id, now=None):
+        """CachedTenant for tenant_id (None if it does not exist), querying only on a miss"""
+        if not tenant_id:
+            return None
+        if self._listen:
+            self._ensure_listener()
+        now = time.monotonic() if now is None else now
+        tenant = self._lookup(tenant_id, now)
+        if tenant is not self._MISSING:
+            return tenant
+        generation = self._generation
+        row = Tenant.query.filter_by(tenant_id=tenant_id).first()
+        tenant = _snapshot(row) if row is not None else None
+        self.put(tenant_id, tenant, now, generation)
+        return tenant
+
+    def invalidate(self, tenant_id=None):
+        """Drop one tenant (or everything) from this worker's cache"""
+        with self._lock:
+            if tenant_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(tenant_id, None)
+            self._generation += 1
+            self.invalidations += 1
+        # También llega por NOTIFY de otros workers: las respuestas cacheadas del tenant caen con él
+        if tenant_id is None:
+            response_cache.invalidate_tenant()
+        else:
+            response_cache.invalidate_tenant(tenant_id)
+
+    def notify(self, *tenant_ids, session=None):
+        """Invalidate in this worker and, on PostgreSQL, in every other worker once the transaction commits
+
+        session defaults to db.session; nothing is invalidated if it rolls back.
+        """
+        session = session if session is not None else db.session()
+        # Muchos ids a la vez (altas masivas): una sola invalidación total
+        targets = tenant_ids if len(tenant_ids) <= 100 else (None,)
+        if not targets:
+            return
+        # Antes del commit otro request del worker podría volver a cargar la fila vieja
+        session.info.setdefault(_PENDING, {}).setdefault(self, set()).update(targets)
+        if session.get_bind().dialect.name == "postgresql":
+            # PostgreSQL entrega el NOTIFY al hacer commit (y lo descarta en un rollback)
+            for tenant_id in targets:
+                session.execute(text("SELECT pg_notify(:channel, :tenant_id)"),
+                                {"channel": TENANT_CACHE_CHANNEL, "tenant_id": tenant_id or ""})
+
+    def _ensure_listener(self):
+        """Background LISTEN on PostgreSQL so NOTIFYs from other workers invalidate this cache"""
+        # Después de un fork (gunicorn --preload) el hilo no existe en el hijo
+        if self._listener is not None and self._pid == os.getpid() and self._listener.is_alive():
+            return
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid() and self._listener.is_alive():
+                return
+            if self._app is None or db.engine.dialect.name != "postgresql":
+                self._listen = False
+                return
+            self._pid = os.getpid()
+            self._listener = threading.Thread(target=self._run_listener, name="tenant-cache-listener", daemon=True)
+            self._listener.start()
+
+    def _run_listener(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    conn = db.engine.raw_connection()
+                # Conexión dedicada fuera del pool: queda bloqueada en LISTEN
+                conn.detach()
+            except Exception as e:
+                logger.error(f"Tenant cache listener could not connect: {e}")
+                time.sleep(5)
+                continue
+            try:
+                self._listen_on(conn.dbapi_connection)
+            except Exception as e:
+                logger.warning(f"Tenant cache listener lost its connection, reconnecting: {e}")
+                # Lo que se notificó mientras tanto se perdió: vaciar todo
+                self.invalidate()
+                time.sleep(1)
+            finally:
+                conn.close()
+
+    def _listen_on(self, raw):
+        raw.autocommit = True
+        raw.cursor().execute(f"LISTEN {TENANT_CACHE_CHANNEL}")
+        while True:
+            if select.select([raw], [], [], 60) == ([], [], []):
+                continue
+            raw.poll()
+            while raw.notifies:
+                self.invalidate(raw.notifies.pop(0).payload or None)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": round((self.hits + self.negative_hits) / lookups, 4) if lookups else None
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.negative_hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+tenant_cache = TenantCache()
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for cache, tenant_ids in session.info.pop(_PENDING, {}).items():
+        for tenant_id in ((None,) if None in tenant_ids else tenant_ids):
+            cache.invalidate(tenant_id)
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_rolled_back(session, transaction):
+    # Tras un rollback (o un close sin commit) no hay nada que invalidar
+    if transaction.parent is None:
+        session.info.pop(_PENDING, None)
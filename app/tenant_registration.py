@@ -1,10 +1,13 @@
-import boto3
 import os
 import secrets
 import string
 from datetime import datetime
-import psycopg2
 from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.aws import get_client
+from app.models import db
+from app.tenant_cache import tenant_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -34,94 +37,50 @@ def create_new_tenant_with_user(tenant_data):
     try:
         print(f"🔧 Iniciando creación de tenant: {tenant_id}")
         
-        # ===== 1. PostgreSQL (opcional) =====
+        # ===== 1. PostgreSQL (pool del engine de la app) =====
         try:
-            db_config = {
-                'host': os.getenv('DB_HOST'),
-                'port': os.getenv('DB_PORT', '5432'),
-                'database': os.getenv('DB_NAME'),
-                'user': os.getenv('DB_USER'),
-                'password': os.getenv('DB_PASSWORD')
-            }
-            
-            if all(db_config.values()):
-                conn = psycopg2.connect(**db_config)
-                cur = conn.cursor()
-                
-                cur.execute("""
+            # Transacción propia, independiente de db.session (y del commit del request)
+            with Session(db.engine) as session, session.begin():
+                session.execute(text("""
                     INSERT INTO tenants (tenant_id, company_name, subscription_tier, created_at)
-                    VALUES (%s, %s, %s, %s)
+                    VALUES (:tenant_id, :company_name, :subscription_tier, :created_at)
                     ON CONFLICT (tenant_id) DO NOTHING
-                """, (
-                    tenant_id,
-                    company_name,
-                    tenant_data.get('subscription_tier', 'professional'),
-                    datetime.utcnow()
-                ))
-                
-                conn.commit()
-                cur.close()
-                conn.close()
-                print(f"✅ Tenant creado en PostgreSQL")
-            else:
-                print("⚠️ PostgreSQL no configurado, omitiendo")
+                """), {
+                    "tenant_id": tenant_id,
+                    "company_name": company_name,
+                    "subscription_tier": tenant_data.get('subscription_tier', 'professional'),
+                    "created_at": datetime.utcnow()
+                })
+                tenant_cache.notify(tenant_id, session=session)
+            print(f"✅ Tenant creado en PostgreSQL")
                 
         except Exception as db_error:
             print(f"⚠️ Error PostgreSQL: {db_error}")
             # Continuar de todos modos
         
         # ===== 2. Cognito (IMPORTANTE) =====
-        cognito = boto3.client('cognito-idp', region_name=os.getenv("AWS_REGION", "us-east-2"))
-        user_pool_id = os.getenv("COGNITO_POOL_ID", "us-east-2_Wi7VHkSWm")
-        
-        print(f"🔑 Creando usuario en Cognito: {admin_email}")
-        
-        # Atributos SEGUROS (sin custom:is_admin)
-        user_attributes = [
-            {'Name': 'email', 'Value': admin_email},
-            {'Name': 'email_verified', 'Value': 'True'},
-            {'Name': 'name', 'Value': tenant_data.get('contact_name', 'Usuario')}
-        ]
-        
-        # Intentar primero sin custom:tenant_id
-        try:
-            response = cognito.admin_create_user(
-                UserPoolId=user_pool_id,
-                Username=admin_email,
-                TemporaryPassword=temp_password,
-                MessageAction='SUPPRESS',
-                UserAttributes=user_attributes
-            )
-            print("✅ Usuario creado en Cognito exitosamente")
-            
-        except Exception as e:
-            print(f"⚠️ Error creando usuario: {e}")
-            # Si falla, podríamos intentar otro método
-            
-            # Método de respaldo: crear sin atributos
-            try:
-                response = cognito.admin_create_user(
-                    UserPoolId=user_pool_id,
-                    Username=admin_email,
-                    TemporaryPassword=temp_password,
-                    MessageAction='SUPPRESS'
-                )
-                print("✅ Usuario creado (método simple)")
-            except Exception as e2:
-                print(f"❌ Error crítico: {e2}")
-                return {
-                    "success": False,
-                    "error": f"No se pudo crear usuario en Cognito: {e2}",
-                    "tenant_id": tenant_id
-                }
+        # Se crea en segundo plano: el request no espera a Cognito
+        from app.provisioning_jobs import provisioning_queue
+        # La contraseña va solo en memoria: nunca se guarda en provisioning_jobs
+        job = provisioning_queue.enqueue(tenant_id, "registration", {
+            "email": admin_email,
+            "contact_name": tenant_data.get('contact_name', 'Usuario')
+        }, secrets={"temp_password": temp_password})
+        print(f"🔑 Usuario de Cognito en cola: {admin_email} (job {job.id})")
         
-        return {
+        result = {
             "success": True,
             "tenant_id": tenant_id,
             "email": admin_email,
-            "temp_password": temp_password,
-            "message": "Registro completado exitosamente. Guarda estas credenciales."
+            "provisioning_status": job.status,
+            "message": "Registro recibido. Guarda estas credenciales; la cuenta estará activa en unos segundos."
         }
+        # Solo si este worker corre el job con esa contraseña; si no, Cognito la envía por correo
+        if provisioning_queue.holds_secrets(job.id):
+            result["temp_password"] = temp_password
+        else:
+            result["message"] = "Registro recibido. La contraseña temporal llegará por correo."
+        return result
         
     except Exception as e:
         print(f"❌ Error general: {e}")
@@ -134,6 +93,49 @@ def create_new_tenant_with_user(tenant_data):
             "tenant_id": tenant_id
         }
 
+def _error_code(error):
+    return getattr(error, "response", {}).get("Error", {}).get("Code")
+
+def step_admin_user(tenant_id, payload):
+    """Create the tenant admin in Cognito (provisioning job step); an existing user counts as done
+
+    Without the in-memory temp_password (job run by another process or after a restart)
+    Cognito generates the password and emails the invitation itself.
+    """
+    cognito = get_client('cognito-idp', region_name=os.getenv("AWS_REGION", "us-east-2"))
+    user_pool_id = os.getenv("COGNITO_POOL_ID", "us-east-2_Wi7VHkSWm")
+    admin_email = payload["email"]
+    
+    # Atributos SEGUROS (sin custom:is_admin)
+    user_attributes = [
+        {'Name': 'email', 'Value': admin_email},
+        {'Name': 'email_verified', 'Value': 'True'},
+        {'Name': 'name', 'Value': payload.get('contact_name', 'Usuario')}
+    ]
+    
+    password = {}
+    if payload.get("temp_password"):
+        password = {"TemporaryPassword": payload["temp_password"], "MessageAction": 'SUPPRESS'}
+    
+    # Intentar primero sin custom:tenant_id; método de respaldo: crear sin atributos
+    for attributes in (user_attributes, None):
+        kwargs = {"UserAttributes": attributes} if attributes else {}
+        try:
+            cognito.admin_create_user(
+                UserPoolId=user_pool_id,
+                Username=admin_email,
+                **password,
+                **kwargs
+            )
+            logger.info(f"Cognito user created for {tenant_id}: {admin_email}")
+            return admin_email
+        except Exception as e:
+            if _error_code(e) == "UsernameExistsException":
+                return admin_email
+            if attributes is None:
+                raise
+            logger.warning(f"Error creando usuario con atributos: {e}")
+
 def get_all_subscription_tiers():
     """Get available subscription tiers"""
     return [
@@ -0,0 +1,131 @@
+"""
+Utilidades compartidas por los tests: llaves RSA locales y JWKS de prueba
+"""
+import threading
+import time
+from unittest import mock
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+
+def make_rsa_jwk(kid="test-kid"):
+    """Generate a local RSA key; returns (private_pem, public_jwk_dict)"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public_jwk = jwk.construct(private_pem, "RS256").public_key().to_dict()
+    public_jwk = {k: (v.decode() if isinstance(v, bytes) else v) for k, v in public_jwk.items()}
+    public_jwk.update({"kid": kid, "use": "sig"})
+    return private_pem, public_jwk
+
+
+def make_token(private_pem, kid="test-kid", tenant_id="laba", ttl=3600, **extra):
+    """Sign a Cognito-like id token with the local key"""
+    claims = {
+        "sub": "user-1",
+        "custom:tenant_id": tenant_id,
+        "exp": int(time.time()) + ttl,
+    }
+    claims.update(extra)
+    return jwt.encode(claims, private_pem, algorithm="RS256", headers={"kid": kid})
+
+
+def patch_key_store(public_jwk):
+    """Patch app.auth.key_store with a store that serves the given JWK (no network)"""
+    from app import auth
+    store = auth.JWKSKeyStore("http://unused")
+    store.load_jwks({"keys": [public_jwk]})
+    return mock.patch.object(auth, "key_store", store)
+
+
+class FakeS3:
+    """Sustituto local de un cliente boto3 de S3 (objetos en memoria)
+
+    Implementa put/get/head/delete y multipart; registra cuántas partes se suben
+    en paralelo para verificar la memoria acotada.
+    """
+
+    def __init__(self, part_delay=0.0):
+        self.objects = {}
+        self.gets = []
+        self.uploads = {}
+        self.aborted = []
+        self.part_delay = part_delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        body = Body.read() if hasattr(Body, "read") else Body
+        self.objects[(Bucket, Key)] = {"Body": bytes(body), **kwargs}
+        return {"ETag": '"etag"'}
+
+    @staticmethod
+    def _missing(Key):
+        # Igual que botocore.exceptions.ClientError para un objeto que no existe
+        error = KeyError(Key)
+        error.response = {"Error": {"Code": "404", "Message": "Not Found"}}
+        return error
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        import io
+        if (Bucket, Key) not in self.objects:
+            raise self._missing(Key)
+        body = self.objects[(Bucket, Key)]["Body"]
+        if Range:
+            start, end = (int(n) for n in Range[len("bytes="):].split("-"))
+            body = body[start:end + 1]
+        self.gets.append((Key, Range))
+        return {"Body": io.BytesIO(body), "ContentLength": len(body)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        if (Bucket, Key) not in self.objects:
+            raise self._missing(Key)
+        return {"ContentLength": len(self.objects[(Bucket, Key)]["Body"])}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        with self._lock:
+            self._next_id += 1
+            upload_id = f"upload-{self._next_id}"
+        self.uploads[upload_id] = {"parts": {}, "kwargs": kwargs}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.part_delay)
+            self.uploads[UploadId]["parts"][PartNumber] = bytes(Body)
+            return {"ETag": f'"part-{PartNumber}"'}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        upload = self.uploads.pop(UploadId)
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        assert numbers == sorted(upload["parts"]), "parts out of order or missing"
+        body = b"".join(upload["parts"][n] for n in numbers)
+        self.objects[(Bucket, Key)] = {"Body": body, **upload["kwargs"]}
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self.uploads.pop(UploadId, None)
+        self.aborted.append(UploadId)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600, **kwargs):
+        from urllib.parse import urlencode
+        query = {k: v for k, v in Params.items() if k not in ("Bucket", "Key")}
+        query.update(method=ClientMethod, expires=ExpiresIn)
+        return f"https://{Params['Bucket']}.s3.local/{Params['Key']}?{urlencode(query)}"
@@ -0,0 +1,270 @@
+import unittest
+import gzip
+import io
+import json
+import sys
+import os
+from datetime import date, datetime
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db, s3client
+from app import archive
+from app.models import Tenant, LabResult, ResultAnalyte
+from app.results import index_analytes
+from app.usage import usage_aggregator
+from app.tenant_cache import tenant_cache
+from app.tests.helpers import FakeS3, make_rsa_jwk, make_token, patch_key_store
+
+BUCKET = "bucket"
+TODAY = date(2026, 10, 17)
+
+
+def seed(rows):
+    """Insert results (tenant_id, patient_id, created_at, value) with their analytes"""
+    results = []
+    for tenant_id, patient_id, created_at, value in rows:
+        result = LabResult(tenant_id=tenant_id, patient_id=patient_id, test_code="GLU",
+                           test_data={"value": value}, created_at=created_at)
+        db.session.add(result)
+        db.session.flush()
+        index_analytes(tenant_id, [{"id": result.id, "patient_id": patient_id, "test_code": "GLU",
+                                    "test_data": result.test_data, "created_at": created_at}])
+        results.append(result.id)
+    db.session.commit()
+    return results
+
+
+class ArchiveFilesTests(unittest.TestCase):
+    def setUp(self):
+        self.fake = FakeS3()
+        self._s3_patch = mock.patch.object(s3client, "s3", self.fake)
+        self._s3_patch.start()
+        archive.archive_store.clear()
+        with app.app_context():
+            db.create_all()
+            seed([("laba" if i % 3 else "labb", f"P{i}", datetime(2024, 5, 1 + i), i) for i in range(9)])
+
+    def tearDown(self):
+        self._s3_patch.stop()
+        archive.archive_store.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _manifest(self, tenant_id):
+        return json.loads(self.fake.objects[(BUCKET, archive.manifest_key(tenant_id))]["Body"])
+
+    def test_archive_key_is_under_the_tenant_prefix(self):
+        self.assertEqual(archive.archive_key("laba", date(2024, 5, 1)), "laba/archive/lab_results/2024-05.ndjson.gz")
+        self.assertEqual(archive.manifest_key("laba"), "laba/archive/manifest.json")
+
+    def test_upload_archive_writes_gzip_ndjson_with_row_count(self):
+        with app.app_context():
+            result = archive.upload_archive(BUCKET, "laba/archive/lab_results/2024-05.ndjson.gz",
+                                            archive.result_rows("lab_results", "laba"))
+        self.assertEqual(result["rows"], 6)
+        body = self.fake.objects[(BUCKET, "laba/archive/lab_results/2024-05.ndjson.gz")]["Body"]
+        self.assertEqual(result["size"], len(body))
+        lines = [json.loads(line) for line in gzip.GzipFile(fileobj=io.BytesIO(body))]
+        self.assertEqual([line["patient_id"] for line in lines], ["P1", "P2", "P4", "P5", "P7", "P8"])
+        self.assertEqual(lines[0]["test_data"], {"value": 1})
+        self.assertEqual(lines[0]["created_at"], "2024-05-02T00:00:00")
+
+    def test_archive_tenant_moves_old_rows_to_s3(self):
+        with app.app_context():
+            seed([("laba", "P1", datetime(2026, 10, 1), 100)])
+            summary = archive.archive_tenant("laba", months=12, bucket=BUCKET, today=TODAY)
+            self.assertEqual(summary["before"], "2025-10-01")
+            self.assertEqual(summary["months"][0]["rows"], 6)
+            self.assertEqual(summary["months"][0]["deleted"], 6)
+            # Sólo queda lo reciente de laba, y labb no se toca
+            self.assertEqual(LabResult.query.filter_by(tenant_id="laba").count(), 1)
+            self.assertEqual(ResultAnalyte.query.filter_by(tenant_id="laba").count(), 1)
+            self.assertEqual(LabResult.query.filter_by(tenant_id="labb").count(), 3)
+
+        entry = self._manifest("laba")["months"]["2024-05"]
+        self.assertEqual(entry["rows"], 6)
+        self.assertEqual(entry["first_created_at"], "2024-05-02T00:00:00")
+        body = self.fake.objects[(BUCKET, entry["key"])]["Body"]
+        self.assertEqual(entry["size"], len(body))
+        self.assertEqual(len(archive.parse_archive(body)), 6)
+        # Un miembro gzip por paciente: su rango de bytes se lee solo
+        index = json.loads(gzip.decompress(self.fake.objects[(BUCKET, entry["index_key"])]["Body"]))
+        self.assertEqual(entry["patients"], 6)
+        offset, length, rows, last_created_at, last_id = index["P4"]
+        member = archive.parse_archive(body[offset:offset + length])
+        self.assertEqual([row["patient_id"] for row in member], ["P4"])
+        self.assertEqual((rows, last_created_at), (1, "2024-05-05T00:00:00"))
+
+    def test_rerun_keeps_each_row_once(self):
+        with app.app_context():
+            seed([("laba", "P1", datetime(2026, 10, 1), 100)])
+            archive.archive_tenant("laba", months=12, bucket=BUCKET, today=TODAY)
+            self.assertEqual(archive.archive_tenant("laba", months=12, bucket=BUCKET, today=TODAY)["months"], [])
+            # Un mes que vuelve a tener filas (p. ej. el delete falló) se amplía sin duplicar
+            seed([("laba", "P9", datetime(2024, 5, 20), 9)])
+            rows = archive.result_rows("lab_results", "laba", date(2024, 5, 1), date(2024, 6, 1))
+            entry = archive.store_month(BUCKET, "laba", date(2024, 5, 1), rows, 1)
+            self.assertEqual(entry["rows"], 7)
+        self.assertEqual(self._manifest("laba")["months"]["2024-05"]["rows"], 7)
+
+    def test_v1_month_without_index_is_read_and_rewritten(self):
+        with app.app_context():
+            seed([("laba", "P1", datetime(2026, 10, 1), 100)])
+            archive.archive_tenant("laba", months=12, bucket=BUCKET, today=TODAY)
+            # Simula un mes escrito antes del índice: filas ordenadas por fecha, sin index_key
+            manifest = archive.archive_store.load_manifest("laba", BUCKET, cached=False)
+            entry = manifest["months"]["2024-05"]
+            rows = sorted(archive.parse_archive(self.fake.objects[(BUCKET, entry["key"])]["Body"]),
+                          key=lambda row: row["created_at"], reverse=True)
+            lines = "".join(json.dumps(dict(row, created_at=row["created_at"].isoformat())) + "\n" for row in rows)
+            self.fake.objects[(BUCKET, entry["key"])]["Body"] = gzip.compress(lines.encode())
+            del entry["index_key"]
+            archive.archive_store.save_manifest("laba", manifest, BUCKET)
+            self.assertEqual([row["id"] for row in archive.archive_store.patient_rows(BUCKET, entry, "P4")], [5])
+
+            seed([("laba", "P9", datetime(2024, 5, 20), 9)])
+            rows = archive.result_rows("lab_results", "laba", date(2024, 5, 1), date(2024, 6, 1))
+            entry = archive.store_month(BUCKET, "laba", date(2024, 5, 1), rows, 1)
+        self.assertEqual((entry["rows"], entry["patients"]), (7, 7))
+        self.assertIn("index_key", entry)
+
+    def test_failed_read_back_keeps_the_rows(self):
+        empty = gzip.compress(b"")
+        with app.app_context(), mock.patch.object(s3client, "open_stream", return_value=io.BytesIO(empty)):
+            with self.assertRaises(RuntimeError):
+                archive.archive_tenant("laba", months=12, bucket=BUCKET, today=TODAY)
+            self.assertEqual(LabResult.query.filter_by(tenant_id="laba").count(), 6)
+            self.assertEqual(ResultAnalyte.query.filter_by(tenant_id="laba").count(), 6)
+        self.assertNotIn((BUCKET, archive.manifest_key("laba")), self.fake.objects)
+
+    def test_archive_all_covers_every_tenant(self):
+        with app.app_context():
+            db.session.add_all([Tenant(tenant_id="laba"), Tenant(tenant_id="labb")])
+            db.session.commit()
+            summaries = archive.archive_all(months=12, bucket=BUCKET, today=TODAY)
+            self.assertEqual([s["months"][0]["rows"] for s in summaries], [6, 3])
+            self.assertEqual(LabResult.query.count(), 0)
+
+
+class ArchivedResultsApiTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_pem, cls.public_jwk = make_rsa_jwk()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.fake = FakeS3()
+        self._s3_patch = mock.patch.object(s3client, "s3", self.fake)
+        self._s3_patch.start()
+        self._bucket_patch = mock.patch.object(archive, "S3_BUCKET", BUCKET)
+        self._bucket_patch.start()
+        self._store_patch = patch_key_store(self.public_jwk)
+        self._store_patch.start()
+        self.headers = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id='laba')}"}
+        tenant_cache.clear()
+        archive.archive_store.clear()
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([Tenant(tenant_id="laba", company_name="Lab A", subscription_tier="basic"),
+                                Tenant(tenant_id="labb", company_name="Lab B", subscription_tier="basic")])
+            db.session.commit()
+            self.old = seed([("laba", "P1", datetime(2024, 3, 5), 1), ("laba", "P1", datetime(2024, 4, 5), 2),
+                             ("laba", "P2", datetime(2024, 4, 6), 3), ("laba", "P1", datetime(2024, 4, 7), 4)])
+            self.recent = seed([("laba", "P1", datetime.utcnow(), 5)])
+            archive.archive_tenant("laba", months=12, bucket=BUCKET)
+
+    def tearDown(self):
+        self._store_patch.stop()
+        self._bucket_patch.stop()
+        self._s3_patch.stop()
+        archive.archive_store.clear()
+        usage_aggregator._pending.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _get(self, **params):
+        return self.client.get("/api/v1/results/P1", query_string=params, headers=self.headers)
+
+    def test_archive_read_without_asking(self):
+        ids = []
+        body = self._get(limit=2, fields="id").get_json()
+        while True:
+            ids.extend(r["id"] for r in body["results"])
+            if not body["next_cursor"]:
+                break
+            body = self._get(limit=2, fields="id", after=body["next_cursor"]).get_json()
+        self.assertEqual(ids, [self.old[0], self.old[1], self.old[3]] + self.recent)
+
+    def test_database_only_when_opted_out(self):
+        body = self._get(include_archived="false").get_json()
+        self.assertEqual([r["id"] for r in body["results"]], self.recent)
+        self.assertNotIn("archived", body)
+
+    def test_archive_unavailable_is_flagged(self):
+        archive.archive_store.clear()
+        with mock.patch.object(self.fake, "head_object", side_effect=ConnectionError("s3 down")) as head:
+            body = self._get().get_json()
+            # Durante retry_after no se vuelve a intentar S3 en cada request
+            self.assertTrue(self._get().get_json()["archive_unavailable"])
+        self.assertEqual(head.call_count, 1)
+        self.assertEqual([r["id"] for r in body["results"]], self.recent)
+        self.assertIsNone(body["archived"])
+        self.assertTrue(body["archive_unavailable"])
+
+    def test_archive_first_then_database(self):
+        body = self._get(include_archived="true").get_json()
+        self.assertEqual([r["id"] for r in body["results"]], [self.old[0], self.old[1], self.old[3]] + self.recent)
+        self.assertEqual(body["archived"], 3)
+        self.assertEqual(body["results"][0]["test_data"], {"value": 1})
+        self.assertEqual(body["results"][0]["created_at"], "2024-03-05T00:00:00")
+        self.assertIsNone(body["next_cursor"])
+
+    def test_pages_cross_from_archive_to_database(self):
+        ids = []
+        params = {"include_archived": "1", "limit": 2, "fields": "id"}
+        body = self._get(**params).get_json()
+        while True:
+            ids.extend(r["id"] for r in body["results"])
+            if not body["next_cursor"]:
+                break
+            body = self._get(after=body["next_cursor"], **params).get_json()
+        self.assertEqual(ids, [self.old[0], self.old[1], self.old[3]] + self.recent)
+
+    def test_archive_exhausted_on_a_page_boundary(self):
+        body = self._get(include_archived="1", limit=3).get_json()
+        self.assertEqual(body["count"], 3)
+        self.assertIsNotNone(body["next_cursor"])
+        self.fake.gets.clear()
+        body = self._get(include_archived="1", limit=3, after=body["next_cursor"]).get_json()
+        self.assertEqual([r["id"] for r in body["results"]], self.recent)
+        self.assertEqual(body["archived"], 0)
+        # Manifiesto e índices en memoria; el índice dice que P1 no tiene nada tras el cursor
+        self.assertEqual(self.fake.gets, [])
+
+    def test_reads_only_the_patients_byte_range(self):
+        archive.archive_store.clear()
+        self.fake.gets.clear()
+        body = self.client.get("/api/v1/results/P2", query_string={"include_archived": "1"},
+                               headers=self.headers).get_json()
+        self.assertEqual([r["id"] for r in body["results"]], [self.old[2]])
+        data_reads = [(key, byte_range) for key, byte_range in self.fake.gets if key.endswith(".ndjson.gz")]
+        # 2024-03 no tiene a P2 (sólo el índice); de 2024-04 sólo sus bytes
+        self.assertEqual(len(data_reads), 1)
+        key, byte_range = data_reads[0]
+        self.assertTrue(key.endswith("2024-04.ndjson.gz"))
+        self.assertIsNotNone(byte_range)
+        self.assertEqual(sum(key.endswith(".index.json.gz") for key, _ in self.fake.gets), 2)
+
+    def test_other_tenants_see_nothing(self):
+        headers = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id='labb')}"}
+        body = self.client.get("/api/v1/results/P1", query_string={"include_archived": "1"}, headers=headers).get_json()
+        self.assertEqual(body["results"], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
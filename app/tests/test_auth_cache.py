@@ -0,0 +1,96 @@
+import unittest
+import sys
+import os
+import time
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, attach_tenant_from_header
+from app import auth
+from app.tests.helpers import make_rsa_jwk, make_token, patch_key_store
+
+
+class ClaimsCacheTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_pem, public_jwk = make_rsa_jwk()
+        cls.jwks = {"keys": [public_jwk]}
+
+    def setUp(self):
+        self._store_patch = patch_key_store(self.jwks["keys"][0])
+        self._store_patch.start()
+        auth.claims_cache.clear()
+
+    def tearDown(self):
+        self._store_patch.stop()
+        auth.claims_cache.clear()
+
+    def test_repeat_token_skips_signature_check(self):
+        """Un token ya verificado no vuelve a pasar por RSA"""
+        token = make_token(self.private_pem)
+        with mock.patch.object(auth, "_verify_signature", wraps=auth._verify_signature) as verify:
+            first = auth.verify_jwt(token)
+            second = auth.verify_jwt(token)
+        self.assertEqual(verify.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(auth.claims_cache.hits, 1)
+
+    def test_entry_evicted_at_exp(self):
+        token = make_token(self.private_pem, ttl=60)
+        auth.verify_jwt(token)
+        self.assertIsNotNone(auth.claims_cache.get(token))
+        self.assertIsNone(auth.claims_cache.get(token, now=time.time() + 61))
+        self.assertEqual(len(auth.claims_cache), 0)
+
+    def test_expired_token_rejected(self):
+        token = make_token(self.private_pem, ttl=-10)
+        with self.assertRaises(Exception):
+            auth.verify_jwt(token)
+        self.assertEqual(len(auth.claims_cache), 0)
+
+    def test_cache_is_bounded(self):
+        cache = auth.ClaimsCache(maxsize=2)
+        exp = time.time() + 60
+        for i in range(3):
+            cache.put(f"token-{i}", {"exp": exp})
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("token-0"))
+
+    def test_tampered_token_not_served_from_cache(self):
+        token = make_token(self.private_pem)
+        auth.verify_jwt(token)
+        header, payload, sig = token.split(".")
+        with self.assertRaises(Exception):
+            auth.verify_jwt(f"{header}.{payload}x.{sig}")
+
+    def test_single_verification_per_request(self):
+        """before_request y cognito_required comparten las claims en g"""
+        token = make_token(self.private_pem, tenant_id="labx")
+
+        @auth.cognito_required
+        def view():
+            return "ok"
+
+        with mock.patch.object(auth, "_verify_signature", wraps=auth._verify_signature) as verify:
+            with app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+                attach_tenant_from_header()
+                self.assertEqual(view(), "ok")
+                self.assertEqual(auth.g.tenant_id, "labx")
+        self.assertEqual(verify.call_count, 1)
+
+    def test_invalid_token_rejected_once(self):
+        @auth.cognito_required
+        def view():
+            return "ok"
+
+        with mock.patch.object(auth, "verify_jwt", side_effect=Exception("bad")) as verify:
+            with app.test_request_context(headers={"Authorization": "Bearer nope"}):
+                attach_tenant_from_header()
+                body, status = view()
+        self.assertEqual(status, 401)
+        self.assertEqual(verify.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
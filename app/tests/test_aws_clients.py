@@ -0,0 +1,70 @@
+import unittest
+import sys
+import os
+import threading
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import aws
+
+
+class AWSClientFactoryTests(unittest.TestCase):
+    def setUp(self):
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-2")
+        aws.reset_clients()
+
+    def tearDown(self):
+        aws.reset_clients()
+
+    def test_client_created_once_with_tuned_config(self):
+        first = aws.get_client("s3")
+        self.assertIs(aws.get_client("s3"), first)
+        config = first.meta.config
+        self.assertEqual(config.max_pool_connections, aws.AWS_MAX_POOL_CONNECTIONS)
+        self.assertEqual(config.connect_timeout, aws.AWS_CONNECT_TIMEOUT)
+        self.assertEqual(config.retries["mode"], "standard")
+        self.assertTrue(config.tcp_keepalive)
+        self.assertIsNot(aws.get_client("s3", region_name="eu-west-1"), first)
+
+    def test_concurrent_first_use_builds_single_client(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(aws.get_client("cognito-idp")))
+                   for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len({id(c) for c in results}), 1)
+
+    def test_new_process_gets_fresh_clients(self):
+        parent = aws.get_client("s3")
+        with mock.patch.object(aws.os, "getpid", return_value=os.getpid() + 1):
+            child = aws.get_client("s3")
+        self.assertIsNot(child, parent)
+
+    def test_lazy_client_defers_creation(self):
+        lazy = aws.LazyClient("s3")
+        self.assertEqual(aws._clients, {})
+        self.assertEqual(lazy.meta.service_model.service_name, "s3")
+        self.assertIn(("s3", None), aws._clients)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_fork_resets_clients_in_child(self):
+        parent = aws.get_client("s3")
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Hijo: el registro de clientes debe estar vacío tras el fork
+            os.write(write_fd, b"1" if not aws._clients else b"0")
+            os._exit(0)
+        os.close(write_fd)
+        result = os.read(read_fd, 1)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        self.assertEqual(result, b"1")
+        self.assertIs(aws.get_client("s3"), parent)
+
+
+if __name__ == '__main__':
+    unittest.main()
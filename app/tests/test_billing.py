@@ -0,0 +1,230 @@
+import unittest
+import sys
+import os
+from datetime import date, datetime
+from unittest import mock
+
+from sqlalchemy import event
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db
+from app.models import Tenant, TenantUsage, Invoice, InvoiceLineItem
+from app.usage import UsageAggregator
+from app.tenant_cache import tenant_cache
+from app.billing import (calculate_tenant_bill, generate_invoice_for_all_tenants,
+                         get_monthly_usage_summary, get_tenant_invoices, get_billing_overview,
+                         materialize_month, build_invoice, invoice_to_dict, closing_month)
+
+
+class CountQueries:
+    """Cuenta las sentencias SQL ejecutadas dentro del bloque"""
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(db.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, "before_cursor_execute", self._on_execute)
+
+
+def without_status(invoice):
+    return {k: v for k, v in invoice.items() if k != "status"}
+
+
+class BillingTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.month = date(2026, 2, 1)
+        self.ctx = app.app_context()
+        self.ctx.push()
+        tenant_cache.clear()
+        db.create_all()
+        tiers = ["basic", "professional", "enterprise", "legacy"]
+        for i in range(12):
+            db.session.add(Tenant(tenant_id=f"lab{i:02d}", company_name=f"Lab {i}",
+                                  subscription_tier=tiers[i % 4]))
+            if i % 5 != 4:  # algunos tenants sin uso ese mes
+                db.session.add(TenantUsage(tenant_id=f"lab{i:02d}", month=self.month,
+                                           results_processed=400 * i, api_calls=1234 * i,
+                                           storage_bytes=i * 750_000_000))
+        db.session.add(TenantUsage(tenant_id="lab00", month=date(2026, 1, 1),
+                                   results_processed=5, api_calls=5, storage_bytes=0))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_bulk_matches_per_tenant_calculation(self):
+        expected = [inv for inv in (calculate_tenant_bill(f"lab{i:02d}", self.month) for i in range(12)) if inv]
+        self.assertEqual(generate_invoice_for_all_tenants(self.month), expected)
+        self.assertEqual(len(expected), 10)
+
+    def test_bulk_uses_single_query(self):
+        db.session.expire_all()
+        with CountQueries() as queries:
+            generate_invoice_for_all_tenants(self.month)
+        self.assertEqual(queries.count, 1)
+
+    def test_exact_decimal_totals(self):
+        # lab03: tier desconocido (base_fee), 1200 resultados, 3702 llamadas, 2.25 GB
+        invoice = calculate_tenant_bill("lab03", self.month)
+        self.assertEqual(invoice["subtotal"], 400.4952)
+        self.assertEqual(invoice["tax"], 64.079232)
+        self.assertEqual(invoice["total"], 464.574432)
+        self.assertEqual([item["total"] for item in invoice["items"]], [299.0, 100.0, 1.125, 0.3702])
+
+
+    def test_year_summary_single_query(self):
+        db.session.expire_all()
+        with CountQueries() as queries:
+            summary = get_monthly_usage_summary("lab00", 2026)
+        self.assertEqual(queries.count, 1)
+        self.assertEqual([item["month"] for item in summary], ["2026-01", "2026-02"])
+
+    def test_invoice_history_matches_per_month_bills(self):
+        expected = [inv for inv in (calculate_tenant_bill("lab00", date(2026, m, 1)) for m in range(1, 13)) if inv]
+        invoices = get_tenant_invoices("lab00", date(2026, 1, 1), date(2026, 12, 1))
+        self.assertEqual([without_status(inv) for inv in invoices], expected)
+        self.assertEqual(Invoice.query.count(), 0)
+        # Enero cerrado por el job: se sirve de la tabla invoices (join + line items)
+        materialize_month(date(2026, 1, 1), current_month=self.month)
+        db.session.expire_all()
+        with CountQueries() as queries:
+            again = get_tenant_invoices("lab00", date(2026, 1, 1), date(2026, 12, 1))
+        self.assertEqual(queries.count, 2)
+        self.assertEqual([inv["status"] for inv in again], ["closed", "open"])
+        self.assertEqual(again[1], invoices[1])
+
+    def test_billing_overview(self):
+        current, summary = get_billing_overview("lab01", 2026, self.month)
+        self.assertEqual(without_status(current), calculate_tenant_bill("lab01", self.month))
+        self.assertEqual(len(summary), 1)
+        db.session.expire_all()
+        with CountQueries() as queries:
+            get_billing_overview("lab01", 2026, self.month)
+        self.assertEqual(queries.count, 1)
+        self.assertEqual(Invoice.query.count(), 0)
+
+    def test_multi_year_range_routes(self):
+        db.session.add(TenantUsage(tenant_id="lab00", month=date(2024, 11, 1),
+                                   results_processed=1, api_calls=2, storage_bytes=0))
+        db.session.commit()
+        client = app.test_client()
+        body = client.get("/admin/billing/tenants/lab00/usage?from=2024-06&to=2026-01").get_json()
+        self.assertEqual([item["month"] for item in body["usage_summary"]], ["2024-11", "2026-01"])
+        body = client.get("/admin/billing/tenants/lab00/invoices?from=2024-01&to=2026-12").get_json()
+        self.assertEqual(len(body["invoices"]), 3)
+        body = client.get("/admin/billing/tenants/lab00/invoices?year=2024").get_json()
+        self.assertEqual(len(body["invoices"]), 1)
+        self.assertEqual(client.get("/admin/billing/tenants/lab00/usage?from=2026-05").status_code, 400)
+        self.assertEqual(client.get("/admin/billing/tenants/lab00/usage?from=2026-05&to=2026-01").status_code, 400)
+
+
+
+class InvoiceStoreTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.past, self.current = date(2026, 1, 1), date(2026, 2, 1)
+        self.ctx = app.app_context()
+        self.ctx.push()
+        tenant_cache.clear()
+        db.create_all()
+        db.session.add(Tenant(tenant_id="laba", company_name="Lab A", subscription_tier="basic"))
+        db.session.commit()
+        self.aggregator = UsageAggregator()
+        for month in (self.past, self.current):
+            self.aggregator.add("laba", month=month, results_processed=1500, api_calls=10)
+        self.aggregator.flush()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _stored(self, month):
+        return Invoice.query.filter_by(tenant_id="laba", month=month).one()
+
+    def test_closed_month_is_immutable(self):
+        invoices, changed = materialize_month(self.past, current_month=self.current)
+        self.assertEqual(changed, 1)
+        self.assertEqual(invoices[0]["status"], "closed")
+        self.aggregator.add("laba", month=self.past, results_processed=1000)
+        self.aggregator.flush()
+        again, changed = materialize_month(self.past, current_month=self.current)
+        self.assertEqual(changed, 0)
+        self.assertEqual(again, invoices)
+
+    def test_open_month_recomputed_only_when_usage_changes(self):
+        invoices, changed = materialize_month(self.current, current_month=self.current)
+        self.assertEqual((changed, invoices[0]["status"]), (1, "open"))
+        self.assertEqual(materialize_month(self.current, current_month=self.current)[1], 0)
+        self.aggregator.add("laba", month=self.current, results_processed=100)
+        self.aggregator.flush()
+        invoices, changed = materialize_month(self.current, current_month=self.current)
+        self.assertEqual(changed, 1)
+        self.assertEqual(invoices[0]["total"], 462.84116)  # (99 + 300 + 0.001) * 1.16
+        self.assertEqual(len(self._stored(self.current).items), 3)
+        # Al pasar el mes la factura abierta se recalcula una última vez y se cierra
+        invoices, changed = materialize_month(self.current, current_month=date(2026, 3, 1))
+        self.assertEqual((changed, invoices[0]["status"]), (1, "closed"))
+
+    def test_upsert_rewrites_the_open_row(self):
+        materialize_month(self.current, current_month=self.current)
+        invoice_id = self._stored(self.current).id
+        self.aggregator.add("laba", month=self.current, storage_bytes=2_000_000_000)
+        self.aggregator.flush()
+        invoices, changed = materialize_month(self.current, current_month=self.current)
+        self.assertEqual(changed, 1)
+        db.session.expire_all()
+        stored = self._stored(self.current)
+        self.assertEqual(stored.id, invoice_id)
+        self.assertEqual([item.position for item in stored.items], [0, 1, 2, 3])
+        self.assertEqual(InvoiceLineItem.query.count(), 4)
+        self.assertEqual(invoices[0], invoice_to_dict(stored))
+
+    def test_reads_never_write(self):
+        get_billing_overview("laba", 2026, self.current)
+        get_tenant_invoices("laba", self.past, self.current)
+        self.assertEqual(Invoice.query.count(), 0)
+        materialize_month(self.current, current_month=self.current)
+        self.aggregator.add("laba", month=self.current, results_processed=100)
+        self.aggregator.flush()
+        current, _ = get_billing_overview("laba", 2026, self.current)
+        # La factura abierta se calcula del uso actual; la fila guardada no cambia
+        self.assertEqual(current["total"], 462.84116)
+        self.assertEqual(float(self._stored(self.current).total), 404.84116)
+
+    def test_closing_month_waits_for_the_grace(self):
+        with mock.patch("app.billing.INVOICE_CLOSE_GRACE", 3600):
+            self.assertEqual(closing_month(datetime(2026, 3, 1, 0, 30)), self.current)
+            self.assertEqual(closing_month(datetime(2026, 3, 1, 1, 0)), date(2026, 3, 1))
+
+    def test_stored_amounts_are_exact(self):
+        self.aggregator.add("laba", month=self.past, storage_bytes=123_456_789)
+        self.aggregator.flush()
+        materialize_month(self.past, current_month=self.current)
+        stored = self._stored(self.past)
+        exact = build_invoice(Tenant.query.filter_by(tenant_id="laba").one(),
+                              db.session.get(TenantUsage, ("laba", self.past)), self.past, exact=True)
+        self.assertEqual(float(stored.total), float(exact["total"]))
+        self.assertEqual(invoice_to_dict(stored)["items"][2]["quantity"], 0.123456789)
+
+    def test_admin_route_serves_stored_invoices(self):
+        client = app.test_client()
+        body = client.get("/admin/billing/invoices?month=2026-01").get_json()
+        self.assertEqual((body["total_invoices"], body["invoices"][0]["status"]), (1, "open"))
+        self.assertEqual(Invoice.query.count(), 0)
+        materialize_month(self.past, current_month=self.current)
+        body = client.get("/admin/billing/invoices?month=2026-01").get_json()
+        self.assertEqual(body["invoices"][0]["status"], "closed")
+
+
+if __name__ == '__main__':
+    unittest.main()
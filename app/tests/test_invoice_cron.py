@@ -0,0 +1,94 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+import threading
+from datetime import date
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db
+from app.models import Tenant, TenantUsage, Invoice
+from app import invoice_cron
+
+
+class InvoiceCronTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.month = date(2026, 1, 1)
+        self.output_dir = tempfile.mkdtemp()
+        with app.app_context():
+            db.create_all()
+            for i in range(7):
+                db.session.add(Tenant(tenant_id=f"lab{i}", company_name=f"Lab {i}", subscription_tier="basic"))
+                db.session.add(TenantUsage(tenant_id=f"lab{i}", month=self.month,
+                                           results_processed=1000 + i, api_calls=i, storage_bytes=0, version=1))
+            db.session.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _month_dir(self):
+        return os.path.join(self.output_dir, "2026-01")
+
+    def test_batch_writes_files_ndjson_and_manifest(self):
+        stats = invoice_cron.run_invoice_batch(self.month, workers=1, chunk_size=3, output_dir=self.output_dir)
+        self.assertEqual((stats["generated"], stats["failed"], stats["invoices"]), (7, 0, 7))
+        with open(stats["combined_file"]) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([inv["tenant_id"] for inv in lines], [f"lab{i}" for i in range(7)])
+        with open(os.path.join(self._month_dir(), "manifest.json")) as f:
+            self.assertEqual(json.load(f)["combined_sha256"], stats["combined_sha256"])
+        self.assertEqual(len(stats["files"]), 7)
+        with app.app_context():
+            self.assertEqual(Invoice.query.filter_by(status="closed").count(), 7)
+
+    def test_rerun_skips_checkpointed_tenants(self):
+        invoice_cron.run_invoice_batch(self.month, workers=1, chunk_size=3, output_dir=self.output_dir)
+        calls = []
+
+        def counting_chunk(*args):
+            calls.append(args)
+            return invoice_cron.process_chunk(*args)
+
+        stats = invoice_cron.run_invoice_batch(self.month, workers=1, output_dir=self.output_dir,
+                                               chunk_fn=counting_chunk)
+        self.assertEqual(calls, [])
+        self.assertEqual((stats["generated"], stats["skipped"], stats["invoices"]), (0, 7, 7))
+
+    def test_failures_are_isolated_and_resumable(self):
+        """Un chunk que falla no aborta el resto; la re-ejecución solo procesa lo pendiente"""
+        seen_threads = set()
+
+        def flaky_chunk(month, tenant_ids, month_dir):
+            seen_threads.add(threading.current_thread().name)
+            if "lab4" in tenant_ids:
+                raise RuntimeError("boom")
+            done = []
+            for tenant_id in tenant_ids:
+                path = os.path.join(month_dir, f"invoice_{tenant_id}.json")
+                with open(path, "w") as f:
+                    json.dump({"tenant_id": tenant_id, "total": 1.0}, f)
+                done.append({"tenant_id": tenant_id, "file": path, "total": 1.0})
+            return done, []
+
+        stats = invoice_cron.run_invoice_batch(self.month, workers=3, chunk_size=2,
+                                               output_dir=self.output_dir, chunk_fn=flaky_chunk)
+        self.assertEqual(stats["generated"], 5)
+        self.assertEqual(sorted(f["tenant_id"] for f in stats["failures"]), ["lab4", "lab5"])
+        self.assertTrue(all(name.startswith("invoice") for name in seen_threads))
+
+        stats = invoice_cron.run_invoice_batch(self.month, workers=1, output_dir=self.output_dir)
+        self.assertEqual((stats["generated"], stats["skipped"], stats["failed"]), (2, 5, 0))
+
+    def test_previous_month(self):
+        self.assertEqual(invoice_cron.previous_month(date(2026, 1, 15)), date(2025, 12, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
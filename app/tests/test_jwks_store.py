@@ -0,0 +1,133 @@
+import unittest
+import sys
+import os
+import json
+import threading
+import time
+import unittest.mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import auth
+from app.tests.helpers import make_rsa_jwk, make_token
+
+
+class StubJWKSServer:
+    """Servidor HTTP local que sirve un JWKS y cuenta las peticiones"""
+
+    def __init__(self, jwks, delay=0.0):
+        self.jwks = jwks
+        self.delay = delay
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.delay)
+                body = json.dumps(stub.jwks).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/.well-known/jwks.json"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JWKSKeyStoreTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pem_a, cls.jwk_a = make_rsa_jwk("kid-a")
+        cls.pem_b, cls.jwk_b = make_rsa_jwk("kid-b")
+
+    def test_prefetch_builds_key_index(self):
+        with StubJWKSServer({"keys": [self.jwk_a]}) as stub:
+            store = auth.JWKSKeyStore(stub.url)
+            store.prefetch()
+            self.assertIsNotNone(store.get_key("kid-a"))
+            self.assertIsNotNone(store.get_key("kid-a"))
+            self.assertEqual(stub.requests, 1)
+
+    def test_concurrent_unknown_kid_fetches_once(self):
+        """Muchos misses simultáneos producen un solo fetch"""
+        with StubJWKSServer({"keys": [self.jwk_a]}, delay=0.2) as stub:
+            store = auth.JWKSKeyStore(stub.url)
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(store.get_key("kid-a")))
+                       for _ in range(16)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(stub.requests, 1)
+            self.assertTrue(all(k is not None for k in results))
+
+    def test_rotated_key_picked_up_and_refetch_rate_limited(self):
+        with StubJWKSServer({"keys": [self.jwk_a]}) as stub:
+            store = auth.JWKSKeyStore(stub.url, min_refresh_interval=0.3)
+            store.prefetch()
+            stub.jwks = {"keys": [self.jwk_a, self.jwk_b]}
+            # Dentro del intervalo no se vuelve a pedir el JWKS
+            self.assertIsNone(store.get_key("kid-b"))
+            self.assertIsNone(store.get_key("kid-unknown"))
+            self.assertEqual(stub.requests, 1)
+            time.sleep(0.35)
+            self.assertIsNotNone(store.get_key("kid-b"))
+            self.assertEqual(stub.requests, 2)
+
+    def test_verify_jwt_against_stub(self):
+        with StubJWKSServer({"keys": [self.jwk_a]}) as stub:
+            store = auth.JWKSKeyStore(stub.url)
+            original = auth.key_store
+            auth.key_store = store
+            auth.claims_cache.clear()
+            try:
+                claims = auth.verify_jwt(make_token(self.pem_a, kid="kid-a", tenant_id="labz"))
+            finally:
+                auth.key_store = original
+                auth.claims_cache.clear()
+            self.assertEqual(claims["custom:tenant_id"], "labz")
+
+    def test_store_starts_on_first_verify(self):
+        import app  # noqa: F401 - importar la app no debe pedir el JWKS
+        self.assertFalse(auth.key_store._started)
+        with StubJWKSServer({"keys": [self.jwk_a]}) as stub:
+            store = auth.JWKSKeyStore(stub.url)
+            original = auth.key_store
+            auth.key_store = store
+            auth.claims_cache.clear()
+            try:
+                with unittest.mock.patch.object(auth, "COGNITO_POOL_ID", "us-east-2_test"):
+                    for _ in range(2):
+                        auth.verify_jwt(make_token(self.pem_a, kid="kid-a", tenant_id="labz"))
+                        auth.claims_cache.clear()
+            finally:
+                auth.key_store = original
+                auth.claims_cache.clear()
+            self.assertTrue(store._started)
+            self.assertTrue(store._refresh_thread.is_alive())
+            self.assertEqual(stub.requests, 1)
+
+    def test_prefetch_failure_does_not_block_retry(self):
+        store = auth.JWKSKeyStore("http://127.0.0.1:9/jwks.json", timeout=0.5)
+        store.prefetch()
+        self.assertIsNone(store._last_fetch)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import sys
+import os
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db, aws, s3client
+from app.metrics import Histogram, registry, http_request_duration, db_queries_per_request, aws_call_duration
+from app.models import Tenant
+from app.tenant_cache import tenant_cache
+from app.usage import usage_aggregator
+from app.tests.helpers import make_rsa_jwk, make_token, patch_key_store, FakeS3
+
+
+class HistogramTests(unittest.TestCase):
+    def test_render_is_cumulative(self):
+        h = Histogram("t_seconds", "test", ("endpoint",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            h.observe(value, endpoint="/x")
+        text = h.render()
+        self.assertIn('t_seconds_bucket{endpoint="/x",le="0.1"} 1', text)
+        self.assertIn('t_seconds_bucket{endpoint="/x",le="1.0"} 3', text)
+        self.assertIn('t_seconds_bucket{endpoint="/x",le="+Inf"} 4', text)
+        self.assertIn('t_seconds_count{endpoint="/x"} 4', text)
+        self.assertIn('t_seconds_sum{endpoint="/x"} 4.05', text)
+
+    def test_series_are_capped(self):
+        h = Histogram("t_seconds", "test", ("endpoint",), max_series=2)
+        for i in range(5):
+            h.observe(0.01, endpoint=f"/e{i}")
+        self.assertEqual(len(h._series), 3)
+        self.assertEqual(h.count(endpoint="other"), 3)
+
+    def test_label_values_escaped(self):
+        h = Histogram("t_seconds", "test", ("endpoint",))
+        h.observe(0.01, endpoint='a"b\nc')
+        self.assertIn('endpoint="a\\"b\\nc"', h.render())
+
+
+class RequestMetricsTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_pem, cls.public_jwk = make_rsa_jwk()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self._patch = patch_key_store(self.public_jwk)
+        self._patch.start()
+        self._s3_patch = mock.patch.object(s3client, "s3", FakeS3())
+        self._s3_patch.start()
+        registry.clear()
+        with app.app_context():
+            db.create_all()
+            db.session.add(Tenant(tenant_id="laba", company_name="Lab A", subscription_tier="basic"))
+            db.session.commit()
+
+    def tearDown(self):
+        self._s3_patch.stop()
+        self._patch.stop()
+        usage_aggregator._pending.clear()
+        tenant_cache.clear()
+        registry.clear()
+        aws.reset_clients()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_route_template_tier_and_db_queries(self):
+        headers = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id='laba')}"}
+        for patient in ("P1", "P2"):
+            response = self.client.get(f"/api/v1/results/{patient}", headers=headers)
+            self.assertEqual(response.status_code, 200)
+        labels = dict(endpoint="/api/v1/results/<patient_id>", method="GET", status=200, tier="basic")
+        # Un solo patrón de ruta aunque cambie el patient_id
+        self.assertEqual(http_request_duration.count(**labels), 2)
+        series = db_queries_per_request._series[("/api/v1/results/<patient_id>", "basic")]
+        self.assertGreaterEqual(series[1], 2)
+
+        text = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn('http_request_duration_seconds_count{endpoint="/api/v1/results/<patient_id>",'
+                      'method="GET",status="200",tier="basic"} 2', text)
+        self.assertIn('auth_verify_duration_seconds_count{outcome="ok"}', text)
+        self.assertIn("# TYPE tenant_cache_lookups_total counter", text)
+
+    def test_aws_calls_timed(self):
+        from botocore.stub import Stubber
+        s3 = aws.get_client("s3", region_name="us-east-2")
+        with Stubber(s3) as stub:
+            stub.add_response("head_object", {"ContentLength": 3}, {"Bucket": "b", "Key": "k"})
+            s3.head_object(Bucket="b", Key="k")
+        self.assertEqual(aws_call_duration.count(service="s3", operation="HeadObject", outcome="ok"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db
+from app import onboarding
+from app.models import Tenant
+from app.usage import usage_aggregator
+
+
+class ClientError(Exception):
+    """Error con la forma de botocore.exceptions.ClientError"""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class StubCognito:
+    """admin_create_user con latencia fija; cuenta llamadas concurrentes"""
+
+    def __init__(self, delay=0.0, throttle_first=0, existing=()):
+        self.delay = delay
+        self.throttle_left = throttle_first
+        self.existing = set(existing)
+        self.created = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def admin_create_user(self, UserPoolId, Username, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            throttled = self.throttle_left > 0
+            self.throttle_left -= 1 if throttled else 0
+        try:
+            time.sleep(self.delay)
+            if throttled:
+                raise ClientError("TooManyRequestsException")
+            if Username in self.existing:
+                raise ClientError("UsernameExistsException")
+            with self._lock:
+                self.created.append(Username)
+            return {"User": {"Username": Username, "UserStatus": "FORCE_CHANGE_PASSWORD"}}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class OnboardingTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.results = os.path.join(self.tmp, "results.ndjson")
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        usage_aggregator._pending.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def _users(self, n, tenants=3):
+        return [{"tenant_id": f"lab{i % tenants}", "email": f"u{i}@lab{i % tenants}.mx"} for i in range(n)]
+
+    def test_reads_csv_and_ndjson(self):
+        tenants = onboarding.read_records(self._write("t.csv", "tenant_id,company_name,subscription_tier\nlab0,Lab Cero,\n"))
+        users = onboarding.read_records(self._write("u.ndjson", '{"tenant_id": "lab0", "email": "a@lab0.mx"}\n\n'))
+        self.assertEqual(tenants, [{"tenant_id": "lab0", "company_name": "Lab Cero"}])
+        self.assertEqual(users[0]["email"], "a@lab0.mx")
+
+    def test_tenants_upserted_and_users_created_concurrently(self):
+        cognito = StubCognito(delay=0.05)
+        tenants = [{"tenant_id": "lab0", "company_name": "Lab Cero", "subscription_tier": "enterprise"}]
+        with app.app_context():
+            db.session.add(Tenant(tenant_id="lab1", company_name="Viejo", subscription_tier="basic"))
+            db.session.commit()
+            started = time.perf_counter()
+            stats = onboarding.onboard(tenants, self._users(20), cognito, "pool", self.results, concurrency=5)
+            elapsed = time.perf_counter() - started
+            rows = {t.tenant_id: t for t in Tenant.query.all()}
+
+        self.assertEqual(set(rows), {"lab0", "lab1", "lab2"})
+        self.assertEqual(rows["lab0"].subscription_tier, "enterprise")
+        self.assertEqual(rows["lab1"].company_name, "Viejo")
+        self.assertEqual((stats["created"], stats["failed"]), (20, 0))
+        self.assertEqual(cognito.max_in_flight, 5)
+        # 20 usuarios x 50 ms en serie = 1 s; con 5 en paralelo ~0.2 s
+        self.assertLess(elapsed, 0.6)
+
+    def test_users_only_import_keeps_existing_tier(self):
+        with app.app_context():
+            db.session.add(Tenant(tenant_id="lab0", company_name="Lab Cero", subscription_tier="enterprise"))
+            db.session.commit()
+            onboarding.onboard([], self._users(4, tenants=2), StubCognito(), "pool", self.results)
+            rows = {t.tenant_id: t for t in Tenant.query.all()}
+        self.assertEqual(rows["lab0"].subscription_tier, "enterprise")
+        self.assertEqual(rows["lab0"].company_name, "Lab Cero")
+        # Tenant nuevo sin tier en el archivo: el valor por defecto
+        self.assertEqual(rows["lab1"].subscription_tier, "professional")
+
+    def test_throttling_backoff_and_existing_users(self):
+        cognito = StubCognito(throttle_first=3, existing={"u1@lab1.mx"})
+        create = lambda c, pool, user: onboarding.create_cognito_user(c, pool, user, backoff=0.001)
+        with app.app_context():
+            stats = onboarding.onboard([], self._users(4), cognito, "pool", self.results,
+                                       concurrency=1, create_user=create)
+        self.assertEqual((stats["created"], stats["exists"], stats["failed"]), (3, 1, 0))
+        with open(self.results) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(entries[0]["attempts"], 4)
+        self.assertTrue(all(e.get("temp_password") for e in entries if e["status"] == "created"))
+
+    def test_gives_up_after_max_retries(self):
+        cognito = StubCognito(throttle_first=100)
+        entry = onboarding.create_cognito_user(cognito, "pool", {"tenant_id": "lab0", "email": "a@lab0.mx"},
+                                               max_retries=2, sleep=lambda s: None)
+        self.assertEqual((entry["status"], entry["attempts"]), ("failed", 3))
+        self.assertIn("TooManyRequestsException", entry["error"])
+
+    def test_resume_skips_completed_users(self):
+        users = self._users(6)
+        failing = StubCognito(existing=set())
+        original = failing.admin_create_user
+
+        def fail_some(UserPoolId, Username, **kwargs):
+            if Username.startswith(("u4", "u5")):
+                raise RuntimeError("network down")
+            return original(UserPoolId, Username, **kwargs)
+        failing.admin_create_user = fail_some
+
+        with app.app_context():
+            first = onboarding.onboard([], users, failing, "pool", self.results, concurrency=3)
+            cognito = StubCognito()
+            second = onboarding.onboard([], users, cognito, "pool", self.results, concurrency=3)
+        self.assertEqual((first["created"], first["failed"]), (4, 2))
+        self.assertEqual((second["skipped"], second["users"], second["created"]), (4, 2, 2))
+        self.assertEqual(sorted(cognito.created), ["u4@lab1.mx", "u5@lab2.mx"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import sys
+import os
+from datetime import date, datetime
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db, s3client
+from app import partitions
+from app.models import LabResult
+from app.s3client import ChunkStream
+from app.tests.helpers import FakeS3
+
+
+class PartitionNamingTests(unittest.TestCase):
+    def test_add_months_across_years(self):
+        self.assertEqual(partitions.add_months(date(2026, 11, 1), 3), date(2027, 2, 1))
+        self.assertEqual(partitions.add_months(date(2026, 1, 1), -1), date(2025, 12, 1))
+        self.assertEqual(partitions.add_months(date(2026, 1, 1), -24), date(2024, 1, 1))
+
+    def test_partition_names_round_trip(self):
+        self.assertEqual(partitions.partition_name(date(2026, 3, 1)), "lab_results_y2026m03")
+        self.assertEqual(partitions.partition_month("lab_results_y2026m03"), date(2026, 3, 1))
+        self.assertIsNone(partitions.partition_month("lab_results_default"))
+
+
+class ChunkStreamTests(unittest.TestCase):
+    def test_reads_across_chunk_boundaries(self):
+        stream = ChunkStream([b"abc", b"", b"defgh", b"ij"])
+        self.assertEqual(stream.read(4), b"abcd")
+        self.assertEqual(stream.read(2), b"ef")
+        self.assertEqual(stream.read(), b"ghij")
+        self.assertEqual(stream.read(3), b"")
+
+    def test_multipart_upload_of_generated_chunks(self):
+        fake = FakeS3()
+        data = [bytes([i % 256]) * 1000 for i in range(50)]
+        with mock.patch.object(s3client, "s3", fake):
+            result = s3client.upload_stream("bucket", "k", ChunkStream(iter(data)), part_size=7000, concurrency=2)
+        self.assertEqual(result["parts"], 8)
+        self.assertEqual(fake.objects[("bucket", "k")]["Body"], b"".join(data))
+
+
+class PartitionArchiveTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.fake = FakeS3()
+        self._s3_patch = mock.patch.object(s3client, "s3", self.fake)
+        self._s3_patch.start()
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([
+                LabResult(tenant_id="laba" if i % 3 else "labb", patient_id=f"P{i}", test_code="GLU",
+                          test_data={"value": i}, created_at=datetime(2024, 5, 1 + i))
+                for i in range(9)
+            ])
+            db.session.commit()
+
+    def tearDown(self):
+        self._s3_patch.stop()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_sqlite_is_not_partitioned(self):
+        with app.app_context():
+            self.assertFalse(partitions.is_partitioned())
+            self.assertEqual(partitions.list_partitions(), [])
+            self.assertEqual(partitions.ensure_partitions(), [])
+            self.assertEqual(partitions.archive_old_partitions(keep_months=1), [])
+
+    def test_current_month_is_never_archived(self):
+        with app.app_context():
+            with self.assertRaises(ValueError):
+                partitions.archive_partition(date(2026, 10, 1), today=date(2026, 10, 17))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+import sys
+import os
+from unittest import mock
+from urllib.parse import urlparse, parse_qs, unquote
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db
+from app import s3client
+from app.models import Upload
+from app.usage import usage_aggregator
+from app.tests.helpers import make_rsa_jwk, make_token, patch_key_store, FakeS3
+
+BUCKET = "tenant-lab-bucket"
+
+
+class PresignedUploadTests(unittest.TestCase):
+    """Flujo presign -> PUT directo a S3 -> complete, contra el S3 local en memoria"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.private_pem, cls.public_jwk = make_rsa_jwk()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.fake = FakeS3()
+        self._patches = [patch_key_store(self.public_jwk), mock.patch.object(s3client, "s3", self.fake)]
+        for p in self._patches:
+            p.start()
+        self.headers = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id='laba')}"}
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        for p in self._patches:
+            p.stop()
+        usage_aggregator._pending.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _storage_pending(self, tenant="laba"):
+        return sum(b["storage_bytes"] for (t, _), b in usage_aggregator.pending().items() if t == tenant)
+
+    def _client_put(self, url, body):
+        """Simula el PUT del navegador contra la URL prefirmada"""
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        bucket = parsed.netloc.split(".")[0]
+        key = parsed.path.lstrip("/")
+        if query["method"] == ["upload_part"]:
+            return self.fake.upload_part(Bucket=bucket, Key=key, UploadId=query["UploadId"][0],
+                                         PartNumber=int(query["PartNumber"][0]), Body=body)["ETag"]
+        self.fake.put_object(Bucket=bucket, Key=key, Body=body)
+
+    def test_single_put_flow_records_storage_once(self):
+        response = self.client.post("/api/v1/uploads/presign", headers=self.headers,
+                                    json={"filename": "r.csv", "content_type": "text/csv", "size": 11})
+        self.assertEqual(response.status_code, 201)
+        data = response.get_json()
+        self.assertEqual(data["method"], "PUT")
+        self.assertTrue(data["key"].startswith("laba/uploads/"))
+        self.assertIn("ContentType=text%2Fcsv", data["upload_url"])
+        # El servidor no recibe los bytes
+        self.assertEqual(self.fake.objects, {})
+
+        self._client_put(data["upload_url"], b"hola mundo!")
+        first = self.client.post("/api/v1/uploads/complete", headers=self.headers, json={"key": data["key"]})
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.get_json()["size"], 11)
+
+        again = self.client.post("/api/v1/uploads/complete", headers=self.headers, json={"key": data["key"]})
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(self._storage_pending(), 11)
+        with app.app_context():
+            self.assertEqual(Upload.query.filter_by(tenant_id="laba").count(), 1)
+
+    def test_large_file_uses_presigned_multipart(self):
+        part = 1024
+        with mock.patch.object(s3client, "S3_PART_SIZE", part), \
+                mock.patch.object(s3client, "PRESIGN_MULTIPART_THRESHOLD", 2048):
+            response = self.client.post("/api/v1/uploads/presign", headers=self.headers,
+                                        json={"filename": "big.bin", "size": 3 * part + 10})
+        data = response.get_json()
+        self.assertEqual(data["method"], "multipart")
+        self.assertEqual(len(data["part_urls"]), 4)
+
+        body = os.urandom(3 * part + 10)
+        parts = []
+        for number, url in enumerate(data["part_urls"], start=1):
+            etag = self._client_put(url, body[(number - 1) * part:number * part])
+            parts.append({"PartNumber": number, "ETag": etag})
+
+        response = self.client.post("/api/v1/uploads/complete", headers=self.headers, json={
+            "key": data["key"], "upload_id": data["upload_id"], "parts": list(reversed(parts))
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.fake.objects[(BUCKET, data["key"])]["Body"], body)
+        self.assertEqual(self._storage_pending(), len(body))
+
+    def test_part_size_grows_past_part_limit(self):
+        size = 10001 * s3client.S3_PART_SIZE
+        self.assertLessEqual(-(-size // s3client.multipart_part_size(size)), s3client.S3_MAX_PARTS)
+
+    def test_complete_rejects_foreign_or_missing_keys(self):
+        foreign = self.client.post("/api/v1/uploads/complete", headers=self.headers,
+                                   json={"key": "labb/uploads/2024/01/01/x.bin"})
+        self.assertEqual(foreign.status_code, 403)
+        missing = self.client.post("/api/v1/uploads/complete", headers=self.headers,
+                                   json={"key": "laba/uploads/2024/01/01/nothing.bin"})
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(self._storage_pending(), 0)
+
+    def test_presigned_download_is_tenant_scoped(self):
+        response = self.client.get("/api/v1/downloads/presign?key=laba/uploads/2024/01/01/a.bin&filename=a.bin",
+                                   headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        url = response.get_json()["download_url"]
+        self.assertIn("method=get_object", url)
+        self.assertIn("ResponseContentDisposition", url)
+
+        self.assertIn('filename="a.bin"', unquote(url))
+
+        other = self.client.get("/api/v1/downloads/presign?key=labb/uploads/a.bin", headers=self.headers)
+        self.assertEqual(other.status_code, 403)
+        traversal = self.client.get("/api/v1/downloads/presign?key=laba/../labb/a.bin", headers=self.headers)
+        self.assertEqual(traversal.status_code, 403)
+
+    def test_download_filename_cannot_break_the_header(self):
+        name = 'año "2024";\r\nX-Evil: 1.csv'
+        response = self.client.get("/api/v1/downloads/presign", headers=self.headers,
+                                   query_string={"key": "laba/uploads/a.bin", "filename": name})
+        query = parse_qs(urlparse(response.get_json()["download_url"]).query)
+        disposition = query["ResponseContentDisposition"][0]
+        self.assertEqual(disposition, "attachment; filename=\"a_o 2024X-Evil: 1.csv\"; "
+                                      "filename*=UTF-8''a%C3%B1o%202024X-Evil%3A%201.csv")
+        self.assertEqual(s3client.content_disposition("\r\n"), 'attachment; filename="download"')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import unittest
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db
+from app import provisioner
+from app.models import ProvisioningJob
+from app.provisioning_jobs import ProvisioningQueue, provisioning_queue
+from app.usage import usage_aggregator
+
+
+class ClientError(Exception):
+    """Error con la forma de botocore.exceptions.ClientError"""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class ProvisioningJobTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.cognito = mock.MagicMock()
+        self.cognito.create_user_pool.return_value = {"UserPool": {"Id": "us-east-2_pool"}}
+        self.cognito.list_user_pools.return_value = {"UserPools": []}
+        self.apigw = mock.MagicMock()
+        self.apigw.create_api.return_value = {"ApiEndpoint": "https://api.example"}
+        self.apigw.get_apis.return_value = {"Items": []}
+        self._patches = [
+            mock.patch.object(provisioner, "cognito", self.cognito),
+            mock.patch.object(provisioner, "apigw", self.apigw),
+            mock.patch.object(provisioning_queue, "retry_delay", 0),
+        ]
+        for p in self._patches:
+            p.start()
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        for p in self._patches:
+            p.stop()
+        usage_aggregator._pending.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _create(self, tenant_id="labq"):
+        return self.client.post("/admin/tenants", json={"tenant_id": tenant_id, "company_name": "Lab Q"})
+
+    def _status(self, tenant_id="labq"):
+        return self.client.get(f"/admin/tenants/{tenant_id}/provisioning")
+
+    def test_create_returns_202_without_calling_aws(self):
+        started = time.perf_counter()
+        response = self._create()
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json()["provisioning"]["status"], "queued")
+        self.cognito.create_user_pool.assert_not_called()
+        self.apigw.create_api.assert_not_called()
+        self.assertEqual(self._status().get_json()["status"], "queued")
+
+        with app.app_context():
+            self.assertEqual(provisioning_queue.run_pending(), 1)
+        data = self._status().get_json()
+        self.assertEqual(data["status"], "done")
+        self.assertEqual(data["provisioning"]["user_pool_id"], "us-east-2_pool")
+        self.assertEqual(data["provisioning"]["api_endpoint"], "https://api.example")
+        self.assertEqual(data["jobs"][0]["completed_steps"], ["api_endpoint", "schema", "user_pool_id"])
+
+    def test_transient_failure_retried_without_repeating_steps(self):
+        self.apigw.create_api.side_effect = [RuntimeError("throttled"), {"ApiEndpoint": "https://api.example"}]
+        self._create()
+        with app.app_context():
+            provisioning_queue.run_pending()
+        job = self._status().get_json()["jobs"][0]
+        self.assertEqual((job["status"], job["attempts"]), ("done", 2))
+        self.cognito.create_user_pool.assert_called_once()
+        # Cada intento busca primero la API que pudo crear el anterior
+        self.assertEqual(self.apigw.get_apis.call_count, 2)
+
+    def test_failed_job_reported_and_retry_resumes(self):
+        self.apigw.create_api.side_effect = RuntimeError("quota exceeded")
+        self._create()
+        with app.app_context():
+            provisioning_queue.run_pending()
+        data = self._status().get_json()
+        self.assertEqual(data["status"], "failed")
+        self.assertIn("quota exceeded", data["jobs"][0]["error"])
+        self.assertEqual(data["jobs"][0]["attempts"], provisioning_queue.max_attempts)
+
+        self.apigw.create_api.side_effect = None
+        self.assertEqual(self.client.post("/admin/tenants/labq/provisioning/retry").status_code, 202)
+        with app.app_context():
+            provisioning_queue.run_pending()
+        self.assertEqual(self._status().get_json()["status"], "done")
+        self.cognito.create_user_pool.assert_called_once()
+
+    def test_requeued_job_finds_resources_created_before_the_failure(self):
+        # El intento anterior creó el pool y la API pero murió antes de guardarlos
+        self.cognito.list_user_pools.return_value = {"UserPools": [{"Name": "tenant-labq-pool", "Id": "us-east-2_old"}]}
+        self.apigw.get_apis.return_value = {"Items": [{"Name": "tenant-labq-api", "ApiEndpoint": "https://old.example"}]}
+        self._create()
+        with app.app_context():
+            provisioning_queue.run_pending()
+        data = self._status().get_json()
+        self.assertEqual(data["provisioning"]["user_pool_id"], "us-east-2_old")
+        self.assertEqual(data["provisioning"]["api_endpoint"], "https://old.example")
+        self.cognito.create_user_pool.assert_not_called()
+        self.apigw.create_api.assert_not_called()
+
+    def test_job_claimed_once(self):
+        self._create()
+        with app.app_context():
+            job_id = ProvisioningJob.query.one().id
+            self.assertEqual(provisioning_queue.run_job(job_id), "done")
+            self.assertIsNone(provisioning_queue.run_job(job_id))
+        self.cognito.create_user_pool.assert_called_once()
+
+    def test_background_pool_runs_job(self):
+        queue = ProvisioningQueue()
+        queue.init_app(app)
+        # Los tests configuran PROVISIONING_WORKERS=0; aquí sí se usa el pool
+        queue.workers = 1
+        with app.app_context():
+            job_id = queue.enqueue("labbg", "tenant").id
+        # enqueue ya lo envió al pool; esperar a que termine
+        queue._executor.shutdown(wait=True)
+        with app.app_context():
+            self.assertEqual(db.session.get(ProvisioningJob, job_id).status, "done")
+
+    def test_sweep_picks_up_jobs_of_a_recycled_worker(self):
+        self._create("laborphan")
+        self._create("labqueued")
+        with app.app_context():
+            orphan = ProvisioningJob.query.filter_by(tenant_id="laborphan").one()
+            orphan.status = "running"
+            db.session.commit()
+            db.session.execute(db.update(ProvisioningJob).where(ProvisioningJob.id == orphan.id)
+                               .values(updated_at=datetime.utcnow() - timedelta(hours=1)))
+            db.session.commit()
+        queue = ProvisioningQueue()
+        queue.init_app(app)
+        queue.workers = 1
+        with app.app_context():
+            self.assertEqual(queue.sweep(), 2)
+        queue._executor.shutdown(wait=True)
+        with app.app_context():
+            self.assertEqual({job.status for job in ProvisioningJob.query}, {"done"})
+
+    def test_status_unknown_tenant(self):
+        self.assertEqual(self._status("nobody").status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
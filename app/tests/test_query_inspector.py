@@ -0,0 +1,148 @@
+import unittest
+import json
+import sys
+import os
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from flask import Response
+from app import app, db, s3client
+from app.models import Tenant
+from app.query_inspector import query_inspector, normalize_sql, explain, REPORT_HEADER
+from app.tenant_cache import tenant_cache
+from app.usage import usage_aggregator
+from app.tests.helpers import make_rsa_jwk, make_token, patch_key_store, FakeS3
+
+
+class NormalizeSqlTests(unittest.TestCase):
+    def test_literals_and_in_lists_collapse(self):
+        a = normalize_sql("SELECT * FROM tenants WHERE tenant_id = 'laba' AND id IN (?, ?, ?)")
+        b = normalize_sql("SELECT *  FROM tenants\n WHERE tenant_id = 'labb' AND id IN (?, ?)")
+        self.assertEqual(a, b)
+        self.assertEqual(a, "SELECT * FROM tenants WHERE tenant_id = ? AND id IN (?, ...)")
+
+    def test_multi_row_values_collapse(self):
+        a = normalize_sql("INSERT INTO t (a, b) VALUES (%(a_m0)s, %(b_m0)s), (%(a_m1)s, %(b_m1)s)")
+        b = normalize_sql("INSERT INTO t (a, b) VALUES (%(a_m0)s, %(b_m0)s)")
+        self.assertEqual(a, "INSERT INTO t (a, b) VALUES (%(a_m0)s, %(b_m0)s), ...")
+        self.assertNotEqual(a, b)
+
+    def test_identifiers_with_digits_are_kept(self):
+        self.assertEqual(normalize_sql("SELECT col1 FROM t2 LIMIT 10"), "SELECT col1 FROM t2 LIMIT ?")
+
+
+class QueryInspectorTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_pem, cls.public_jwk = make_rsa_jwk()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self._patch = patch_key_store(self.public_jwk)
+        self._patch.start()
+        self._s3_patch = mock.patch.object(s3client, "s3", FakeS3())
+        self._s3_patch.start()
+        tenant_cache.clear()
+        query_inspector.reset()
+        query_inspector.enable()
+        self._settings = (query_inspector.repeat_threshold, query_inspector.slow_ms)
+        with app.app_context():
+            db.create_all()
+            db.session.add(Tenant(tenant_id="laba", company_name="Lab A", subscription_tier="basic"))
+            db.session.commit()
+
+    def tearDown(self):
+        query_inspector.disable()
+        query_inspector.repeat_threshold, query_inspector.slow_ms = self._settings
+        query_inspector.reset()
+        self._s3_patch.stop()
+        self._patch.stop()
+        usage_aggregator._pending.clear()
+        tenant_cache.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _run_request(self, queries):
+        with app.test_request_context("/api/v1/results/P1"):
+            query_inspector._start_request()
+            queries()
+            response = query_inspector._finish_request(Response())
+            db.session.remove()
+        return response
+
+    def test_repeated_statement_is_flagged(self):
+        query_inspector.repeat_threshold = 3
+
+        def n_plus_one():
+            for i in range(5):
+                Tenant.query.filter_by(tenant_id=f"lab{i}").first()
+
+        with self.assertLogs("app.query_inspector", level="WARNING") as logs:
+            response = self._run_request(n_plus_one)
+        report = json.loads(response.headers[REPORT_HEADER])
+        self.assertEqual(report["queries"], 5)
+        self.assertEqual(report["distinct"], 1)
+        self.assertEqual(report["repeated"][0]["count"], 5)
+        self.assertIn("FROM tenants", report["repeated"][0]["sql"])
+        self.assertTrue(any("Possible N+1" in line for line in logs.output))
+
+        summary = query_inspector.summary()["endpoints"]["GET /api/v1/results/<patient_id>"]
+        self.assertEqual(summary["requests"], 1)
+        self.assertEqual(summary["flagged_requests"], 1)
+        self.assertEqual(summary["repeated"][0]["max_count"], 5)
+
+    def test_under_threshold_is_not_flagged(self):
+        query_inspector.repeat_threshold = 5
+        response = self._run_request(lambda: [Tenant.query.filter_by(tenant_id="laba").first() for _ in range(5)])
+        report = json.loads(response.headers[REPORT_HEADER])
+        self.assertEqual(report["queries"], 5)
+        self.assertEqual(report["repeated"], [])
+
+    def test_slow_select_logged_with_plan(self):
+        query_inspector.slow_ms = 0
+        with self.assertLogs("app.query_inspector", level="WARNING") as logs:
+            response = self._run_request(lambda: Tenant.query.filter_by(tenant_id="laba").first())
+        self.assertEqual(json.loads(response.headers[REPORT_HEADER])["slow"], 1)
+        slow = query_inspector.summary()["slow_queries"]
+        self.assertEqual(len(slow), 1)
+        self.assertEqual(slow[0]["endpoint"], "GET /api/v1/results/<patient_id>")
+        # EXPLAIN QUERY PLAN en SQLite: usa el índice único de tenant_id
+        self.assertTrue(slow[0]["plan"])
+        self.assertIn("tenants", " ".join(slow[0]["plan"]))
+        self.assertTrue(any("plan:" in line for line in logs.output))
+
+    def test_failed_explain_keeps_the_transaction_usable(self):
+        with app.app_context():
+            conn = db.session.connection()
+            plan = explain(conn, "SELECT * FROM no_such_table", {})
+            self.assertTrue(plan[0].startswith("EXPLAIN failed"))
+            # En PostgreSQL sin SAVEPOINT esto fallaría con InFailedSqlTransaction
+            db.session.add(Tenant(tenant_id="labb", company_name="Lab B", subscription_tier="basic"))
+            db.session.commit()
+            self.assertEqual(Tenant.query.count(), 2)
+
+    def test_disabled_adds_nothing(self):
+        query_inspector.disable()
+        response = self._run_request(lambda: Tenant.query.first())
+        self.assertNotIn(REPORT_HEADER, response.headers)
+        self.assertEqual(query_inspector.summary()["endpoints"], {})
+
+    def test_real_request_and_summary_endpoint(self):
+        headers = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id='laba')}"}
+        response = self.client.get("/api/v1/results/P1", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(json.loads(response.headers[REPORT_HEADER])["queries"], 1)
+
+        summary = self.client.get("/admin/queries").get_json()
+        self.assertTrue(summary["enabled"])
+        self.assertIn("GET /api/v1/results/<patient_id>", summary["endpoints"])
+
+        self.assertEqual(self.client.delete("/admin/queries").status_code, 200)
+        self.assertNotIn("GET /api/v1/results/<patient_id>", query_inspector.summary()["endpoints"])
+
+
+if __name__ == "__main__":
+    unittest.main()
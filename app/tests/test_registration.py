@@ -0,0 +1,171 @@
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db
+from app import config, provisioner, tenant_registration
+from app.models import Tenant, ProvisioningJob
+from app.provisioning_jobs import ProvisioningQueue, provisioning_queue
+from app.usage import usage_aggregator
+
+
+class RegistrationTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.cognito = mock.MagicMock()
+        self._patch = mock.patch.object(tenant_registration, "get_client", return_value=self.cognito)
+        self._patch.start()
+        with app.app_context():
+            db.create_all()
+
+    def _local_pool(self):
+        # Worker con pool propio; submit no hace nada para correr el job a mano en el test
+        return [mock.patch.object(provisioning_queue, "workers", 1),
+                mock.patch.object(provisioning_queue, "submit", return_value=None)]
+
+    def _start(self, patches):
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        provisioning_queue._secrets.clear()
+        self._patch.stop()
+        usage_aggregator._pending.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_register_inserts_tenant_through_app_engine(self):
+        self._start(self._local_pool())
+        response = self.client.post("/api/public/register", json={
+            "company_name": "Lab Norte", "email": "a@labnorte.mx", "contact_name": "Ana"
+        })
+        self.assertEqual(response.status_code, 202)
+        tenant_id = response.get_json()["tenant_id"]
+        self.assertTrue(tenant_id.startswith("lab_norte_"))
+        with app.app_context():
+            tenant = Tenant.query.filter_by(tenant_id=tenant_id).one()
+        self.assertEqual(tenant.subscription_tier, "professional")
+        # Cognito se llama desde el job, no dentro del request
+        self.cognito.admin_create_user.assert_not_called()
+        self.assertEqual(self.client.get(f"/api/public/register/{tenant_id}/status").get_json()["status"], "queued")
+        with app.app_context():
+            # La contraseña temporal nunca se guarda en la tabla de jobs
+            self.assertNotIn("temp_password", ProvisioningJob.query.filter_by(tenant_id=tenant_id).one().payload)
+
+        with app.app_context():
+            self.assertEqual(provisioning_queue.run_pending(), 1)
+            job = ProvisioningJob.query.filter_by(tenant_id=tenant_id).one()
+            self.assertEqual(job.status, "done")
+        self.cognito.admin_create_user.assert_called_once()
+        kwargs = self.cognito.admin_create_user.call_args.kwargs
+        self.assertEqual(kwargs["TemporaryPassword"], response.get_json()["temp_password"])
+        self.assertEqual(provisioning_queue._secrets, {})
+        self.assertEqual(self.client.get(f"/api/public/register/{tenant_id}/status").get_json()["status"], "done")
+
+    def test_job_without_the_password_lets_cognito_send_it(self):
+        # PROVISIONING_WORKERS=0: el job lo corre otro proceso, que no tiene la contraseña
+        response = self.client.post("/api/public/register", json={"company_name": "Lab Este", "email": "c@labeste.mx",
+                                                                   "contact_name": "Carla"})
+        self.assertEqual(response.status_code, 202)
+        self.assertNotIn("temp_password", response.get_json())
+        self.assertEqual(provisioning_queue._secrets, {})
+        with app.app_context():
+            provisioning_queue.run_pending()
+        kwargs = self.cognito.admin_create_user.call_args.kwargs
+        self.assertNotIn("TemporaryPassword", kwargs)
+        self.assertNotIn("MessageAction", kwargs)
+        self.assertEqual(kwargs["Username"], "c@labeste.mx")
+
+    def test_other_workers_leave_the_job_to_the_one_with_the_password(self):
+        self._start(self._local_pool())
+        response = self.client.post("/api/public/register", json={"company_name": "Lab Centro", "email": "e@labc.mx",
+                                                                   "contact_name": "Eva"})
+        temp_password = response.get_json()["temp_password"]
+        other = ProvisioningQueue(workers=0)
+        other.init_app(app)
+        with app.app_context():
+            job_id = ProvisioningJob.query.one().id
+            # Otro worker (o el cron) no lo toma durante secret_grace...
+            self.assertEqual(other.sweep(), 0)
+            self.assertEqual(other.run_pending(), 0)
+            # ...el worker que lo encoló sí, con la contraseña que recibió el cliente
+            self.assertEqual(provisioning_queue._queued_ids(), [job_id])
+            self.assertEqual(provisioning_queue.run_job(job_id), "done")
+        self.assertEqual(self.cognito.admin_create_user.call_args.kwargs["TemporaryPassword"], temp_password)
+        with app.app_context():
+            self.assertNotIn("secrets_until", db.session.get(ProvisioningJob, job_id).payload)
+
+    def test_job_of_a_dead_worker_runs_after_the_grace(self):
+        self._start(self._local_pool())
+        self.client.post("/api/public/register", json={"company_name": "Lab Alto", "email": "f@labalto.mx",
+                                                       "contact_name": "Fer"})
+        other = ProvisioningQueue(workers=0)
+        other.init_app(app)
+        later = datetime.utcnow() + timedelta(seconds=provisioning_queue.secret_grace + 1)
+        with app.app_context(), mock.patch("app.provisioning_jobs.datetime") as clock:
+            clock.utcnow.return_value = later
+            clock.fromisoformat = datetime.fromisoformat
+            self.assertEqual(other.run_pending(), 1)
+        self.assertNotIn("TemporaryPassword", self.cognito.admin_create_user.call_args.kwargs)
+
+    def test_failed_job_forgets_the_password(self):
+        self._start(self._local_pool())
+        self.cognito.admin_create_user.side_effect = RuntimeError("cognito down")
+        with mock.patch.object(provisioning_queue, "retry_delay", 0):
+            self.client.post("/api/public/register", json={"company_name": "Lab Oeste", "email": "d@laboeste.mx",
+                                                           "contact_name": "Dani"})
+            with app.app_context():
+                provisioning_queue.run_pending()
+                self.assertEqual(ProvisioningJob.query.one().status, "failed")
+        self.assertEqual(provisioning_queue._secrets, {})
+
+    def test_repeated_registration_does_not_duplicate(self):
+        data = {"company_name": "Lab Sur", "email": "b@labsur.mx", "contact_name": "Beto"}
+
+        class FixedDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return cls(2024, 5, 1, 12, 0)
+
+            @classmethod
+            def utcnow(cls):
+                return datetime(2024, 5, 1, 18, 0)
+
+        # El tenant_id incluye el minuto: fijarlo para que ambos registros coincidan
+        with app.app_context(), mock.patch.object(tenant_registration, "datetime", FixedDatetime):
+            first = tenant_registration.create_new_tenant_with_user(data)
+            second = tenant_registration.create_new_tenant_with_user(data)
+            self.assertTrue(first["success"] and second["success"])
+            count = Tenant.query.filter_by(tenant_id=first["tenant_id"]).count()
+        self.assertEqual(first["tenant_id"], "lab_sur_202405011200")
+        self.assertEqual(count, 1)
+
+
+class PoolConfigTests(unittest.TestCase):
+    def test_engine_options_for_postgres(self):
+        options = config.engine_options("postgresql://u:p@db:5432/lab")
+        self.assertEqual(options["pool_size"], config.DB_POOL_SIZE)
+        self.assertEqual(options["max_overflow"], config.DB_MAX_OVERFLOW)
+        self.assertTrue(options["pool_pre_ping"])
+        self.assertIn("pool_recycle", options)
+
+    def test_sqlite_keeps_default_pool(self):
+        self.assertEqual(config.engine_options("sqlite://"), {})
+
+    def test_schema_name_is_validated(self):
+        with app.app_context():
+            with self.assertRaises(ValueError):
+                provisioner.create_schema_for_tenant("lab; DROP TABLE tenants")
+            # SQLite no tiene schemas: no falla
+            provisioner.create_schema_for_tenant("laba")
+
+
+if __name__ == '__main__':
+    unittest.main()
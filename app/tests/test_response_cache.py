@@ -0,0 +1,197 @@
+import unittest
+import sys
+import os
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import event
+from app import app, db
+from app.models import Tenant
+from app.response_cache import response_cache, MemoryBackend, RedisBackend, CachedResponse
+from app.tenant_cache import tenant_cache
+from app.usage import usage_aggregator, incr_results_processed
+from app.tests.helpers import make_rsa_jwk, make_token, patch_key_store
+
+
+class FakeRedis:
+    """Lo mínimo de redis.Redis que usa RedisBackend (en memoria, sin TTL)"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, px=None):
+        self.data[key] = value
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+
+    def pipeline(self):
+        redis, calls = self, []
+
+        class Pipeline:
+            def incr(self, key):
+                calls.append(key)
+
+            def execute(self):
+                for key in calls:
+                    redis.incr(key)
+        return Pipeline()
+
+    def dbsize(self):
+        return len(self.data)
+
+
+class BrokenBackend(MemoryBackend):
+    name = "broken"
+
+    def generations(self, tags):
+        raise ConnectionError("cache down")
+
+
+class ResponseCacheTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_pem, cls.public_jwk = make_rsa_jwk()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self._backend = response_cache.backend
+        response_cache.backend = MemoryBackend()
+        response_cache.clear()
+        self._store_patch = patch_key_store(self.public_jwk)
+        self._store_patch.start()
+        tenant_cache.clear()
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([Tenant(tenant_id="laba", company_name="Lab A", subscription_tier="basic"),
+                                Tenant(tenant_id="labb", company_name="Lab B", subscription_tier="professional")])
+            db.session.commit()
+        self.statements = []
+
+    def tearDown(self):
+        self._store_patch.stop()
+        response_cache.backend = self._backend
+        usage_aggregator._pending.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def _get(self, path, **headers):
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", self._count)
+            try:
+                return self.client.get(path, headers=headers)
+            finally:
+                event.remove(db.engine, "before_cursor_execute", self._count)
+
+    def test_repeat_is_served_from_cache_and_revalidates_with_304(self):
+        first = self._get("/admin/tenants")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers["X-Cache"], "MISS")
+        etag = first.headers["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        self.assertEqual(first.headers["Cache-Control"], "private, no-cache")
+
+        self.statements.clear()
+        second = self._get("/admin/tenants")
+        self.assertEqual(second.headers["X-Cache"], "HIT")
+        self.assertEqual(second.get_data(), first.get_data())
+        self.assertEqual(self.statements, [])
+
+        not_modified = self._get("/admin/tenants", **{"If-None-Match": etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.get_data(), b"")
+        self.assertEqual(not_modified.headers["ETag"], etag)
+        self.assertEqual(self.statements, [])
+        self.assertEqual(response_cache.stats()["not_modified"], 1)
+
+    def test_tenant_changes_invalidate(self):
+        etag = self.client.get("/admin/tenants").headers["ETag"]
+        self.client.patch("/admin/tenants/laba", json={"company_name": "Lab A2"})
+        response = self.client.get("/admin/tenants", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["X-Cache"], "MISS")
+        self.assertIn("Lab A2", [t["company_name"] for t in response.get_json()["tenants"]])
+
+    def test_usage_flush_invalidates_only_that_tenant(self):
+        path_a, path_b = "/admin/billing/tenants/laba/usage", "/admin/billing/tenants/labb/usage"
+        self.assertEqual(self.client.get(path_a).get_json()["total_results"], 0)
+        self.client.get(path_b)
+        incr_results_processed("laba", 3)
+        usage_aggregator.flush()
+        response = self.client.get(path_a)
+        self.assertEqual(response.headers["X-Cache"], "MISS")
+        self.assertEqual(response.get_json()["total_results"], 3)
+        self.assertEqual(self.client.get(path_b).headers["X-Cache"], "HIT")
+
+    def test_billing_is_keyed_per_tenant(self):
+        def billing(tenant_id):
+            headers = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id=tenant_id)}"}
+            return self.client.get("/api/v1/admin/billing", headers=headers)
+
+        self.assertEqual(billing("laba").get_json()["tenant_id"], "laba")
+        response = billing("labb")
+        self.assertEqual(response.headers["X-Cache"], "MISS")
+        self.assertEqual(response.get_json()["tenant_id"], "labb")
+        self.assertEqual(billing("laba").headers["X-Cache"], "HIT")
+
+    def test_errors_are_not_cached(self):
+        path = "/admin/billing/tenants/laba/usage?from=2026-01"
+        self.assertEqual(self.client.get(path).status_code, 400)
+        self.assertEqual(self.client.get(path).status_code, 400)
+        self.assertEqual(response_cache.stats()["hits"], 0)
+
+    def test_public_tiers(self):
+        response = self.client.get("/api/public/subscription-tiers")
+        self.assertEqual(response.headers["Cache-Control"], "public, max-age=3600")
+        self.assertEqual(len(response.get_json()["tiers"]), 3)
+
+    def test_backend_failure_serves_uncached(self):
+        response_cache.backend = BrokenBackend()
+        response = self.client.get("/admin/tenants")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Cache", response.headers)
+        self.assertEqual(response_cache.stats()["errors"], 1)
+
+    def test_redis_backend(self):
+        response_cache.backend = RedisBackend(client=FakeRedis())
+        first = self.client.get("/admin/tenants")
+        second = self.client.get("/admin/tenants")
+        self.assertEqual(second.headers["X-Cache"], "HIT")
+        self.assertEqual(second.get_data(), first.get_data())
+        self.assertEqual(second.mimetype, "application/json")
+        response_cache.invalidate_tenant("laba")
+        self.assertEqual(self.client.get("/admin/tenants").headers["X-Cache"], "MISS")
+
+
+class MemoryBackendTests(unittest.TestCase):
+    def test_ttl_and_lru(self):
+        backend = MemoryBackend(maxsize=2)
+        entry = CachedResponse(b"{}", "e", "application/json")
+        backend.set("a", entry, 10, now=0)
+        backend.set("b", entry, 10, now=0)
+        backend.get("a", now=1)
+        backend.set("c", entry, 10, now=1)
+        self.assertIsNone(backend.get("b", now=1))
+        self.assertEqual(backend.get("a", now=1), entry)
+        self.assertIsNone(backend.get("a", now=11))
+
+    def test_bump(self):
+        backend = MemoryBackend()
+        backend.bump(["tenant:laba"])
+        self.assertEqual(backend.generations(["tenant:laba", "tenant:labb"]), [1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import sys
+import os
+import json
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db
+from app.models import Tenant, LabResult
+from app.usage import usage_aggregator
+from app.tenant_cache import tenant_cache
+from app.tests.helpers import make_rsa_jwk, make_token, patch_key_store
+
+
+class ResultsBatchTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_pem, cls.public_jwk = make_rsa_jwk()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self._store_patch = patch_key_store(self.public_jwk)
+        self._store_patch.start()
+        self.headers = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id='laba')}"}
+        # Los tenants se insertan sin pasar por la invalidación de la caché
+        tenant_cache.clear()
+        with app.app_context():
+            db.create_all()
+            db.session.add(Tenant(tenant_id="laba", company_name="Lab A", subscription_tier="basic"))
+            db.session.commit()
+        usage_aggregator.flush()
+
+    def tearDown(self):
+        self._store_patch.stop()
+        usage_aggregator._pending.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_json_array_returns_ids_in_order(self):
+        items = [{"patient_id": f"P{i}", "test_code": "HBA1C", "test_data": {"value": i}} for i in range(5)]
+        response = self.client.post("/api/v1/results:batch", json=items, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        body = response.get_json()
+        self.assertEqual(body["created"], 5)
+        with app.app_context():
+            for i, result_id in enumerate(body["ids"]):
+                self.assertEqual(db.session.get(LabResult, result_id).patient_id, f"P{i}")
+        pending = usage_aggregator.pending()
+        bucket = next(v for (tenant, _), v in pending.items() if tenant == "laba")
+        self.assertEqual((bucket["results_processed"], bucket["api_calls"]), (5, 1))
+
+    def test_ndjson_with_per_item_errors(self):
+        lines = [
+            json.dumps({"patient_id": "P1", "test_code": "GLU"}),
+            "{not json",
+            json.dumps({"patient_id": "P2"}),
+            json.dumps({"patient_id": "P3", "test_code": "GLU"}),
+        ]
+        response = self.client.post("/api/v1/results:batch", data="\n".join(lines),
+                                    content_type="application/x-ndjson", headers=self.headers)
+        self.assertEqual(response.status_code, 207)
+        body = response.get_json()
+        self.assertEqual(body["created"], 2)
+        self.assertIsNone(body["ids"][1])
+        self.assertIsNone(body["ids"][2])
+        self.assertEqual([e["index"] for e in body["errors"]], [1, 2])
+        self.assertLess(body["ids"][0], body["ids"][3])
+
+    def test_all_invalid_is_rejected(self):
+        response = self.client.post("/api/v1/results:batch", json=[{"test_code": "X"}], headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        with app.app_context():
+            self.assertEqual(LabResult.query.count(), 0)
+
+    def test_unknown_tenant(self):
+        headers = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id='nope')}"}
+        response = self.client.post("/api/v1/results:batch", json=[{"patient_id": "P", "test_code": "X"}],
+                                    headers=headers)
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
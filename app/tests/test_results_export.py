@@ -0,0 +1,107 @@
+import unittest
+import sys
+import os
+import csv
+import gzip
+import io
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db
+from app.models import LabResult
+from app.usage import usage_aggregator
+from app.tests.helpers import make_rsa_jwk, make_token, patch_key_store
+
+
+class ResultsExportTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_pem, cls.public_jwk = make_rsa_jwk()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self._store_patch = patch_key_store(self.public_jwk)
+        self._store_patch.start()
+        self.headers = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id='laba')}"}
+        self.base = datetime(2026, 1, 1)
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        self._store_patch.stop()
+        usage_aggregator._pending.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _seed(self, n, tenant_id="laba"):
+        rows = [{
+            "tenant_id": tenant_id,
+            "patient_id": f"P{i % 500}",
+            "test_code": "HBA1C",
+            "test_data": {"value": i, "unit": "%", "notes": "x" * 150},
+            "created_at": self.base + timedelta(seconds=i)
+        } for i in range(n)]
+        with app.app_context():
+            db.session.execute(insert(LabResult), rows)
+            db.session.commit()
+
+    def _stream(self, query, headers=None):
+        """Consume the streamed body chunk by chunk; returns (response, bytes, peak traced memory)"""
+        response = self.client.get(f"/api/v1/results/export{query}",
+                                   headers={**self.headers, **(headers or {})}, buffered=False)
+        total = io.BytesIO() if headers is None else None
+        size = 0
+        tracemalloc.start()
+        for chunk in response.response:
+            size += len(chunk)
+            if total is not None:
+                total.write(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        response.close()
+        return response, (total.getvalue() if total is not None else size), peak
+
+    def test_ndjson_since_filter(self):
+        self._seed(10)
+        self._seed(3, tenant_id="labb")
+        since = (self.base + timedelta(seconds=4)).isoformat()
+        response, body, _ = self._stream(f"?format=ndjson&since={since}")
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([r["test_data"]["value"] for r in lines], list(range(4, 10)))
+
+    def test_csv_gzip(self):
+        self._seed(5)
+        response = self.client.get("/api/v1/results/export?format=csv",
+                                   headers={**self.headers, "Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        rows = list(csv.reader(io.StringIO(gzip.decompress(response.data).decode())))
+        self.assertEqual(rows[0], ["id", "patient_id", "test_code", "created_at", "test_data"])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(json.loads(rows[1][4])["value"], 0)
+
+    def test_invalid_format(self):
+        response = self.client.get("/api/v1/results/export?format=xml", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_large_export_memory_is_flat(self):
+        """El pico de memoria no crece con el número de filas exportadas"""
+        self._seed(5000)
+        _, small_size, small_peak = self._stream("?format=ndjson", headers={})
+        self._seed(25000)
+        _, large_size, large_peak = self._stream("?format=ndjson", headers={})
+        self.assertGreater(large_size, 5 * small_size)
+        self.assertLess(large_size, 20 * 1024 * 1024)
+        # ~1.5 MB vs ~9 MB exportados: el pico se mantiene igual
+        self.assertLess(large_peak, small_peak * 1.25 + 256 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
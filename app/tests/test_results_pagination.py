@@ -0,0 +1,87 @@
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from unittest import mock
+from app import app, db, s3client
+from app.models import LabResult
+from app.usage import usage_aggregator
+from app.tests.helpers import make_rsa_jwk, make_token, patch_key_store, FakeS3
+
+
+class ResultsPaginationTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_pem, cls.public_jwk = make_rsa_jwk()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self._store_patch = patch_key_store(self.public_jwk)
+        self._store_patch.start()
+        # Sin archivo en S3: las páginas salen sólo de la base
+        self._s3_patch = mock.patch.object(s3client, "s3", FakeS3())
+        self._s3_patch.start()
+        self.headers = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id='laba')}"}
+        base = datetime(2026, 1, 1)
+        with app.app_context():
+            db.create_all()
+            # Dos resultados con el mismo created_at para probar el desempate por id
+            for i in range(7):
+                db.session.add(LabResult(tenant_id="laba", patient_id="P1",
+                                         test_code="GLU" if i % 2 else "HBA1C",
+                                         test_data={"value": i},
+                                         created_at=base + timedelta(minutes=min(i, 5))))
+            db.session.add(LabResult(tenant_id="labb", patient_id="P1", test_code="GLU"))
+            db.session.commit()
+
+    def tearDown(self):
+        self._s3_patch.stop()
+        self._store_patch.stop()
+        usage_aggregator._pending.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _get(self, query=""):
+        response = self.client.get(f"/api/v1/results/P1{query}", headers=self.headers)
+        return response.status_code, response.get_json()
+
+    def test_pages_cover_all_results_in_order(self):
+        seen, cursor = [], None
+        while True:
+            status, body = self._get(f"?limit=3" + (f"&after={cursor}" if cursor else ""))
+            self.assertEqual(status, 200)
+            self.assertLessEqual(body["count"], 3)
+            seen.extend(r["test_data"]["value"] for r in body["results"])
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen, list(range(7)))
+
+    def test_fields_projection_skips_test_data(self):
+        status, body = self._get("?fields=id,test_code")
+        self.assertEqual(status, 200)
+        self.assertEqual(set(body["results"][0]), {"id", "test_code"})
+
+    def test_test_code_filter(self):
+        status, body = self._get("?test_code=GLU")
+        self.assertEqual(body["count"], 3)
+        self.assertTrue(all(r["test_code"] == "GLU" for r in body["results"]))
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self._get("?fields=password")[0], 400)
+        self.assertEqual(self._get("?after=garbage")[0], 400)
+        self.assertEqual(self._get("?limit=0")[0], 400)
+
+    def test_composite_index_declared(self):
+        index = next(ix for ix in LabResult.__table__.indexes
+                     if ix.name == "ix_lab_results_tenant_patient_created")
+        self.assertEqual([c.name for c in index.columns], ["tenant_id", "patient_id", "created_at", "id"])
+
+
+if __name__ == '__main__':
+    unittest.main()
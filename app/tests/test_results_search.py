@@ -0,0 +1,179 @@
+import unittest
+import sys
+import os
+import json
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import text
+from app import app, db
+from app.models import Tenant, LabResult, ResultAnalyte
+from app.results import extract_analytes, backfill_analytes, parse_search_args, InvalidQuery
+from app.usage import usage_aggregator
+from app.tenant_cache import tenant_cache
+from app.tests.helpers import make_rsa_jwk, make_token, patch_key_store
+
+
+class ExtractAnalytesTests(unittest.TestCase):
+    def test_value_key_named_after_test_code(self):
+        self.assertEqual(extract_analytes("HBA1C", {"value": 6.8, "unit": "%"}), [("hba1c", 6.8)])
+
+    def test_numeric_keys_only(self):
+        data = {"glucose": 110, "ldl": 130.5, "flag": "H", "fasting": True, "note": None, "nan": float("nan")}
+        self.assertEqual(extract_analytes("LIPID", data), [("glucose", 110.0), ("ldl", 130.5)])
+
+    def test_one_row_per_analyte(self):
+        # La clave con el nombre del analito gana a "value", en cualquier orden
+        self.assertEqual(extract_analytes("HBA1C", {"value": 6.8, "hba1c": 6.9}), [("hba1c", 6.9)])
+        self.assertEqual(extract_analytes("HBA1C", {"HbA1c": 6.9, "value": 6.8}), [("hba1c", 6.9)])
+        self.assertEqual(extract_analytes("LIPID", {"LDL": 130, "ldl": 131}), [("ldl", 130.0)])
+
+    def test_bare_number_and_non_objects(self):
+        self.assertEqual(extract_analytes("TSH", 2.5), [("tsh", 2.5)])
+        self.assertEqual(extract_analytes("TSH", ["x"]), [])
+        self.assertEqual(extract_analytes("TSH", None), [])
+
+
+class SearchArgsTests(unittest.TestCase):
+    def test_days_and_bounds(self):
+        now = datetime(2026, 10, 1)
+        criteria = parse_search_args({"analyte": "HbA1c", "gt": "6.5", "days": "90"}, now=now)
+        self.assertEqual(criteria["analyte"], "hba1c")
+        self.assertEqual(criteria["bounds"], {"gt": 6.5})
+        self.assertEqual(criteria["since"], now - timedelta(days=90))
+
+    def test_invalid_arguments(self):
+        for args in ({}, {"gt": "6"}, {"analyte": "x", "gt": "abc"}, {"analyte": "x", "days": "0"},
+                     {"test_code": "X", "from": "yesterday"}, {"match": "[1]"}, {"match": '{"a b": 1}'}):
+            with self.assertRaises(InvalidQuery, msg=args):
+                parse_search_args(args)
+
+    def test_date_only_to_is_inclusive(self):
+        criteria = parse_search_args({"test_code": "GLU", "to": "2026-03-31"})
+        self.assertEqual(criteria["until"], datetime(2026, 4, 1))
+
+
+class ResultsSearchTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_pem, cls.public_jwk = make_rsa_jwk()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self._store_patch = patch_key_store(self.public_jwk)
+        self._store_patch.start()
+        self.headers = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id='laba')}"}
+        tenant_cache.clear()
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([Tenant(tenant_id="laba", company_name="Lab A", subscription_tier="basic"),
+                                Tenant(tenant_id="labb", company_name="Lab B", subscription_tier="basic")])
+            db.session.commit()
+        items = [
+            {"patient_id": "P1", "test_code": "HBA1C", "test_data": {"value": 7.1, "flag": "H"}},
+            {"patient_id": "P2", "test_code": "HBA1C", "test_data": {"value": 5.4}},
+            {"patient_id": "P3", "test_code": "HBA1C", "test_data": {"value": 6.5}},
+            {"patient_id": "P1", "test_code": "LIPID", "test_data": {"ldl": 160, "hdl": 40, "flag": "H"}},
+        ]
+        response = self.client.post("/api/v1/results:batch", json=items, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.ids = response.get_json()["ids"]
+
+    def tearDown(self):
+        self._store_patch.stop()
+        usage_aggregator._pending.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _search(self, headers=None, **params):
+        return self.client.get("/api/v1/results/search", query_string=params, headers=headers or self.headers)
+
+    def test_batch_and_single_ingest_fill_the_index(self):
+        response = self.client.post("/api/v1/results", headers=self.headers,
+                                    json={"patient_id": "P9", "test_code": "GLU", "test_data": {"value": 99}})
+        self.assertEqual(response.status_code, 201)
+        with app.app_context():
+            analytes = {(a.analyte, a.value) for a in ResultAnalyte.query.filter_by(tenant_id="laba")}
+        self.assertEqual(analytes, {("hba1c", 7.1), ("hba1c", 5.4), ("hba1c", 6.5),
+                                    ("ldl", 160.0), ("hdl", 40.0), ("glu", 99.0)})
+
+    def test_value_and_named_key_give_one_hit(self):
+        response = self.client.post("/api/v1/results", headers=self.headers, json={
+            "patient_id": "P8", "test_code": "HBA1C", "test_data": {"value": 8.0, "hba1c": 8.2}})
+        self.assertEqual(response.status_code, 201)
+        body = self._search(analyte="hba1c", gt="7.5").get_json()
+        self.assertEqual([(r["patient_id"], r["value"]) for r in body["results"]], [("P8", 8.2)])
+
+    def test_analyte_range(self):
+        body = self._search(analyte="hba1c", gt="6.5", days="90").get_json()
+        self.assertEqual([r["patient_id"] for r in body["results"]], ["P1"])
+        self.assertEqual(body["results"][0]["value"], 7.1)
+        self.assertEqual(body["results"][0]["test_data"], {"value": 7.1, "flag": "H"})
+
+        body = self._search(analyte="hba1c", gte="6.5").get_json()
+        self.assertEqual(sorted(r["patient_id"] for r in body["results"]), ["P1", "P3"])
+
+    def test_index_only_fields(self):
+        body = self._search(analyte="ldl", fields="id,patient_id,value").get_json()
+        self.assertEqual(body["results"], [{"id": self.ids[3], "patient_id": "P1", "value": 160.0}])
+
+    def test_test_code_and_match(self):
+        body = self._search(test_code="HBA1C").get_json()
+        self.assertEqual(body["count"], 3)
+        self.assertNotIn("value", body["results"][0])
+
+        body = self._search(match=json.dumps({"flag": "H"})).get_json()
+        self.assertEqual(sorted(r["test_code"] for r in body["results"]), ["HBA1C", "LIPID"])
+
+        body = self._search(analyte="hba1c", match=json.dumps({"flag": "H"}), fields="id").get_json()
+        self.assertEqual(body["results"], [{"id": self.ids[0]}])
+
+    def test_date_range_excludes_old_results(self):
+        with app.app_context():
+            old = datetime.utcnow() - timedelta(days=200)
+            db.session.query(LabResult).filter(LabResult.id == self.ids[0]).update({"created_at": old})
+            db.session.query(ResultAnalyte).filter(ResultAnalyte.result_id == self.ids[0]).update({"observed_at": old})
+            db.session.commit()
+        body = self._search(analyte="hba1c", gt="6", days="90").get_json()
+        self.assertEqual([r["patient_id"] for r in body["results"]], ["P3"])
+        body = self._search(test_code="HBA1C", **{"from": (datetime.utcnow() - timedelta(days=90)).isoformat()}).get_json()
+        self.assertEqual(body["count"], 2)
+
+    def test_pagination(self):
+        first = self._search(analyte="hba1c", limit=2).get_json()
+        self.assertEqual(first["count"], 2)
+        second = self._search(analyte="hba1c", limit=2, after=first["next_cursor"]).get_json()
+        self.assertEqual(second["count"], 1)
+        self.assertIsNone(second["next_cursor"])
+        ids = [r["id"] for r in first["results"] + second["results"]]
+        self.assertEqual(sorted(ids), sorted(self.ids[:3]))
+
+    def test_tenant_isolation(self):
+        other = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id='labb')}"}
+        self.assertEqual(self._search(headers=other, analyte="hba1c").get_json()["count"], 0)
+
+    def test_bad_query_is_400(self):
+        self.assertEqual(self._search(gt="6").status_code, 400)
+        self.assertEqual(self._search(analyte="x", fields="nope").status_code, 400)
+        nested = self._search(match=json.dumps({"a": {"b": 1}})).status_code
+        # JSONB @> admite objetos anidados; fuera de PostgreSQL sólo escalares
+        with app.app_context():
+            self.assertEqual(nested, 200 if db.engine.dialect.name == "postgresql" else 400)
+
+    def test_backfill_indexes_old_results(self):
+        with app.app_context():
+            db.session.execute(text("DELETE FROM result_analytes"))
+            db.session.add(LabResult(tenant_id="laba", patient_id="P5", test_code="NOTE", test_data={"text": "ok"}))
+            db.session.commit()
+            self.assertEqual(backfill_analytes(batch_size=2), 5)
+            self.assertEqual(ResultAnalyte.query.count(), 5)
+            # Los ya indexados no se repiten
+            self.assertEqual(backfill_analytes(), 1)
+            self.assertEqual(ResultAnalyte.query.count(), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+import gzip
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app
+from app.static_assets import static_assets, brotli, AssetPipeline, build_assets, write_build, nginx_config
+
+FRONTEND = os.path.join(os.path.dirname(__file__), "..", "..", "frontend")
+
+
+class StaticAssetsTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with open(os.path.join(FRONTEND, "app.js"), "rb") as f:
+            self.app_js = f.read()
+
+    def test_index_points_to_hashed_names(self):
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        html = response.get_data(as_text=True)
+        self.assertIn(f'src="{static_assets.hashed["app.js"]}"', html)
+        self.assertIn(f'href="{static_assets.hashed["styles.css"]}"', html)
+        self.assertNotIn('src="app.js"', html)
+
+    def test_hashed_asset_is_immutable_and_gzipped(self):
+        path = "/" + static_assets.hashed["app.js"]
+        response = self.client.get(path, headers={"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(response.mimetype, "application/javascript")
+        self.assertLess(len(response.get_data()), len(self.app_js))
+        self.assertEqual(gzip.decompress(response.get_data()), self.app_js)
+
+        plain = self.client.get(path)
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(plain.get_data(), self.app_js)
+        self.assertNotEqual(plain.headers["ETag"], response.headers["ETag"])
+
+    def test_if_none_match_is_304(self):
+        first = self.client.get("/styles.css", headers={"Accept-Encoding": "gzip"})
+        again = self.client.get("/styles.css", headers={"Accept-Encoding": "gzip",
+                                                         "If-None-Match": first.headers["ETag"]})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.get_data(), b"")
+        # La misma ETag no vale para otra codificación
+        plain = self.client.get("/styles.css", headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(plain.status_code, 200)
+
+    def test_gzip_rejected_with_q0(self):
+        response = self.client.get("/app.js", headers={"Accept-Encoding": "gzip;q=0"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    @unittest.skipIf(brotli is None, "brotli not installed")
+    def test_brotli_preferred(self):
+        response = self.client.get("/app.js", headers={"Accept-Encoding": "gzip, br"})
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.get_data()), self.app_js)
+
+    def test_unknown_paths_are_404(self):
+        for path in ("/missing.js", "/../app/config.py", "/api/nope"):
+            self.assertEqual(self.client.get(path).status_code, 404, path)
+
+
+class BuildTests(unittest.TestCase):
+    def setUp(self):
+        self.source = tempfile.TemporaryDirectory()
+        self.output = tempfile.TemporaryDirectory()
+        files = {
+            "index.html": '<link href="./site.css"><script src="main.js"></script><img src="https://x/y.png">',
+            "site.css": "body { color: red; }\n" * 40,
+            "main.js": "console.log(1);",
+        }
+        for name, content in files.items():
+            with open(os.path.join(self.source.name, name), "w") as f:
+                f.write(content)
+
+    def tearDown(self):
+        self.source.cleanup()
+        self.output.cleanup()
+
+    def test_small_files_are_not_compressed(self):
+        assets, hashed = build_assets(self.source.name)
+        self.assertIn("gzip", assets["site.css"].variants)
+        self.assertEqual(list(assets["main.js"].variants), [None])
+        html = assets["index.html"].variants[None].decode()
+        self.assertIn(f'href="{hashed["site.css"]}"', html)
+        self.assertIn('src="https://x/y.png"', html)
+
+    def test_write_build_and_nginx_config(self):
+        assets, hashed = build_assets(self.source.name)
+        written = write_build(assets, self.output.name)
+        self.assertIn(hashed["site.css"] + ".gz", written)
+        self.assertTrue(os.path.exists(os.path.join(self.output.name, hashed["main.js"])))
+        config = nginx_config(self.output.name, "127.0.0.1:5000")
+        self.assertIn(f"root {os.path.abspath(self.output.name)};", config)
+        self.assertIn("gzip_static on;", config)
+        self.assertIn('"\\.[0-9a-f]{12}\\.[A-Za-z0-9]+$"', config)
+
+    def test_pipeline_without_frontend(self):
+        assets = AssetPipeline(os.path.join(self.source.name, "nope"))
+        assets.build()
+        with app.test_request_context("/"):
+            self.assertIsNone(assets.response("index.html"))
+
+
+if __name__ == '__main__':
+    unittest.main()
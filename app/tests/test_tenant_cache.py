@@ -0,0 +1,157 @@
+import unittest
+import sys
+import os
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import event
+
+from app import app, db
+from app.models import Tenant
+from app.tenant_cache import TenantCache, tenant_cache
+from app.usage import usage_aggregator
+from app.tests.helpers import make_rsa_jwk, make_token, patch_key_store
+
+
+class CountTenantSelects:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM tenants" in statement:
+            self.count += 1
+
+
+class TenantCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        db.session.add(Tenant(tenant_id="laba", company_name="Lab A", subscription_tier="basic"))
+        db.session.commit()
+        self.cache = TenantCache(maxsize=2, ttl=60, negative_ttl=5)
+        self.selects = CountTenantSelects()
+        event.listen(db.engine, "before_cursor_execute", self.selects)
+
+    def tearDown(self):
+        event.remove(db.engine, "before_cursor_execute", self.selects)
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_hit_after_first_lookup(self):
+        first = self.cache.get("laba", now=0)
+        second = self.cache.get("laba", now=1)
+        self.assertEqual(first, second)
+        self.assertEqual(second.company_name, "Lab A")
+        self.assertEqual(self.selects.count, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_ttl_expiry(self):
+        self.cache.get("laba", now=0)
+        self.cache.get("laba", now=61)
+        self.assertEqual(self.selects.count, 2)
+
+    def test_negative_cache_shorter_ttl(self):
+        self.assertIsNone(self.cache.get("nobody", now=0))
+        self.assertIsNone(self.cache.get("nobody", now=4))
+        self.assertEqual((self.selects.count, self.cache.negative_hits), (1, 1))
+        self.cache.get("nobody", now=6)
+        self.assertEqual(self.selects.count, 2)
+
+    def test_lru_eviction(self):
+        for tenant_id in ("laba", "x", "y"):
+            self.cache.get(tenant_id, now=0)
+        self.assertEqual(len(self.cache), 2)
+        self.cache.get("laba", now=1)
+        self.assertEqual(self.selects.count, 4)
+
+    def test_invalidation_during_load_is_not_cached(self):
+        original = Tenant.query
+
+        def racing_query():
+            self.cache.invalidate("laba")
+            return original
+        with mock.patch.object(Tenant, "query", new_callable=mock.PropertyMock) as query:
+            query.side_effect = racing_query
+            self.cache.get("laba", now=0)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_notify_invalidates_after_commit(self):
+        self.cache.get("laba", now=0)
+        self.cache.notify("laba")
+        # Hasta el commit la fila cacheada sigue siendo la vigente
+        self.assertEqual(len(self.cache), 1)
+        db.session.commit()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+
+    def test_notify_discarded_on_rollback(self):
+        self.cache.get("laba", now=0)
+        self.cache.notify("laba")
+        db.session.rollback()
+        db.session.commit()
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.stats()["invalidations"], 0)
+
+    def test_notify_with_own_session(self):
+        from sqlalchemy.orm import Session
+        self.cache.get("laba", now=0)
+        with Session(db.engine) as session, session.begin():
+            session.execute(Tenant.__table__.update().values(company_name="Lab A2"))
+            self.cache.notify("laba", session=session)
+            self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.get("laba", now=0).company_name, "Lab A2")
+
+
+class TenantCacheEndpointTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_pem, cls.public_jwk = make_rsa_jwk()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self._patch = patch_key_store(self.public_jwk)
+        self._patch.start()
+        self.headers = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id='labnew')}"}
+        tenant_cache.clear()
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        self._patch.stop()
+        usage_aggregator._pending.clear()
+        tenant_cache.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _post_result(self):
+        return self.client.post("/api/v1/results", json={"patient_id": "P1", "test_code": "GLU"}, headers=self.headers)
+
+    def test_admin_create_clears_negative_entry(self):
+        self.assertEqual(self._post_result().status_code, 404)
+        self.assertEqual(self._post_result().status_code, 404)
+        self.assertEqual(tenant_cache.negative_hits, 1)
+        self.client.post("/admin/tenants", json={"tenant_id": "labnew", "company_name": "Nuevo"})
+        self.assertEqual(self._post_result().status_code, 201)
+        self.assertEqual(self._post_result().status_code, 201)
+
+        stats = self.client.get("/admin/cache/tenants").get_json()
+        self.assertEqual(stats["hits"], 1)
+        self.assertGreaterEqual(stats["invalidations"], 1)
+
+    def test_patch_refreshes_cached_tenant(self):
+        self.client.post("/admin/tenants", json={"tenant_id": "labnew", "company_name": "Nuevo"})
+        with app.app_context():
+            self.assertEqual(tenant_cache.get("labnew").company_name, "Nuevo")
+        response = self.client.patch("/admin/tenants/labnew", json={"company_name": "Renombrado"})
+        self.assertEqual(response.status_code, 200)
+        with app.app_context():
+            self.assertEqual(tenant_cache.get("labnew").company_name, "Renombrado")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import sys
+import os
+import hashlib
+import io
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db
+from app import s3client
+from app.usage import usage_aggregator
+from app.tests.helpers import make_rsa_jwk, make_token, patch_key_store, FakeS3
+
+
+class ChunkedStream(io.RawIOBase):
+    """Stream que entrega bytes en lecturas cortas, sin tener el archivo completo en memoria"""
+
+    def __init__(self, size, read_size=65536):
+        self.remaining = size
+        self.read_size = read_size
+        self.produced = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def read(self, n=-1):
+        n = min(self.read_size, self.remaining, n if n and n > 0 else self.read_size)
+        chunk = bytes((self.remaining - i) % 251 for i in range(n))
+        self.remaining -= n
+        self.produced.update(chunk)
+        return chunk
+
+
+class UploadStreamTests(unittest.TestCase):
+    def setUp(self):
+        self.fake = FakeS3(part_delay=0.01)
+        self._s3_patch = mock.patch.object(s3client, "s3", self.fake)
+        self._s3_patch.start()
+
+    def tearDown(self):
+        self._s3_patch.stop()
+
+    def test_multipart_with_bounded_parallelism(self):
+        part = 256 * 1024
+        stream = ChunkedStream(10 * part + 123)
+        result = s3client.upload_stream("bucket", "k", stream, part_size=part, concurrency=3)
+        self.assertEqual(result["parts"], 11)
+        self.assertEqual(result["size"], 10 * part + 123)
+        self.assertEqual(result["sha256"], stream.produced.hexdigest())
+        self.assertEqual(hashlib.sha256(self.fake.objects[("bucket", "k")]["Body"]).hexdigest(), result["sha256"])
+        self.assertLessEqual(self.fake.max_in_flight, 3)
+        self.assertGreater(self.fake.max_in_flight, 1)
+
+    def test_small_body_single_put(self):
+        result = s3client.upload_stream("bucket", "small", io.BytesIO(b"hola"), part_size=1024)
+        self.assertEqual((result["parts"], result["size"]), (1, 4))
+        self.assertEqual(self.fake.uploads, {})
+
+    def test_empty_stream(self):
+        self.assertIsNone(s3client.upload_stream("bucket", "empty", io.BytesIO(b"")))
+        self.assertEqual(self.fake.objects, {})
+
+    def test_failed_part_aborts_upload(self):
+        with mock.patch.object(self.fake, "upload_part", side_effect=RuntimeError("s3 down")):
+            with self.assertRaises(RuntimeError):
+                s3client.upload_stream("bucket", "k", ChunkedStream(5 * 1024), part_size=1024)
+        self.assertEqual(len(self.fake.aborted), 1)
+        self.assertEqual(self.fake.objects, {})
+
+
+class UploadEndpointTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_pem, cls.public_jwk = make_rsa_jwk()
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.fake = FakeS3()
+        self._patches = [patch_key_store(self.public_jwk), mock.patch.object(s3client, "s3", self.fake)]
+        for p in self._patches:
+            p.start()
+        self.headers = {"Authorization": f"Bearer {make_token(self.private_pem, tenant_id='laba')}"}
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        for p in self._patches:
+            p.stop()
+        usage_aggregator._pending.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _storage_pending(self):
+        return sum(b["storage_bytes"] for (tenant, _), b in usage_aggregator.pending().items() if tenant == "laba")
+
+    def test_raw_body_streamed_with_unique_keys(self):
+        body = os.urandom(3000)
+        with mock.patch.object(s3client, "S3_PART_SIZE", 1024):
+            first = self.client.post("/api/v1/upload", data=body, headers={**self.headers, "X-File-Name": "a%20b.csv"},
+                                     content_type="text/csv")
+            second = self.client.post("/api/v1/upload", data=body, headers=self.headers,
+                                      content_type="application/octet-stream")
+        self.assertEqual(first.status_code, 201)
+        data = first.get_json()
+        self.assertEqual(data["size"], 3000)
+        self.assertEqual(data["sha256"], hashlib.sha256(body).hexdigest())
+        self.assertNotEqual(data["s3_uri"], second.get_json()["s3_uri"])
+        self.assertTrue(data["s3_uri"].startswith("s3://tenant-lab-bucket/laba/uploads/"))
+        key = data["s3_uri"].split("/", 3)[3]
+        stored = self.fake.objects[("tenant-lab-bucket", key)]
+        self.assertEqual(stored["Body"], body)
+        self.assertEqual(stored["Metadata"], {"original-filename": "a%20b.csv"})
+        self.assertEqual(self._storage_pending(), 6000)
+
+    def test_multipart_form_upload(self):
+        response = self.client.post("/api/v1/upload", headers=self.headers,
+                                    data={"file": (io.BytesIO(b"resultado"), "r.txt")})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.get_json()["size"], 9)
+
+    def test_failed_commit_leaves_session_usable(self):
+        # Con el contexto de app abierto la sesión sobrevive entre requests (como en un hilo del worker)
+        with app.app_context():
+            with mock.patch("app.new_upload_key", return_value="laba/uploads/dup"):
+                self.assertEqual(self.client.post("/api/v1/upload", data=b"a", headers=self.headers).status_code, 201)
+                self.assertEqual(self.client.post("/api/v1/upload", data=b"b", headers=self.headers).status_code, 500)
+            response = self.client.post("/api/v1/upload", data=b"c", headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+
+    def test_empty_upload_rejected(self):
+        response = self.client.post("/api/v1/upload", data=b"", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._storage_pending(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import sys
+import os
+import threading
+from datetime import date
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db
+from app.models import TenantUsage
+from sqlalchemy.exc import OperationalError
+from app.usage import UsageAggregator
+
+
+class UsageAggregatorTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.month = date(2026, 3, 1)
+        self.aggregator = UsageAggregator(flush_interval=3600, max_pending=10 ** 9)
+        self.aggregator._app = app
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _usage(self, tenant_id):
+        with app.app_context():
+            return db.session.get(TenantUsage, (tenant_id, self.month))
+
+    def test_increments_batched_into_one_row(self):
+        for _ in range(5):
+            self.aggregator.add("laba", month=self.month, api_calls=1)
+        self.aggregator.add("laba", month=self.month, results_processed=3)
+        self.assertEqual(self.aggregator.flush(), 1)
+        usage = self._usage("laba")
+        self.assertEqual((usage.api_calls, usage.results_processed, usage.storage_bytes), (5, 3, 0))
+
+    def test_flush_adds_to_existing_row(self):
+        with app.app_context():
+            db.session.add(TenantUsage(tenant_id="laba", month=self.month,
+                                       results_processed=10, api_calls=20, storage_bytes=30))
+            db.session.commit()
+        self.aggregator.add("laba", month=self.month, results_processed=1, api_calls=2, storage_bytes=3)
+        self.aggregator.flush()
+        usage = self._usage("laba")
+        self.assertEqual((usage.results_processed, usage.api_calls, usage.storage_bytes), (11, 22, 33))
+
+    def test_no_lost_updates_across_threads(self):
+        """Hilos concurrentes + flushes intercalados: el conteo final es exacto"""
+        threads, per_thread = 8, 500
+        stop = threading.Event()
+
+        def flusher():
+            while not stop.is_set():
+                self.aggregator.flush()
+
+        def worker(i):
+            for _ in range(per_thread):
+                self.aggregator.add(f"lab{i % 2}", month=self.month, api_calls=1, results_processed=1)
+
+        background = threading.Thread(target=flusher)
+        background.start()
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        stop.set()
+        background.join()
+        self.aggregator.flush()
+
+        total = sum(self._usage(f"lab{i}").api_calls for i in range(2))
+        self.assertEqual(total, threads * per_thread)
+        self.assertEqual(self._usage("lab0").results_processed, threads * per_thread // 2)
+
+    def test_failed_flush_keeps_increments(self):
+        self.aggregator.add("laba", month=self.month, api_calls=4)
+        with mock.patch.object(self.aggregator, "_write", side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                self.aggregator.flush()
+        self.aggregator.add("laba", month=self.month, api_calls=1)
+        self.assertEqual(self.aggregator.pending()[("laba", self.month)]["api_calls"], 5)
+        self.aggregator.flush()
+        self.assertEqual(self._usage("laba").api_calls, 5)
+
+    def test_rows_written_in_key_order(self):
+        for tenant_id in ("labc", "laba", "labb"):
+            self.aggregator.add(tenant_id, month=self.month, api_calls=1)
+        self.aggregator.add("laba", month=date(2026, 2, 1), api_calls=1)
+        with mock.patch.object(self.aggregator, "_write") as write:
+            self.aggregator.flush()
+        keys = [(row["tenant_id"], row["month"]) for row in write.call_args.args[0]]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_deadlock_keeps_increments_for_next_flush(self):
+        class Deadlock(Exception):
+            pgcode = "40P01"
+        self.aggregator.add("laba", month=self.month, api_calls=4)
+        error = OperationalError("INSERT ...", {}, Deadlock("deadlock detected"))
+        with mock.patch.object(self.aggregator, "_write", side_effect=error):
+            with self.assertLogs("app.usage", level="WARNING"):
+                self.assertEqual(self.aggregator.flush(), 0)
+        self.assertEqual(self.aggregator.pending()[("laba", self.month)]["api_calls"], 4)
+        self.aggregator.flush()
+        self.assertEqual(self._usage("laba").api_calls, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,160 @@
 from app.models import TenantUsage, db
+from app.response_cache import response_cache
 from datetime import date
+from sqlalchemy import func
+import atexit
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("results_processed", "api_calls", "storage_bytes")
+# deadlock_detected / serialization_failure: otro worker escribía las mismas filas
+RETRYABLE_PGCODES = ("40P01", "40001")
+
+def _is_retryable(error):
+    return getattr(getattr(error, "orig", None), "pgcode", None) in RETRYABLE_PGCODES
+
+def _upsert_statement(dialect_name, rows):
+    """INSERT ... ON CONFLICT (tenant_id, month) DO UPDATE SET col = col + excluded.col
+
+    rows must be sorted by (tenant_id, month): every worker then locks the rows in the same order.
+    """
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Usage upsert not supported on {dialect_name}")
+    table = TenantUsage.__table__
+    stmt = insert(table).values([dict(row, version=1) for row in rows])
+    set_ = {
+        col: func.coalesce(table.c[col], 0) + stmt.excluded[col]
+        for col in COUNTERS
+    }
+    # Cada cambio de uso invalida la factura abierta del mes (ver billing)
+    set_["version"] = func.coalesce(table.c.version, 0) + 1
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.tenant_id, table.c.month],
+        set_=set_
+    )
+
+class UsageAggregator:
+    """Write-behind usage counters batched per (tenant_id, month) and flushed as one upsert"""
+
+    def __init__(self, flush_interval=5.0, max_pending=500):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._app = None
+        self._pending = {}
+        self._pending_events = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.flushes = 0
+
+    def init_app(self, app):
+        self._app = app
+        self.flush_interval = app.config.get("USAGE_FLUSH_INTERVAL", self.flush_interval)
+        self.max_pending = app.config.get("USAGE_FLUSH_MAX_PENDING", self.max_pending)
+        # Gunicorn termina los workers con SIGTERM -> sys.exit -> atexit
+        atexit.register(self._flush_at_exit)
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Usage flush at shutdown failed, {len(self._pending)} buckets lost: {e}")
+
+    def _ensure_thread(self):
+        # Después de un fork (gunicorn --preload) el hilo no existe en el hijo
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="usage-flusher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Usage flush failed: {e}")
+
+    def add(self, tenant_id, month=None, **counts):
+        """Record increments in memory; never touches the database"""
+        if month is None:
+            month = date.today().replace(day=1)
+        with self._lock:
+            bucket = self._pending.setdefault((tenant_id, month), dict.fromkeys(COUNTERS, 0))
+            for col, n in counts.items():
+                bucket[col] += n
+            self._pending_events += 1
+            full = self._pending_events >= self.max_pending
+        if self._app is not None:
+            self._ensure_thread()
+            if full:
+                self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return {key: dict(bucket) for key, bucket in self._pending.items()}
+
+    def flush(self):
+        """Write all pending increments in a single upsert; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._pending_events = 0
+            if not batch:
+                return 0
+            # Mismo orden de filas en todos los workers: dos flushes no se bloquean en cruz
+            rows = [
+                {"tenant_id": tenant_id, "month": month, **batch[(tenant_id, month)]}
+                for tenant_id, month in sorted(batch)
+            ]
+            try:
+                if self._app is not None:
+                    with self._app.app_context():
+                        self._write(rows)
+                else:
+                    self._write(rows)
+            except Exception as e:
+                # Devolver los incrementos para no perder conteos
+                with self._lock:
+                    for key, bucket in batch.items():
+                        current = self._pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+                        for col in COUNTERS:
+                            current[col] += bucket[col]
+                if _is_retryable(e):
+                    logger.warning(f"Usage flush of {len(rows)} rows conflicted with another worker, "
+                                   f"retrying on the next flush: {e}")
+                    return 0
+                raise
+            self.flushes += 1
+            response_cache.invalidate_usage(*{tenant_id for tenant_id, _ in batch})
+            return len(rows)
+
+    def _write(self, rows):
+        try:
+            db.session.execute(_upsert_statement(db.engine.dialect.name, rows))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+usage_aggregator = UsageAggregator()
 
 def incr_results_processed(tenant_id, n=1):
-    month = date.today().replace(day=1)
-    usage = TenantUsage.query.get((tenant_id, month))
-    if not usage:
-        usage = TenantUsage(tenant_id=tenant_id, month=month, results_processed=0, api_calls=0, storage_bytes=0)
-        db.session.merge(usage)
-    usage.results_processed += n
-    db.session.commit()
+    usage_aggregator.add(tenant_id, results_processed=n)
 
 def incr_api_calls(tenant_id, n=1):
-    month = date.today().replace(day=1)
-    usage = TenantUsage.query.get((tenant_id, month))
-    if not usage:
-        usage = TenantUsage(tenant_id=tenant_id, month=month, results_processed=0, api_calls=0, storage_bytes=0)
-        db.session.merge(usage)
-    usage.api_calls += n
-    db.session.commit() #end 
+    usage_aggregator.add(tenant_id, api_calls=n)
+
+def incr_storage_bytes(tenant_id, n):
+    usage_aggregator.add(tenant_id, storage_bytes=n)
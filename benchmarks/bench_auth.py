@@ -0,0 +1,48 @@
+"""
+Microbenchmark de verificación JWT con una llave RSA y JWKS locales.
+
+    python benchmarks/bench_auth.py [iterations]
+
+Compara verify_jwt sin caché (RSA en cada llamada) contra tokens repetidos
+servidos desde auth.claims_cache.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import auth
+from app.tests.helpers import make_rsa_jwk, make_token
+
+
+def bench(label, fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {iterations / elapsed:>12,.0f} verifies/s  ({elapsed / iterations * 1e6:,.1f} µs/op)")
+    return elapsed
+
+
+def main(iterations=2000):
+    private_pem, public_jwk = make_rsa_jwk()
+    auth.key_store.load_jwks({"keys": [public_jwk]})
+    token = make_token(private_pem)
+
+    def uncached():
+        auth.claims_cache.clear()
+        auth.verify_jwt(token)
+
+    def cached():
+        auth.verify_jwt(token)
+
+    cold = bench("verify_jwt (no cache)", uncached, iterations)
+    auth.claims_cache.clear()
+    auth.verify_jwt(token)
+    warm = bench("verify_jwt (cached claims)", cached, iterations)
+    print(f"speedup: {cold / warm:,.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
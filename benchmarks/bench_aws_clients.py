@@ -0,0 +1,84 @@
+"""
+Costo de arranque y primera llamada de los clientes AWS.
+
+    python benchmarks/bench_aws_clients.py [runs]
+
+Cada medición corre en un proceso nuevo (import en frío). "eager" reproduce lo que
+hacían s3client/provisioner al importarse (boto3.client por servicio) antes de importar
+la app; "lazy" importa la app actual, que no carga boto3 hasta el primer uso. Después compara un
+boto3.client nuevo por registro (tenant_registration antes) contra get_client.
+No hace llamadas de red: mide construcción de clientes, no handshakes TLS.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from common import ROOT, configure_environment
+
+SERVICES = ("s3", "cognito-idp", "rds", "apigatewayv2")
+
+EAGER = """
+import time; t = time.perf_counter()
+import boto3
+for service in %r:
+    boto3.client(service)
+import app
+print(time.perf_counter() - t)
+""" % (SERVICES,)
+
+LAZY = """
+import time; t = time.perf_counter()
+import app
+print(time.perf_counter() - t)
+"""
+
+FIRST_CALL = """
+import time
+import app.s3client
+t = time.perf_counter()
+app.s3client.s3.meta
+print(time.perf_counter() - t)
+"""
+
+
+def run_python(code, runs):
+    env = dict(os.environ)
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                             capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def per_call(label, fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<36} {elapsed / iterations * 1e3:>10,.3f} ms/op")
+    return elapsed
+
+
+def main(runs=5):
+    configure_environment()
+    eager = run_python(EAGER, runs)
+    lazy = run_python(LAZY, runs)
+    first = run_python(FIRST_CALL, runs)
+    print(f"{'import, eager clients (before)':<36} {eager * 1e3:>10,.1f} ms")
+    print(f"{'import, lazy clients (after)':<36} {lazy * 1e3:>10,.1f} ms")
+    print(f"{'first s3 call: client creation':<36} {first * 1e3:>10,.1f} ms")
+
+    import boto3
+    from app.aws import get_client
+    iterations = 50
+    get_client("cognito-idp", region_name="us-east-2")
+    before = per_call("boto3.client per registration", lambda: boto3.client("cognito-idp", region_name="us-east-2"), iterations)
+    after = per_call("get_client per registration", lambda: get_client("cognito-idp", region_name="us-east-2"), iterations)
+    print(f"per-registration speedup: {before / after:,.0f}x (plus a reused HTTPS connection pool)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
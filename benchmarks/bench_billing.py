@@ -0,0 +1,54 @@
+"""
+Corrida mensual de facturación: loop por tenant (calculate_tenant_bill, 2N+1
+consultas) contra generate_invoice_for_all_tenants (un solo JOIN).
+
+    python benchmarks/bench_billing.py [--tenants N] [--database-url URL]
+"""
+import argparse
+import time
+from datetime import date
+
+from common import configure_environment, reset_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenants", type=int, default=1000)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    url = configure_environment(args.database_url)
+    from app import app, db
+    from app.models import Tenant, TenantUsage
+    from app.billing import calculate_tenant_bill, generate_invoice_for_all_tenants
+
+    month = date(2026, 1, 1)
+    reset_database(app, db)
+    with app.app_context():
+        db.session.add_all(Tenant(tenant_id=f"lab{i:05d}", company_name=f"Lab {i}",
+                                  subscription_tier=("basic", "professional", "enterprise")[i % 3])
+                           for i in range(args.tenants))
+        db.session.add_all(TenantUsage(tenant_id=f"lab{i:05d}", month=month, results_processed=i * 7,
+                                       api_calls=i * 31, storage_bytes=i * 10_000_000)
+                           for i in range(args.tenants))
+        db.session.commit()
+
+    print(f"database: {url.split('@')[-1]}  tenants: {args.tenants}")
+    with app.app_context():
+        start = time.perf_counter()
+        looped = [inv for inv in (calculate_tenant_bill(t.tenant_id, month) for t in Tenant.query.all()) if inv]
+        loop_time = time.perf_counter() - start
+        db.session.expire_all()
+
+        start = time.perf_counter()
+        bulk = generate_invoice_for_all_tenants(month)
+        bulk_time = time.perf_counter() - start
+
+    assert bulk == looped, "bulk invoices differ from calculate_tenant_bill"
+    print(f"per-tenant loop  {loop_time * 1000:>9,.1f} ms")
+    print(f"single JOIN      {bulk_time * 1000:>9,.1f} ms")
+    print(f"speedup: {loop_time / bulk_time:,.1f}x  ({len(bulk)} invoices, identical output)")
+
+
+if __name__ == "__main__":
+    main()
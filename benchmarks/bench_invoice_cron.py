@@ -0,0 +1,60 @@
+"""
+Escalamiento de invoice_cron.run_invoice_batch con el número de workers.
+
+    python benchmarks/bench_invoice_cron.py [--tenants N] [--workers 1,2,4,8] [--processes] [--database-url URL]
+
+Cada corrida parte de cero (sin checkpoint ni facturas guardadas). SQLite serializa
+las escrituras: para medir escalamiento real usar PostgreSQL con --database-url.
+"""
+import argparse
+import shutil
+import tempfile
+from datetime import date
+
+from common import configure_environment, reset_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenants", type=int, default=400)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--chunk-size", type=int, default=25)
+    parser.add_argument("--processes", action="store_true")
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    url = configure_environment(args.database_url)
+    import logging
+    logging.disable(logging.INFO)
+    from app import app, db
+    from app.models import Tenant, TenantUsage, Invoice, InvoiceLineItem
+    from app.invoice_cron import run_invoice_batch
+
+    month = date(2026, 1, 1)
+    reset_database(app, db)
+    with app.app_context():
+        db.session.add_all(Tenant(tenant_id=f"lab{i:05d}", company_name=f"Lab {i}", subscription_tier="professional")
+                           for i in range(args.tenants))
+        db.session.add_all(TenantUsage(tenant_id=f"lab{i:05d}", month=month, results_processed=900 + i,
+                                       api_calls=i * 13, storage_bytes=i * 1_000_000, version=1)
+                           for i in range(args.tenants))
+        db.session.commit()
+
+    print(f"database: {url.split('@')[-1]}  tenants: {args.tenants}")
+    baseline = None
+    for workers in (int(w) for w in args.workers.split(",")):
+        with app.app_context():
+            InvoiceLineItem.query.delete()
+            Invoice.query.delete()
+            db.session.commit()
+        output_dir = tempfile.mkdtemp(prefix="labcloud-invoices-")
+        stats = run_invoice_batch(month, workers=workers, chunk_size=args.chunk_size,
+                                  output_dir=output_dir, use_processes=args.processes)
+        shutil.rmtree(output_dir)
+        baseline = baseline or stats["duration_seconds"]
+        print(f"workers={workers:<3} {stats['duration_seconds']:>7.2f}s  {stats['throughput_per_second']:>8,.1f} invoices/s"
+              f"  speedup {baseline / stats['duration_seconds']:.2f}x  failed={stats['failed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Costo de la instrumentación de /metrics por request.
+
+    python benchmarks/bench_metrics.py [--requests N] [--database-url URL]
+
+Alterna bloques de requests con las métricas activas e inactivas (registry.enabled)
+contra GET /api/v1/results/<patient_id> y reporta la mediana por request de cada modo.
+"""
+import argparse
+import statistics
+import time
+from unittest import mock
+
+from common import configure_environment, install_local_auth, reset_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    url = configure_environment(args.database_url)
+    from app import app, db, s3client
+    from app.metrics import registry, http_request_duration
+    from app.models import Tenant, LabResult
+    from app.tests.helpers import FakeS3
+
+    reset_database(app, db)
+    with app.app_context():
+        db.session.add(Tenant(tenant_id="bench", company_name="Bench Lab", subscription_tier="basic"))
+        db.session.add_all([LabResult(tenant_id="bench", patient_id="P1", test_code="GLU", test_data={"v": i})
+                            for i in range(20)])
+        db.session.commit()
+    headers = install_local_auth()("bench")
+    # La ruta consulta el manifiesto del archivo: S3 en memoria (sin archivo)
+    mock.patch.object(s3client, "s3", FakeS3()).start()
+    client = app.test_client()
+    print(f"database: {url.split('@')[-1]}  requests per round: {args.requests}  rounds: {args.rounds}")
+
+    # Calentar caches (JWT, tenant) antes de medir
+    for _ in range(50):
+        client.get("/api/v1/results/P1", headers=headers)
+
+    timings = {True: [], False: []}
+    per_round = args.requests // 2
+    for _ in range(args.rounds):
+        for enabled in (False, True):
+            registry.enabled = enabled
+            start = time.perf_counter()
+            for _ in range(per_round):
+                assert client.get("/api/v1/results/P1", headers=headers).status_code == 200
+            timings[enabled].append((time.perf_counter() - start) / per_round)
+
+    off, on = statistics.median(timings[False]), statistics.median(timings[True])
+    print(f"metrics off  {off * 1e6:>10,.1f} µs/request")
+    print(f"metrics on   {on * 1e6:>10,.1f} µs/request")
+    print(f"overhead     {(on - off) * 1e6:>10,.1f} µs/request ({(on / off - 1) * 100:+.1f}%)")
+
+    start = time.perf_counter()
+    for i in range(100000):
+        http_request_duration.observe(0.003, endpoint="/bench", method="GET", status=200, tier="basic")
+    print(f"observe()    {(time.perf_counter() - start) / 100000 * 1e6:>10,.2f} µs/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Registro de tenants: conexión nueva por registro (como antes) contra el engine con pool.
+
+    python benchmarks/bench_registration.py [--registrations N] [--workers W] [--database-url URL]
+
+Cognito se sustituye por un stub local para medir solo el acceso a la base de datos.
+El beneficio real está en PostgreSQL/RDS, donde cada conexión nueva paga TCP+TLS+auth;
+con el SQLite por defecto la diferencia es solo el costo de abrir el archivo.
+"""
+import argparse
+import contextlib
+import io
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest import mock
+
+from common import configure_environment, reset_database
+
+INSERT = """
+    INSERT INTO tenants (tenant_id, company_name, subscription_tier, created_at)
+    VALUES ({p}, {p}, {p}, {p})
+    ON CONFLICT (tenant_id) DO NOTHING
+"""
+
+
+def connect_raw(url):
+    """Una conexión nueva, como hacía tenant_registration antes del pool"""
+    if url.startswith("sqlite"):
+        return sqlite3.connect(url.split("///", 1)[1]), "?"
+    import psycopg2
+    return psycopg2.connect(url), "%s"
+
+
+def register_raw(url, i):
+    conn, p = connect_raw(url)
+    cur = conn.cursor()
+    cur.execute(INSERT.format(p=p), (f"raw_{i}", f"Raw Lab {i}", "basic", datetime.utcnow()))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def run(label, fn, registrations, workers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(fn, range(registrations)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {registrations / elapsed:>10,.0f} registrations/s  ({elapsed:.2f}s)", file=sys.__stdout__)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--registrations", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    url = configure_environment(args.database_url)
+    from app import app, db
+    from app import tenant_registration
+
+    reset_database(app, db)
+    print(f"database: {url.split('@')[-1]}  registrations: {args.registrations}  workers: {args.workers}")
+
+    def register_pooled(i):
+        with app.app_context():
+            result = tenant_registration.create_new_tenant_with_user({
+                "company_name": f"Pooled Lab {i}", "email": f"admin{i}@bench.local", "contact_name": "Bench"
+            })
+        assert result["success"]
+
+    raw = run("new connection each", lambda i: register_raw(url, i), args.registrations, args.workers)
+    # tenant_registration imprime el progreso de cada registro
+    with mock.patch.object(tenant_registration, "get_client"), contextlib.redirect_stdout(io.StringIO()):
+        pooled = run("pooled engine", register_pooled, args.registrations, args.workers)
+    print(f"speedup: {raw / pooled:,.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Búsqueda de resultados: "HbA1c > 6.5 en los últimos 90 días" como escaneo de
+test_data en Python (lo que había) contra GET /api/v1/results/search (índice de
+analitos), con el plan de cada consulta.
+
+    python benchmarks/bench_search.py [--results N] [--tenants T] [--database-url URL]
+
+En SQLite el plan debe mostrar "USING COVERING INDEX ix_result_analytes_search";
+en PostgreSQL "Index Only Scan using ix_result_analytes_search" (correr VACUUM
+ANALYZE después de sembrar para que el visibility map esté al día).
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select
+
+from common import configure_environment, reset_database
+
+CHUNK = 20000
+TEST_CODES = ("HBA1C", "GLU", "CHOL", "TSH", "CBC")
+
+
+def seed(app, db, results, tenants):
+    from app.models import LabResult, ResultAnalyte
+    from app.results import extract_analytes
+
+    rng = random.Random(7)
+    now = datetime.utcnow()
+    next_id = 1
+    with app.app_context():
+        for start in range(0, results, CHUNK):
+            rows, analytes = [], []
+            for n in range(start, min(start + CHUNK, results)):
+                test_code = TEST_CODES[n % len(TEST_CODES)]
+                test_data = {"value": round(rng.uniform(4, 12), 1), "flag": rng.choice(("N", "N", "N", "H"))}
+                row = {"id": next_id, "tenant_id": f"lab{n % tenants:03d}", "patient_id": f"P{rng.randrange(20000)}",
+                       "test_code": test_code, "test_data": test_data,
+                       "created_at": now - timedelta(minutes=rng.randrange(365 * 24 * 60))}
+                rows.append(row)
+                analytes.extend({"result_id": next_id, "tenant_id": row["tenant_id"], "patient_id": row["patient_id"],
+                                 "test_code": test_code, "analyte": analyte, "value": value,
+                                 "observed_at": row["created_at"]}
+                                for analyte, value in extract_analytes(test_code, test_data))
+                next_id += 1
+            db.session.execute(LabResult.__table__.insert(), rows)
+            db.session.execute(ResultAnalyte.__table__.insert(), analytes)
+            db.session.commit()
+        if db.engine.dialect.name == "postgresql":
+            with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.exec_driver_sql("VACUUM ANALYZE lab_results")
+                conn.exec_driver_sql("VACUUM ANALYZE result_analytes")
+        else:
+            db.session.connection().exec_driver_sql("ANALYZE")
+            db.session.commit()
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--results", type=int, default=1_000_000)
+    parser.add_argument("--tenants", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    url = configure_environment(args.database_url)
+    from app import app, db
+    from app.models import LabResult
+    from app.results import search_results, parse_search_args
+    from app.query_inspector import explain
+
+    reset_database(app, db)
+    started = time.perf_counter()
+    seed(app, db, args.results, args.tenants)
+    print(f"database: {url.split('@')[-1]}  results: {args.results:,}  tenants: {args.tenants}  "
+          f"seeded in {time.perf_counter() - started:.1f}s\n")
+
+    tenant_id = "lab000"
+    since = datetime.utcnow() - timedelta(days=90)
+
+    def python_scan():
+        # Antes: todos los resultados del tenant y filtrar el JSON en Python
+        rows = db.session.execute(select(LabResult.id, LabResult.test_code, LabResult.test_data, LabResult.created_at)
+                                  .where(LabResult.tenant_id == tenant_id)).all()
+        return [r.id for r in rows if r.test_code == "HBA1C" and r.created_at >= since
+                and isinstance(r.test_data, dict) and (r.test_data.get("value") or 0) > 6.5]
+
+    criteria = parse_search_args({"analyte": "hba1c", "gt": "6.5", "days": "90"})
+    everything = args.results  # una sola página: mismas filas que el escaneo
+    match_criteria = parse_search_args({"test_code": "HBA1C", "days": "90", "match": '{"flag": "H"}'})
+    cases = [
+        ("python scan of test_data", python_scan),
+        ("analyte index, index-only fields", lambda: search_results(
+            tenant_id, criteria, fields=("id", "patient_id", "value", "created_at"), limit=everything)),
+        ("analyte index + test_data", lambda: search_results(tenant_id, criteria, limit=everything)),
+        ("test_code + days + match", lambda: search_results(tenant_id, match_criteria, limit=everything)),
+    ]
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    with app.app_context():
+        found = {}
+        for name, fn in cases:
+            elapsed, out = timed(fn, args.repeat)
+            ids = sorted(out) if isinstance(out, list) else sorted(r["id"] for r in out[0])
+            found[name] = ids
+            print(f"{name:<36} {elapsed * 1000:>10,.2f} ms  ({len(ids)} rows)")
+        assert found[cases[0][0]] == found[cases[1][0]] == found[cases[2][0]], "search differs from the scan"
+
+        print("\nquery plans:")
+        for name, fn in cases[1:]:
+            statements.clear()
+            event.listen(db.engine, "before_cursor_execute", capture)
+            try:
+                fn()
+            finally:
+                event.remove(db.engine, "before_cursor_execute", capture)
+            statement, parameters = statements[-1]
+            print(f"  {name}:")
+            for line in explain(db.session.connection(), statement, parameters) or []:
+                print(f"    {line}")
+
+
+if __name__ == "__main__":
+    main()
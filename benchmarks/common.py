@@ -0,0 +1,42 @@
+"""
+Utilidades para los benchmarks: base de datos local y JWT firmado con una llave RSA local.
+
+configure_environment() debe llamarse ANTES de importar app, porque la URI de la
+base de datos se fija al importar el módulo.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+
+def configure_environment(database_url=None):
+    """Point the app at a benchmark database (default: a fresh SQLite file)"""
+    if not database_url:
+        path = os.path.join(tempfile.mkdtemp(prefix="labcloud-bench-"), "bench.db")
+        database_url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("USAGE_FLUSH_INTERVAL", "3600")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-2")
+    return database_url
+
+
+def install_local_auth():
+    """Serve JWTs from a local RSA key; returns a function tenant_id -> headers"""
+    from app import auth
+    from app.tests.helpers import make_rsa_jwk, make_token
+
+    private_pem, public_jwk = make_rsa_jwk()
+    auth.key_store.load_jwks({"keys": [public_jwk]})
+
+    def headers(tenant_id):
+        return {"Authorization": f"Bearer {make_token(private_pem, tenant_id=tenant_id)}"}
+    return headers
+
+
+def reset_database(app, db):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
@@ -0,0 +1,275 @@
+"""
+Carga reproducible contra la API: siembra N tenants y M resultados, firma JWT con
+una llave RSA local, sustituye S3 por FakeS3 y mide cada escenario.
+
+    python benchmarks/loadtest.py [--tenants N] [--results M] [--requests R]
+                                  [--concurrency C] [--database-url URL]
+                                  [--output run.json] [--compare baseline.json]
+
+Reporta p50/p95/p99 y throughput por escenario. --output guarda el resultado en JSON
+(con commit, base de datos y parámetros) y --compare lo contrasta con una corrida
+anterior; --max-regression PCT termina con código 1 si p95 o throughput empeoran
+más de PCT %. Los requests se ejecutan en el proceso (WSGI, sin red): los números
+sirven para comparar commits en la misma máquina, no como capacidad de producción.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime
+from unittest import mock
+
+from common import ROOT, configure_environment, install_local_auth, reset_database
+
+TIERS = ("basic", "professional", "enterprise")
+TEST_CODES = ("HBA1C", "GLU", "CHOL", "TSH", "CBC")
+SEED_CHUNK = 5000
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, min(len(sorted_values), round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "duration_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "mean": ms(sum(values) / len(values)) if values else None,
+            "p50": ms(percentile(values, 50)),
+            "p95": ms(percentile(values, 95)),
+            "p99": ms(percentile(values, 99)),
+            "max": ms(values[-1]) if values else None,
+        }
+    }
+
+
+def seed(app, db, tenants, results, patients):
+    """Tenants, results spread over patients, and this year's usage with stored invoices"""
+    from app.models import Tenant, LabResult, TenantUsage
+    from app.billing import materialize_month, current_month_start
+
+    tenant_ids = [f"lab{i:05d}" for i in range(tenants)]
+    this_month = current_month_start()
+    months = [date(this_month.year, m, 1) for m in range(1, this_month.month + 1)]
+    now = datetime.utcnow()
+    with app.app_context():
+        db.session.execute(Tenant.__table__.insert(), [
+            {"tenant_id": t, "company_name": f"Lab {i}", "subscription_tier": TIERS[i % 3], "created_at": now}
+            for i, t in enumerate(tenant_ids)
+        ])
+        db.session.execute(TenantUsage.__table__.insert(), [
+            {"tenant_id": t, "month": m, "results_processed": i * 7 + m.month, "api_calls": i * 31,
+             "storage_bytes": i * 10_000_000, "version": 1}
+            for i, t in enumerate(tenant_ids) for m in months
+        ])
+        rng = random.Random(1)
+        for start in range(0, results, SEED_CHUNK):
+            db.session.execute(LabResult.__table__.insert(), [
+                {"tenant_id": tenant_ids[n % tenants], "patient_id": f"P{rng.randrange(patients)}",
+                 "test_code": rng.choice(TEST_CODES), "test_data": {"value": round(rng.uniform(3, 12), 1)},
+                 "created_at": now}
+                for n in range(start, min(start + SEED_CHUNK, results))
+            ])
+        db.session.commit()
+        # Estado estable (cron mensual ya corrido): las facturas del año están materializadas.
+        # Sin esto los primeros requests concurrentes compiten por insertar la misma factura.
+        for month in months:
+            materialize_month(month, current_month=this_month)
+    return tenant_ids
+
+
+def scenarios(tenant_ids, headers, patients, month):
+    """name -> fn(client, rng) returning the response; each picks its own tenant/patient"""
+    upload_body = os.urandom(64 * 1024)
+
+    def create_result(client, rng):
+        tenant_id = rng.choice(tenant_ids)
+        body = {"patient_id": f"P{rng.randrange(patients)}", "test_code": rng.choice(TEST_CODES),
+                "test_data": {"value": round(rng.uniform(3, 12), 1)}}
+        return client.post("/api/v1/results", json=body, headers=headers[tenant_id]), 201
+
+    def get_results(client, rng):
+        tenant_id = rng.choice(tenant_ids)
+        return client.get(f"/api/v1/results/P{rng.randrange(patients)}", headers=headers[tenant_id]), 200
+
+    def tenant_billing(client, rng):
+        return client.get("/api/v1/admin/billing", headers=headers[rng.choice(tenant_ids)]), 200
+
+    def admin_invoices(client, rng):
+        return client.get(f"/admin/billing/invoices?month={month:%Y-%m}"), 200
+
+    def upload(client, rng):
+        tenant_id = rng.choice(tenant_ids)
+        return client.post("/api/v1/upload", data=upload_body, content_type="application/octet-stream",
+                           headers=dict(headers[tenant_id], **{"X-File-Name": "report.pdf"})), 201
+
+    return {
+        "create_result": create_result,
+        "get_results": get_results,
+        "tenant_billing": tenant_billing,
+        "admin_invoices": admin_invoices,
+        "upload": upload,
+    }
+
+
+def run_scenario(app, fn, requests, concurrency, warmup, seed_value):
+    """Run `requests` calls of fn over `concurrency` threads; returns the summary dict"""
+    for i in range(warmup):
+        fn(app.test_client(), random.Random(seed_value - i - 1))
+
+    latencies, errors, lock = [], [], threading.Lock()
+    per_thread = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(index, count):
+        client = app.test_client()
+        rng = random.Random(seed_value + index)
+        mine, failed = [], []
+        barrier.wait()
+        for _ in range(count):
+            start = time.perf_counter()
+            response, expected = fn(client, rng)
+            mine.append(time.perf_counter() - start)
+            if response.status_code != expected:
+                failed.append(response.status_code)
+        with lock:
+            latencies.extend(mine)
+            errors.extend(failed)
+
+    threads = [threading.Thread(target=worker, args=(i, n)) for i, n in enumerate(per_thread)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    summary = summarize(latencies, len(errors), time.perf_counter() - start)
+    if errors:
+        summary["error_statuses"] = sorted(set(errors))
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(current, baseline, max_regression):
+    """Print the change against a previous run; returns the scenarios that regressed"""
+    regressed = []
+    print(f"\ncompared with {baseline['meta'].get('commit') or 'baseline'}:")
+    for name, now in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if not before:
+            continue
+        p95_delta = (now["latency_ms"]["p95"] / before["latency_ms"]["p95"] - 1) * 100
+        rps_delta = (now["throughput_rps"] / before["throughput_rps"] - 1) * 100
+        print(f"  {name:<16} p95 {before['latency_ms']['p95']:>8.2f} -> {now['latency_ms']['p95']:>8.2f} ms "
+              f"({p95_delta:+6.1f}%)   rps {before['throughput_rps']:>8.1f} -> {now['throughput_rps']:>8.1f} "
+              f"({rps_delta:+6.1f}%)")
+        if max_regression is not None and (p95_delta > max_regression or -rps_delta > max_regression):
+            regressed.append(name)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=100)
+    parser.add_argument("--results", type=int, default=50000)
+    parser.add_argument("--patients", type=int, default=500, help="distinct patient ids per run")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--scenarios", default="create_result,get_results,tenant_billing,admin_invoices",
+                        help="comma separated; also available: upload")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url")
+    parser.add_argument("--output", help="write the run as JSON")
+    parser.add_argument("--compare", help="JSON of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, help="exit 1 if p95 or throughput worsen more than this %%")
+    args = parser.parse_args()
+
+    url = configure_environment(args.database_url)
+    from app import app, db, s3client
+    from app.billing import current_month_start
+    from app.usage import usage_aggregator
+    from app.tests.helpers import FakeS3
+
+    logging_level = os.getenv("LOADTEST_LOG_LEVEL", "WARNING")
+    import logging
+    logging.getLogger().setLevel(logging_level)
+
+    reset_database(app, db)
+    started = time.perf_counter()
+    tenant_ids = seed(app, db, args.tenants, args.results, args.patients)
+    seed_time = time.perf_counter() - started
+    make_headers = install_local_auth()
+    headers = {tenant_id: make_headers(tenant_id) for tenant_id in tenant_ids}
+    available = scenarios(tenant_ids, headers, args.patients, current_month_start())
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in available]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    dialect = url.split(":", 1)[0]
+    print(f"database: {url.split('@')[-1]}  tenants: {args.tenants}  results: {args.results}  "
+          f"seeded in {seed_time:.1f}s")
+    print(f"requests per scenario: {args.requests}  concurrency: {args.concurrency}  seed: {args.seed}\n")
+    print(f"  {'scenario':<16} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7}")
+
+    run = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": dialect,
+            "params": {k: getattr(args, k) for k in ("tenants", "results", "patients", "requests",
+                                                     "concurrency", "warmup", "seed")},
+        },
+        "scenarios": {}
+    }
+    # S3 en memoria: ningún escenario sale a AWS
+    with mock.patch.object(s3client, "s3", FakeS3()):
+        for name in selected:
+            summary = run_scenario(app, available[name], args.requests, args.concurrency, args.warmup, args.seed)
+            usage_aggregator.flush()
+            run["scenarios"][name] = summary
+            lat = summary["latency_ms"]
+            print(f"  {name:<16} {summary['throughput_rps']:>9,.1f} {lat['p50']:>9.2f} {lat['p95']:>9.2f} "
+                  f"{lat['p99']:>9.2f} {lat['max']:>9.2f} {summary['errors']:>7}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"\nwrote {args.output}")
+
+    status = 1 if any(s["errors"] for s in run["scenarios"].values()) else 0
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(run, json.load(f), args.max_regression)
+        if regressed:
+            print(f"regression over {args.max_regression}%: {', '.join(regressed)}")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+import os
+
+# Se ejecuta antes de importar el paquete app (app/tests vive dentro de app)
+# SQLite en memoria para los tests
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+# Los tests hacen flush explícito de los contadores de uso
+os.environ.setdefault("USAGE_FLUSH_INTERVAL", "3600")
+# Los tests ejecutan los jobs de aprovisionamiento con run_pending()
+os.environ.setdefault("PROVISIONING_WORKERS", "0")
+# Caché de respuestas desactivada; sus tests la activan con un MemoryBackend propio
+os.environ.setdefault("RESPONSE_CACHE_BACKEND", "none")
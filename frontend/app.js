@@ -569,18 +569,18 @@ async function uploadFile() {
     }
 
     try {
-        const formData = new FormData();
-        formData.append('file', file);
-        
         const idToken = currentSession?.getIdToken()?.getJwtToken();
         
+        // Cuerpo crudo: el servidor lo sube a S3 por partes sin cargarlo en memoria
         const response = await fetch(`${API_URL}/api/v1/upload`, {
             method: 'POST',
             headers: {
                 'X-Tenant-Id': currentTenant,
-                'Authorization': `Bearer ${idToken}`
+                'Authorization': `Bearer ${idToken}`,
+                'Content-Type': file.type || 'application/octet-stream',
+                'X-File-Name': encodeURIComponent(file.name)
             },
-            body: formData
+            body: file
         });
         
         if (!response.ok) {
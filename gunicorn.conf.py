@@ -0,0 +1,9 @@
+# gunicorn.conf.py - gunicorn lo lee del directorio de trabajo (WorkingDirectory=/opt/labcloud)
+# Los hilos de fondo arrancan aquí, por worker, y no al importar app (flask db, cron, tests)
+
+def post_worker_init(worker):
+    from app.auth import init_key_store
+    from app.provisioning_jobs import provisioning_queue
+    # JWKS cargado antes del primer request del worker
+    init_key_store()
+    provisioning_queue.start()
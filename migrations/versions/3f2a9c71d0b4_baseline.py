@@ -0,0 +1,31 @@
+"""baseline: schema created by db.create_all()
+
+Empty on purpose. Databases are created with db.create_all() (README, Step 8), which
+builds every table from the models but leaves nothing for Alembic to start from. Stamp
+them with this revision once, then upgrade:
+
+    flask db stamp 3f2a9c71d0b4
+    flask db upgrade
+
+Revision ID: 3f2a9c71d0b4
+Revises:
+Create Date: 2026-10-17 00:20:02.113904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c71d0b4'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    pass
+
+
+def downgrade():
+    pass
@@ -0,0 +1,35 @@
+"""add tenant_usage.version
+
+The usage upsert bumps tenant_usage.version on every flush and the invoice store
+compares it; db.create_all() does not add columns to an existing table.
+
+Revision ID: 5b7e0c2d9a41
+Revises: 981228c0cf3a
+Create Date: 2026-10-17 09:12:41.502118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e0c2d9a41'
+down_revision = '981228c0cf3a'
+branch_labels = None
+depends_on = None
+
+
+def _has_version(bind):
+    return "version" in {column["name"] for column in sa.inspect(bind).get_columns("tenant_usage")}
+
+
+def upgrade():
+    # Las bases creadas con db.create_all() después de user-009 ya tienen la columna
+    if _has_version(op.get_bind()):
+        return
+    op.add_column("tenant_usage", sa.Column("version", sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade():
+    if _has_version(op.get_bind()):
+        op.drop_column("tenant_usage", "version")
@@ -0,0 +1,140 @@
+"""partition lab_results by month
+
+Converts lab_results into a table partitioned by RANGE (created_at), one partition
+per month plus a DEFAULT partition, with local tenant-leading indexes. Only
+PostgreSQL is partitioned; on SQLite (development/tests) this is a no-op.
+
+Existing rows are copied inside the migration's transaction while lab_results is
+locked: schedule it in a maintenance window sized to the table. The lock is taken with
+a lock_timeout, so a long-running transaction makes the migration fail instead of
+queueing every query on lab_results behind it.
+
+Revision ID: 981228c0cf3a
+Revises: 3f2a9c71d0b4
+Create Date: 2026-10-17 00:23:20.238243
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import date
+
+
+# revision identifiers, used by Alembic.
+revision = '981228c0cf3a'
+down_revision = '3f2a9c71d0b4'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+LOCK_TIMEOUT = "30s"
+
+# Locales a cada partición; todos empiezan por tenant_id
+INDEXES = (
+    "CREATE INDEX ix_lab_results_tenant_patient_created ON lab_results (tenant_id, patient_id, created_at, id)",
+    "CREATE INDEX ix_lab_results_tenant_created ON lab_results (tenant_id, created_at, id)",
+    "CREATE INDEX ix_lab_results_tenant_test_created ON lab_results (tenant_id, test_code, created_at, id)",
+    "CREATE INDEX ix_lab_results_test_data ON lab_results USING gin (test_data jsonb_path_ops)",
+)
+INDEX_NAMES = ("ix_lab_results_tenant_id", "ix_lab_results_tenant_patient_created", "ix_lab_results_tenant_created",
+               "ix_lab_results_tenant_test_created", "ix_lab_results_test_data")
+
+
+def _add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _is_partitioned(bind):
+    return bind.execute(sa.text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'lab_results' AND pg_table_is_visible(c.oid)"
+    )).first() is not None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or _is_partitioned(bind):
+        return
+
+    op.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+    op.execute("LOCK TABLE lab_results IN ACCESS EXCLUSIVE MODE")
+    # Una FK hacia una tabla particionada debe incluir created_at; result_analytes se limpia al archivar
+    op.execute("ALTER TABLE IF EXISTS result_analytes DROP CONSTRAINT IF EXISTS result_analytes_result_id_fkey")
+    op.execute("ALTER TABLE lab_results RENAME TO lab_results_unpartitioned")
+    op.execute("ALTER TABLE lab_results_unpartitioned RENAME CONSTRAINT lab_results_pkey TO lab_results_unpartitioned_pkey")
+    for name in INDEX_NAMES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+
+    sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence('lab_results_unpartitioned', 'id')")).scalar()
+    if sequence is None:
+        sequence = "lab_results_id_seq"
+        op.execute(f"CREATE SEQUENCE IF NOT EXISTS {sequence}")
+        op.execute(f"SELECT setval('{sequence}', COALESCE((SELECT max(id) FROM lab_results_unpartitioned), 0) + 1, false)")
+
+    op.execute(f"""
+        CREATE TABLE lab_results (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+            tenant_id VARCHAR(64) NOT NULL,
+            patient_id VARCHAR(128) NOT NULL,
+            test_code VARCHAR(50),
+            test_data JSONB,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+
+    oldest = bind.execute(sa.text("SELECT min(created_at) FROM lab_results_unpartitioned")).scalar()
+    current = date.today().replace(day=1)
+    month = date(oldest.year, oldest.month, 1) if oldest else current
+    last = _add_months(current, MONTHS_AHEAD)
+    while month <= last:
+        following = _add_months(month, 1)
+        op.execute(f"CREATE TABLE lab_results_y{month:%Y}m{month:%m} PARTITION OF lab_results "
+                   f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')")
+        month = following
+    # Red de seguridad: filas fuera de los meses creados (el mantenimiento la mantiene vacía)
+    op.execute("CREATE TABLE lab_results_default PARTITION OF lab_results DEFAULT")
+
+    op.execute("""
+        INSERT INTO lab_results (id, tenant_id, patient_id, test_code, test_data, created_at)
+        SELECT id, tenant_id, patient_id, test_code, test_data::jsonb,
+               COALESCE(created_at, now() AT TIME ZONE 'utc')
+        FROM lab_results_unpartitioned
+    """)
+    for statement in INDEXES:
+        op.execute(statement)
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY lab_results.id")
+    op.execute("DROP TABLE lab_results_unpartitioned")
+    op.execute("ANALYZE lab_results")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or not _is_partitioned(bind):
+        return
+
+    # Vuelve a la tabla que crea db.create_all() con los modelos actuales (sin FK de result_analytes)
+    op.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+    op.execute("LOCK TABLE lab_results IN ACCESS EXCLUSIVE MODE")
+    sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence('lab_results', 'id')")).scalar()
+    op.execute("ALTER TABLE lab_results RENAME TO lab_results_partitioned")
+    for name in INDEX_NAMES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    op.execute(f"""
+        CREATE TABLE lab_results (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+            tenant_id VARCHAR(64) NOT NULL,
+            patient_id VARCHAR(128) NOT NULL,
+            test_code VARCHAR(50),
+            test_data JSONB,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            CONSTRAINT lab_results_plain_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("INSERT INTO lab_results SELECT id, tenant_id, patient_id, test_code, test_data, created_at "
+               "FROM lab_results_partitioned")
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY lab_results.id")
+    op.execute("DROP TABLE lab_results_partitioned")
+    op.execute("ALTER TABLE lab_results RENAME CONSTRAINT lab_results_plain_pkey TO lab_results_pkey")
+    for statement in INDEXES:
+        op.execute(statement)